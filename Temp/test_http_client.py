@@ -1,12 +1,34 @@
 # File: test_http_client.py
+import sys
+from pathlib import Path
 import requests
 import json
 
+sys.path.append(str(Path(__file__).parent.parent))
+import http_msgpack
+
 class PayUFinanceHTTPClient:
     """Client for testing PayU Finance HTTP API"""
     
-    def __init__(self, base_url="http://localhost:5000"):
+    def __init__(self, base_url="http://localhost:5000", prefer_msgpack=False):
         self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers["Accept"] = http_msgpack.accept_header(prefer_msgpack)
+        # (endpoint, payload) -> (ETag, body) for conditional repeat lookups
+        self._etag_cache = {}
+    
+    def _post(self, endpoint, payload):
+        """POST with If-None-Match for a payload seen before; a 304 reuses the cached body"""
+        key = (endpoint, json.dumps(payload, sort_keys=True))
+        cached = self._etag_cache.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        response = self.session.post(f"{self.base_url}{endpoint}", json=payload, headers=headers)
+        if response.status_code == 304 and cached:
+            return cached[1]
+        body = http_msgpack.decode_response(response)
+        if response.status_code == 200 and response.headers.get("ETag"):
+            self._etag_cache[key] = (response.headers["ETag"], body)
+        return body
     
     def health_check(self):
         """Check if server is healthy"""
@@ -20,43 +42,27 @@ class PayUFinanceHTTPClient:
     
     def search_users(self, search_term):
         """Search for users"""
-        response = requests.post(
-            f"{self.base_url}/api/tools/search_users",
-            json={"search_term": search_term}
-        )
-        return response.json()
+        return self._post("/api/tools/search_users", {"search_term": search_term})
     
     def get_user_details(self, user_id):
         """Get user details"""
-        response = requests.post(
-            f"{self.base_url}/api/tools/get_user_details",
-            json={"user_id": user_id}
-        )
-        return response.json()
+        return self._post("/api/tools/get_user_details", {"user_id": user_id})
     
     def get_user_kyc_info(self, user_id):
         """Get user KYC information"""
-        response = requests.post(
-            f"{self.base_url}/api/tools/get_user_kyc_info",
-            json={"user_id": user_id}
-        )
-        return response.json()
+        return self._post("/api/tools/get_user_kyc_info", {"user_id": user_id})
     
     def get_user_aml_status(self, user_id):
         """Get user AML status"""
-        response = requests.post(
-            f"{self.base_url}/api/tools/get_user_aml_status",
-            json={"user_id": user_id}
-        )
-        return response.json()
+        return self._post("/api/tools/get_user_aml_status", {"user_id": user_id})
     
     def get_user_address(self, user_id):
         """Get user address"""
-        response = requests.post(
-            f"{self.base_url}/api/tools/get_user_address",
-            json={"user_id": user_id}
-        )
-        return response.json()
+        return self._post("/api/tools/get_user_address", {"user_id": user_id})
+    
+    def batch(self, invocations):
+        """Run several tool calls in one request: [{"id", "tool", "parameters", "depends_on"}]"""
+        return self._post("/api/tools/batch", {"invocations": invocations})
 
 def main():
     """Test the HTTP API"""
@@ -0,0 +1,254 @@
+# File: admission.py - Admission control and load shedding for the tool routes
+"""
+Without a limit, a burst sends every server thread to the engine pool
+(pool_size + max_overflow connections); the rest wait up to pool_timeout
+(30 s) and the server stops answering, /health included. Tool requests
+now pass through an admission controller first:
+
+  * at most max_concurrent requests hold a slot; by default the pool's
+    capacity, so an admitted request never waits on the pool;
+  * up to max_queue more wait, at most queue_timeout_seconds;
+  * interactive requests are admitted before bulk ones, and bulk
+    requests (/api/tools/batch, or any request sent with
+    X-Request-Priority: bulk) may hold at most bulk_max_concurrent slots,
+    so scripts and batches cannot starve the orchestrator and the UI;
+  * everything else is answered at once: 503 (server saturated) for
+    interactive requests, 429 (bulk share used up) for bulk ones, both
+    with Retry-After estimated from recent service times.
+
+A batch holds as many slots as calls it may run at once (its
+max_concurrency). /health, /metrics and the orchestrator route are not
+admitted: the orchestrator's own tool calls come back through the tool
+routes and are admitted there.
+
+Configured per connection in config/databases.yaml:
+
+    admission:
+      enable: true
+      max_concurrent: 15          # default: pooler.pool_size + pooler.max_overflow
+      bulk_max_concurrent: 8      # default: half of max_concurrent
+      max_queue: 30
+      queue_timeout_seconds: 2
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+INTERACTIVE, BULK = 'interactive', 'bulk'
+PRIORITY_HEADER = 'X-Request-Priority'
+
+
+def request_priority(path: str, header_value: Optional[str]) -> str:
+    if path == '/api/tools/batch' or (header_value or '').strip().lower() == BULK:
+        return BULK
+    return INTERACTIVE
+
+
+def admitted_path(path: str) -> bool:
+    return path.startswith('/api/tools/')
+
+
+class Rejected(Exception):
+    """Request shed without being run; status is 429 or 503"""
+
+    def __init__(self, status: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def body(self) -> Dict:
+        return {"success": False, "error": f"Server busy: {self.reason}", "retry_after": self.retry_after}
+
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(self.retry_after)}
+
+
+class _Waiter:
+    __slots__ = ('priority', 'weight', 'granted', 'signal')
+
+    def __init__(self, priority: str, weight: int, signal):
+        self.priority = priority
+        self.weight = weight
+        self.granted = False
+        self.signal = signal
+
+
+class Ticket:
+    """A held slot; give it back with release()"""
+    __slots__ = ('priority', 'weight', 'started')
+
+    def __init__(self, priority: str, weight: int):
+        self.priority = priority
+        self.weight = weight
+        self.started = time.perf_counter()
+
+
+class _AdmissionPolicy:
+    """Slot accounting and queue order; the subclasses add the blocking (threads or asyncio)"""
+
+    def __init__(self, max_concurrent: int, bulk_max_concurrent: int, max_queue: int, queue_timeout_seconds: float):
+        self.max_concurrent = max_concurrent
+        self.bulk_max_concurrent = min(bulk_max_concurrent, max_concurrent)
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.in_flight = 0
+        self.bulk_in_flight = 0
+        self.queues = {INTERACTIVE: deque(), BULK: deque()}
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        # Moving average of how long a slot is held, for Retry-After
+        self._service_seconds = 0.1
+
+    @classmethod
+    def from_config(cls, db_cfg):
+        cfg = db_cfg.get('admission') or {}
+        if not cfg.get('enable', False):
+            return None
+        pooler_cfg = db_cfg.get('pooler') or {}
+        max_concurrent = cfg.get('max_concurrent',
+                                 pooler_cfg.get('pool_size', 5) + pooler_cfg.get('max_overflow', 10))
+        return cls(
+            max_concurrent=max_concurrent,
+            bulk_max_concurrent=cfg.get('bulk_max_concurrent', max(1, max_concurrent // 2)),
+            max_queue=cfg.get('max_queue', 30),
+            queue_timeout_seconds=cfg.get('queue_timeout_seconds', 2),
+        )
+
+    def weight_for(self, priority: str, weight: int) -> int:
+        cap = self.bulk_max_concurrent if priority == BULK else self.max_concurrent
+        return max(1, min(weight, cap))
+
+    def _fits(self, priority: str, weight: int) -> bool:
+        if self.in_flight + weight > self.max_concurrent:
+            return False
+        return priority != BULK or self.bulk_in_flight + weight <= self.bulk_max_concurrent
+
+    def _take(self, priority: str, weight: int):
+        self.in_flight += weight
+        if priority == BULK:
+            self.bulk_in_flight += weight
+        self.admitted += 1
+
+    def _queued(self) -> int:
+        return len(self.queues[INTERACTIVE]) + len(self.queues[BULK])
+
+    def _try_admit(self, priority: str, weight: int) -> bool:
+        # Bulk requests do not overtake waiting interactive ones
+        ahead = self.queues[INTERACTIVE] if priority == INTERACTIVE else self._queued()
+        if not ahead and self._fits(priority, weight):
+            self._take(priority, weight)
+            return True
+        return False
+
+    def _grant_waiters(self):
+        """Hand freed slots to waiters, interactive first; returns the waiters to wake"""
+        woken = []
+        for priority in (INTERACTIVE, BULK):
+            queue = self.queues[priority]
+            while queue and self._fits(priority, queue[0].weight):
+                waiter = queue.popleft()
+                self._take(priority, waiter.weight)
+                waiter.granted = True
+                woken.append(waiter)
+            if queue and priority == INTERACTIVE:
+                # Interactive requests still waiting: bulk gets nothing this round
+                break
+        return woken
+
+    def _release(self, ticket: Ticket):
+        self.in_flight -= ticket.weight
+        if ticket.priority == BULK:
+            self.bulk_in_flight -= ticket.weight
+        held = time.perf_counter() - ticket.started
+        self._service_seconds = 0.9 * self._service_seconds + 0.1 * held
+        return self._grant_waiters()
+
+    def _reject(self, priority: str, reason: str) -> Rejected:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        # Time for the queue ahead to drain through the available slots
+        retry_after = math.ceil(self._service_seconds * (self._queued() + 1) / max(1, self.max_concurrent))
+        return Rejected(429 if priority == BULK else 503, reason, min(30, max(1, retry_after)))
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "bulk_in_flight": self.bulk_in_flight,
+            "queued_interactive": len(self.queues[INTERACTIVE]),
+            "queued_bulk": len(self.queues[BULK]),
+            "max_concurrent": self.max_concurrent,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+class AdmissionController(_AdmissionPolicy):
+    """For the threaded Flask server"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+
+    def acquire(self, priority: str = INTERACTIVE, weight: int = 1) -> Ticket:
+        """Slot for one request; raises Rejected when the server is saturated"""
+        weight = self.weight_for(priority, weight)
+        with self._lock:
+            if self._try_admit(priority, weight):
+                return Ticket(priority, weight)
+            if self._queued() >= self.max_queue:
+                raise self._reject(priority, 'queue_full')
+            waiter = _Waiter(priority, weight, threading.Event())
+            self.queues[priority].append(waiter)
+        waiter.signal.wait(self.queue_timeout_seconds)
+        with self._lock:
+            if waiter.granted:
+                return Ticket(priority, weight)
+            self.queues[priority].remove(waiter)
+            raise self._reject(priority, 'queue_timeout')
+
+    def release(self, ticket: Ticket):
+        with self._lock:
+            woken = self._release(ticket)
+        for waiter in woken:
+            waiter.signal.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return super().stats()
+
+
+class AsyncAdmissionController(_AdmissionPolicy):
+    """For the asyncio server; all calls come from the event loop, so no lock is needed"""
+
+    async def acquire(self, priority: str = INTERACTIVE, weight: int = 1) -> Ticket:
+        weight = self.weight_for(priority, weight)
+        if self._try_admit(priority, weight):
+            return Ticket(priority, weight)
+        if self._queued() >= self.max_queue:
+            raise self._reject(priority, 'queue_full')
+        waiter = _Waiter(priority, weight, asyncio.get_running_loop().create_future())
+        self.queues[priority].append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.signal), self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Client went away while queued: give back a slot granted in the meantime
+            if waiter.granted:
+                self.release(Ticket(priority, weight))
+            else:
+                self.queues[priority].remove(waiter)
+            raise
+        if waiter.granted:
+            return Ticket(priority, weight)
+        self.queues[priority].remove(waiter)
+        raise self._reject(priority, 'queue_timeout')
+
+    def release(self, ticket: Ticket):
+        for waiter in self._release(ticket):
+            if not waiter.signal.done():
+                waiter.signal.set_result(True)
@@ -2,25 +2,52 @@
 import json
 import requests
 import logging
-from typing import Dict, Any, List, Optional
+import time
+from typing import Callable, Dict, Any, List, Optional
 from llm_response_fixer import LLMResponseFixer
+import http_msgpack
+from tracing import CLIENT, traced, tracer
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ai-orchestrator-v2")
 
+# http: each step is a POST to the tool endpoint (own connection per step)
+# plan_session: the hosting server runs every step in-process on one connection
+#               inside a single read-only REPEATABLE READ transaction
+EXECUTION_MODES = ('http', 'plan_session')
+
+TOQAN_API_URL = "https://api.coco.prod.toqan.ai/api"
+CONVERSATION_POLL_SECONDS = 2
+# Give up on an LLM conversation that has not answered after this long
+CONVERSATION_TIMEOUT_SECONDS = 300
+
+# Progress events passed to on_event(event, data) while a query runs (streamed over SSE by the servers):
+#   status         {"phase", "message"}         before the LLM wait and before the tools
+#   plan           {"conversation_id", "reasoning", "tools"}
+#   step_started   {"step", "tool", "purpose", "parameters"}   parameters with references resolved
+#   step_finished  {"step", "tool", "purpose", "success", "elapsed_ms", "result" | "error"}
+# The final result is the return value; the servers send it as the last event ("final").
+ProgressCallback = Callable[[str, Dict[str, Any]], None]
+
+# Tool calls answered 429/503 with Retry-After (admission.py) are retried this often, waiting at most this long
+SHED_RETRIES = 2
+SHED_RETRY_MAX_SECONDS = 5
+
 class ConversationAPI:
     """Integrate your existing ConversationAPI"""
-    def __init__(self, api_key):
+    def __init__(self, api_key, timeout_seconds=CONVERSATION_TIMEOUT_SECONDS):
         self.headers = {
             "accept": "*/*",
             "content-type": "application/json",
             "X-Api-Key": api_key
         }
+        self.timeout_seconds = timeout_seconds
     
+    @traced('llm.create_conversation', CLIENT)
     def create_conversation(self, user_message):
-        url = "https://api.coco.prod.toqan.ai/api/create_conversation"
+        url = f"{TOQAN_API_URL}/create_conversation"
         payload = {"user_message": user_message}
         logger.info(f"Creating conversation with message: {self.headers}")
         response = requests.post(url, json=payload, headers=self.headers)
@@ -31,23 +58,35 @@ class ConversationAPI:
         logger.info(f"New conversation response: {response}")
         return conversation_id, response
     
+    @traced('llm.wait_for_response', CLIENT)
     def find_new_conversation_response(self, conversation_id):
-        url = "https://api.coco.prod.toqan.ai/api/find_conversation"
+        url = f"{TOQAN_API_URL}/find_conversation"
         payload = {"conversation_id": conversation_id}
-        import time
+        deadline = time.monotonic() + self.timeout_seconds
         while True:
             response = requests.post(url, json=payload, headers=self.headers)
             conversations = response.json()
             if len(conversations) > 1:
                 return conversations
-            time.sleep(2)
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"No LLM response for conversation {conversation_id} "
+                                   f"after {self.timeout_seconds} s")
+            time.sleep(CONVERSATION_POLL_SECONDS)
 
 class EnhancedAIOrchestrator:
     """Enhanced AI Orchestrator with multi-tool chaining and reasoning"""
     
-    def __init__(self, api_key: str, base_url: str = "http://127.0.0.1:5000"):
+    def __init__(self, api_key: str, base_url: str = "http://127.0.0.1:5000",
+                 plan_session_factory: Optional[Callable] = None, execution_mode: str = 'http'):
         self.conversation_api = ConversationAPI(api_key)
         self.base_url = base_url
+        # Context manager factory yielding run_tool(tool_name, parameters) -> same shape as _execute_single_tool
+        self.plan_session_factory = plan_session_factory
+        self.execution_mode = execution_mode
+        # Tool calls over HTTP ask for MessagePack when it is available (smaller, cheaper to decode)
+        self.prefer_msgpack = True
+        # Optional callable(phase, seconds) for prompt / llm / parse / tools / total timings
+        self.phase_observer = None
         self.tools_catalog = self._build_enhanced_tools_catalog()
         logger.info("Enhanced AI Orchestrator initialized with multi-tool support")
     
@@ -64,11 +103,17 @@ class EnhancedAIOrchestrator:
                         "description": "Search term to find users (phone number, email, name, or user ID)",
                         "required": True,
                         "examples": ["9845267602", "+919845267602", "john@example.com", "John Doe", "12345"]
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Only when a previous response had truncated: true; pass truncation.continuation.offset to get the next page",
+                        "required": False,
+                        "examples": [50]
                     }
                 },
                 "instructions": "Use this tool when you need to find a user before accessing their detailed information. Always search by the most specific identifier available (phone number or email preferred). The tool returns user IDs which are required for all other user-specific tools. If multiple users are found, choose the most relevant one based on context. Phone numbers should be provided as entered by the user (with or without country code).",
                 "endpoint": "/api/tools/search_users",
-                "returns": "List of users with id, name, phone, email, PAN, customer_id"
+                "returns": "List of users with id, name, phone, email, PAN, customer_id; search_narrowed is present when a broad name search was limited to prefix matches or capped"
             },
             "get_user_details": {
                 "display_name": "User Details",
@@ -80,6 +125,12 @@ class EnhancedAIOrchestrator:
                         "description": "Unique identifier of the user to fetch details for",
                         "required": True,
                         "examples": [32049152, 12345]
+                    },
+                    "fields": {
+                        "type": "array",
+                        "description": "Optional list of result fields to return. Pass only what the question needs; the server then queries only those columns",
+                        "required": False,
+                        "examples": [["full_name", "gender"]]
                     }
                 },
                 "instructions": "Use this tool after finding a user with search_users to get their complete profile. The user_id must be obtained from a previous search_users call. This tool is ideal when you need general user information or want to verify user identity. Use this before more specific tools like KYC or AML if you need to confirm you have the right user.",
@@ -96,11 +147,23 @@ class EnhancedAIOrchestrator:
                         "description": "Unique identifier of the user to fetch KYC information for",
                         "required": True,
                         "examples": [32049152, 12345]
+                    },
+                    "fields": {
+                        "type": "array",
+                        "description": "Optional list of result fields to return. Pass only what the question needs; the server then queries only those columns",
+                        "required": False,
+                        "examples": [["number", "status_text"]]
+                    },
+                    "pans_offset": {
+                        "type": "integer",
+                        "description": "Only when a previous response had truncated: true; pass truncation.continuation.pans_offset for older PAN records",
+                        "required": False,
+                        "examples": [20]
                     }
                 },
                 "instructions": "Use this tool when you need to verify a user's identity documents or check their KYC compliance status. The user_id must be obtained from search_users first. This tool is crucial for compliance-related queries, document verification, or when processing financial services that require KYC validation. Note that sensitive information like Aadhaar numbers may be masked for privacy.",
                 "endpoint": "/api/tools/get_user_kyc_info",
-                "returns": "PAN info, Aadhaar KYC, CKYC information and summary"
+                "returns": "PAN info, Aadhaar KYC, CKYC information and summary; KYC status (kyc_mode, kyc_is_valid, kyc_expiry_date, pan_status, aadhaar_status) when those fields are requested"
             },
             "get_user_aml_status": {
                 "display_name": "User AML Status",
@@ -112,6 +175,18 @@ class EnhancedAIOrchestrator:
                         "description": "Unique identifier of the user to fetch AML status for",
                         "required": True,
                         "examples": [32049152, 12345]
+                    },
+                    "fields": {
+                        "type": "array",
+                        "description": "Optional list of result fields to return. Pass only what the question needs; the server then queries only those columns",
+                        "required": False,
+                        "examples": [["aml_ishit", "alert_count"]]
+                    },
+                    "alerts_offset": {
+                        "type": "integer",
+                        "description": "Only when a previous response had truncated: true; pass truncation.continuation.alerts_offset for further alerts",
+                        "required": False,
+                        "examples": [50]
                     }
                 },
                 "instructions": "Use this tool for risk assessment, compliance checks, or when regulatory reporting requires AML status verification. The user_id must be obtained from search_users first. This tool is essential for high-risk transaction processing, account monitoring, or when compliance teams need to review a user's AML standing. Always use this tool for users involved in large transactions or when risk flags are raised.",
@@ -212,8 +287,28 @@ Now analyze the user query and respond with your reasoning and tool execution pl
 
         return master_prompt
     
-    def _execute_tool_sequence(self, tool_sequence: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _resolve_execution_mode(self, execution_mode: Optional[str] = None) -> str:
+        mode = execution_mode or self.execution_mode
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode: {mode} (expected one of {', '.join(EXECUTION_MODES)})")
+        if mode == 'plan_session' and self.plan_session_factory is None:
+            logger.warning("plan_session execution requested but no plan session factory is set; using http")
+            return 'http'
+        return mode
+    
+    def _execute_tool_sequence(self, tool_sequence: List[Dict[str, Any]], execution_mode: Optional[str] = None,
+                               on_event: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """Execute a sequence of tools over HTTP or within one plan-scoped database snapshot"""
+        if self._resolve_execution_mode(execution_mode) == 'plan_session':
+            with self.plan_session_factory() as run_tool:
+                return self._run_tool_sequence(tool_sequence, run_tool, on_event)
+        return self._run_tool_sequence(tool_sequence, self._execute_single_tool, on_event)
+    
+    def _run_tool_sequence(self, tool_sequence: List[Dict[str, Any]],
+                           execute_tool: Callable[[str, Dict[str, Any]], Dict[str, Any]],
+                           on_event: Optional[ProgressCallback] = None) -> Dict[str, Any]:
         """Execute a sequence of tools, passing data between them"""
+        emit = on_event or (lambda event, data: None)
         results = {}
         tool_results = []
         
@@ -326,7 +421,17 @@ Now analyze the user query and respond with your reasoning and tool execution pl
 
 
                 # Execute the tool
-                tool_result = self._execute_single_tool(tool_name, parameters)
+                emit('step_started', {"step": step_num, "tool": tool_name, "purpose": purpose, "parameters": parameters})
+                step_started = time.perf_counter()
+                with tracer.span(f"orchestrator.step {tool_name}", step=step_num):
+                    tool_result = execute_tool(tool_name, parameters)
+                step_event = {"step": step_num, "tool": tool_name, "purpose": purpose,
+                              "success": bool(tool_result.get('success')),
+                              "elapsed_ms": round((time.perf_counter() - step_started) * 1000, 3)}
+                if tool_result.get('success'):
+                    emit('step_finished', dict(step_event, result=tool_result.get('result', {})))
+                else:
+                    emit('step_finished', dict(step_event, error=tool_result.get('error')))
                 
                 if tool_result.get('success'):
                     # Save key results for next tools
@@ -403,11 +508,21 @@ Now analyze the user query and respond with your reasoning and tool execution pl
             
             logger.info(f"HTTP POST to {url} with parameters: {parameters}")
             
-            # Make HTTP POST request
-            response = requests.post(url, json=parameters, timeout=30)
+            # Make HTTP POST request; the traceparent header makes the route's spans part of this trace
+            with tracer.span(f"HTTP POST {endpoint}", CLIENT, **{"http.url": url}) as span:
+                headers = tracer.inject({"Accept": http_msgpack.accept_header(self.prefer_msgpack)})
+                response = requests.post(url, json=parameters, headers=headers, timeout=30)
+                # Shed by the server's admission control: wait as told and try again
+                for _ in range(SHED_RETRIES):
+                    if response.status_code not in (429, 503) or 'Retry-After' not in response.headers:
+                        break
+                    time.sleep(min(int(response.headers['Retry-After']), SHED_RETRY_MAX_SECONDS))
+                    response = requests.post(url, json=parameters, headers=headers, timeout=30)
+                if span is not None:
+                    span.set_attribute('http.status_code', response.status_code)
             
             if response.status_code == 200:
-                result = response.json()
+                result = http_msgpack.decode_response(response)
                 return {
                     "success": True,
                     "tool": tool_name,
@@ -417,7 +532,7 @@ Now analyze the user query and respond with your reasoning and tool execution pl
             else:
                 return {
                     "success": False,
-                    "error": f"HTTP {response.status_code}: {response.text}",
+                    "error": f"HTTP {response.status_code}: {http_msgpack.response_text(response)}",
                     "tool": tool_name,
                     "parameters": parameters
                 }
@@ -437,22 +552,32 @@ Now analyze the user query and respond with your reasoning and tool execution pl
                 "parameters": parameters
             }
     
-    def process_complex_query(self, user_query: str) -> Dict[str, Any]:
+    @traced('orchestrator.process_complex_query')
+    def process_complex_query(self, user_query: str, execution_mode: Optional[str] = None,
+                              on_event: Optional[ProgressCallback] = None) -> Dict[str, Any]:
         """Enhanced method to process complex queries with multi-tool chaining"""
+        emit = on_event or (lambda event, data: None)
+        started = phase_started = time.perf_counter()
         try:
+            execution_mode = self._resolve_execution_mode(execution_mode)
             logger.info(f"Processing complex query: {user_query}")
             
             # Step 1: Build enhanced master prompt
             master_prompt = self._build_enhanced_master_prompt(user_query)
             logger.info(f"Enhanced master prompt built")
+            phase_started = self._phase_done('prompt', phase_started)
 
             # Step 2: Send to LLM
             logger.info("Sending to Claude Sonnet 4...")
-            conversation_id, llm_response = self.conversation_api.create_conversation(master_prompt)
+            emit('status', {"phase": "llm", "message": "Waiting for the LLM plan"})
+            with tracer.span('orchestrator.llm'):
+                conversation_id, llm_response = self.conversation_api.create_conversation(master_prompt)
             logger.info(f"LLM response received for conversation: {conversation_id}")
+            phase_started = self._phase_done('llm', phase_started)
             
             # Step 3: Parse enhanced LLM response
             parsed_response = self._parse_enhanced_llm_response(llm_response)
+            phase_started = self._phase_done('parse', phase_started)
             if not parsed_response:
                 return {
                     "success": False,
@@ -462,26 +587,16 @@ Now analyze the user query and respond with your reasoning and tool execution pl
             
             logger.info(f"Parsed reasoning: {parsed_response.get('reasoning')}")
             logger.info(f"Tool sequence: {len(parsed_response.get('tools', []))} tools")
+            emit('plan', self._plan_event(conversation_id, parsed_response))
             
             # Step 4: Execute tool sequence
-            execution_result = self._execute_tool_sequence(parsed_response['tools'])
+            emit('status', {"phase": "tools", "message": f"Running {len(parsed_response['tools'])} tool steps"})
+            with tracer.span('orchestrator.tools', execution_mode=execution_mode):
+                execution_result = self._execute_tool_sequence(parsed_response['tools'], execution_mode, on_event)
+            self._phase_done('tools', phase_started)
             
             # Step 5: Build final response
-            final_result = {
-                "success": execution_result.get('success'),
-                "user_query": user_query,
-                "conversation_id": conversation_id,
-                "reasoning": parsed_response.get('reasoning'),
-                "planned_tools": parsed_response.get('tools'),
-                "executed_steps": execution_result.get('completed_steps', []),
-                "total_steps_completed": len(execution_result.get('completed_steps', [])),
-                "total_steps_planned": len(parsed_response.get('tools', []))
-            }
-            
-            if not execution_result.get('success'):
-                final_result["error"] = execution_result.get('error')
-            
-            return final_result
+            return self._build_final_result(user_query, conversation_id, execution_mode, parsed_response, execution_result)
             
         except Exception as e:
             logger.error(f"Error processing complex query: {e}")
@@ -490,6 +605,40 @@ Now analyze the user query and respond with your reasoning and tool execution pl
                 "error": f"Processing failed: {str(e)}",
                 "user_query": user_query
             }
+        finally:
+            self._phase_done('total', started)
+
+    def _phase_done(self, phase: str, started: float) -> float:
+        """Report a phase to phase_observer; returns now, the start of the next phase"""
+        now = time.perf_counter()
+        if self.phase_observer is not None:
+            self.phase_observer(phase, now - started)
+        return now
+
+    @staticmethod
+    def _plan_event(conversation_id: Any, parsed_response: Dict[str, Any]) -> Dict[str, Any]:
+        return {"conversation_id": conversation_id, "reasoning": parsed_response.get('reasoning'),
+                "tools": parsed_response.get('tools', [])}
+
+    def _build_final_result(self, user_query: str, conversation_id: Any, execution_mode: str,
+                            parsed_response: Dict[str, Any], execution_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Response body for a processed query"""
+        final_result = {
+            "success": execution_result.get('success'),
+            "user_query": user_query,
+            "conversation_id": conversation_id,
+            "execution_mode": execution_mode,
+            "reasoning": parsed_response.get('reasoning'),
+            "planned_tools": parsed_response.get('tools'),
+            "executed_steps": execution_result.get('completed_steps', []),
+            "total_steps_completed": len(execution_result.get('completed_steps', [])),
+            "total_steps_planned": len(parsed_response.get('tools', []))
+        }
+        
+        if not execution_result.get('success'):
+            final_result["error"] = execution_result.get('error')
+        
+        return final_result
 
     def _parse_enhanced_llm_response(self, llm_response: Any) -> Optional[Dict[str, Any]]:
         """Parse enhanced LLM response with reasoning and multiple tools - FIXED VERSION"""
@@ -0,0 +1,765 @@
+# File: async_http_server.py - asyncio variant of the PayU Finance HTTP Server
+"""
+Same API as http_server.py (/health, /livez, /readyz, /api/tools, /api/tools/*,
+/api/orchestrator/complex) on Starlette + uvicorn, for deployments that
+hold many slow requests open: a request waiting on the database or on the
+LLM is a suspended coroutine, not a blocked worker thread.
+
+  * database: AsyncPostgresConnector (asyncpg). The tool handlers in
+    tool_service.py are synchronous and run on the AsyncConnection through
+    run_sync, so both servers share one implementation.
+  * LLM: AsyncConversationAPI polls Toqan with httpx and asyncio.sleep.
+  * orchestrator plans: the step loop (variable resolution between steps)
+    is the orchestrator's own synchronous code and runs in a worker thread
+    only for the tool phase; each tool call hops back onto the event loop
+    and runs in-process, on a pooled connection per step ('http' mode) or
+    on one read-only snapshot for the whole plan ('plan_session' mode).
+
+Usage:
+    uvicorn --factory async_http_server:create_app --host 0.0.0.0 --port 5000 --workers 4
+
+Importing the module builds nothing; each worker calls create_app() once.
+
+The HTML pages (/ and /orchestrator) are only served by the Flask server.
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+import time
+import traceback
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from admission import PRIORITY_HEADER, AsyncAdmissionController, Rejected, admitted_path, request_priority
+from ai_orchestrator import (CONVERSATION_POLL_SECONDS, CONVERSATION_TIMEOUT_SECONDS, TOQAN_API_URL,
+                             EnhancedAIOrchestrator)
+from db.async_postgres_connector import AsyncPostgresConnector
+from db.base_connector import load_db_config
+from db.plan_session import ISOLATION_LEVELS
+from http_encoding import ResponseEncoding
+from orchestrator_jobs import AsyncJobManager, JobQueueFull
+from readiness import ReadinessState
+import http_msgpack
+import http_sse
+from http_json import json_encoder, json_encoder_from_config, json_loads
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics, add_serialize_time
+from tool_batch import ToolBatch, batch_limits
+from tool_service import TOOL_NAMES, ToolService, tool_listing
+from tracing import CLIENT, SERVER, traced_path, tracer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("payu-fin-http-async")
+
+
+class StepsCancelled(Exception):
+    """Raised inside the step loop's worker thread once its request was cancelled"""
+
+
+class JSONResponse(Response):
+    media_type = "application/json"
+    # Flask's legacy format until AsyncPayUFinanceServer installs the configured encoder (http_json.py)
+    encode = staticmethod(json_encoder('stdlib', 'http'))
+
+    def render(self, content):
+        return self.encode(content) + b"\n"
+
+
+async def _request_json(request):
+    """Request body through the same decoder as the Flask server; ValueError when it is not JSON"""
+    return json_loads(await request.body())
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so the endpoint runs in the same context as the request's timings"""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        token = self.metrics.start_request()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.metrics.finish_request(token, scope['path'], scope['method'], status)
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware: a server span per request, child of the caller's traceparent when sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not traced_path(scope['path']):
+            return await self.app(scope, receive, send)
+        headers = dict(scope['headers'])
+        traceparent = headers.get(b'traceparent', b'').decode('latin-1') or None
+        name = f"{scope['method']} {scope['path']}"
+        with tracer.span(name, SERVER, traceparent, **{"http.method": scope['method'], "http.route": scope['path']}) as span:
+            async def send_with_traceparent(message):
+                if span is not None and message['type'] == 'http.response.start':
+                    span.set_attribute('http.status_code', message['status'])
+                    message = dict(message, headers=list(message.get('headers', []))
+                                   + [(b'traceparent', span.traceparent.encode('latin-1'))])
+                await send(message)
+
+            await self.app(scope, receive, send_with_traceparent)
+
+
+class AdmissionMiddleware:
+    """Slot per tool request (admission.py); shed requests get 429/503 without reaching the endpoint"""
+
+    def __init__(self, app, server: "AsyncPayUFinanceServer"):
+        self.app = app
+        self.server = server
+
+    async def __call__(self, scope, receive, send):
+        admission = self.server.admission
+        if (admission is None or scope['type'] != 'http' or scope['method'] != 'POST'
+                or not admitted_path(scope['path'])):
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        priority = request_priority(scope['path'], request.headers.get(PRIORITY_HEADER))
+        # A batch runs up to max_concurrency calls at once, each on its own connection
+        weight = batch_limits(self.server.db_conns['pscore_postgres'])[1] if scope['path'] == '/api/tools/batch' else 1
+        try:
+            ticket = await admission.acquire(priority, weight)
+        except Rejected as e:
+            response = self.server._respond(request, e.body(), status_code=e.status)
+            response.headers.update(e.headers())
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(ticket)
+
+
+class AsyncConversationAPI:
+    """ConversationAPI over httpx: waiting for the LLM does not hold a thread"""
+
+    def __init__(self, api_key, client: httpx.AsyncClient, timeout_seconds=CONVERSATION_TIMEOUT_SECONDS):
+        self.headers = {
+            "accept": "*/*",
+            "content-type": "application/json",
+            "X-Api-Key": api_key
+        }
+        self.client = client
+        self.timeout_seconds = timeout_seconds
+
+    async def create_conversation(self, user_message):
+        with tracer.span('llm.create_conversation', CLIENT):
+            response = await self.client.post(f"{TOQAN_API_URL}/create_conversation",
+                                              json={"user_message": user_message}, headers=self.headers)
+        conversation_id = response.json()["conversation_id"]
+        logger.info(f"Conversation ID: {conversation_id}")
+        with tracer.span('llm.wait_for_response', CLIENT):
+            return conversation_id, await self.find_new_conversation_response(conversation_id)
+
+    async def find_new_conversation_response(self, conversation_id):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout_seconds
+        while True:
+            response = await self.client.post(f"{TOQAN_API_URL}/find_conversation",
+                                              json={"conversation_id": conversation_id}, headers=self.headers)
+            conversations = response.json()
+            if len(conversations) > 1:
+                return conversations
+            if loop.time() >= deadline:
+                raise TimeoutError(f"No LLM response for conversation {conversation_id} "
+                                   f"after {self.timeout_seconds} s")
+            await asyncio.sleep(CONVERSATION_POLL_SECONDS)
+
+
+class AsyncPayUFinanceServer:
+    """Starlette app sharing tool_service.py and the orchestrator's planning code with the Flask server"""
+
+    def __init__(self):
+        self.env, self.db_conns = load_db_config()
+        logger.info(f"✅ Database configuration loaded for environment: {self.env}")
+        tracer.configure(self.db_conns['pscore_postgres'].get('tracing'))
+        self.tools = ToolService(self.env, self.db_conns)
+        json_cfg = self.db_conns['pscore_postgres'].get('json_responses')
+        if json_cfg is not None:
+            JSONResponse.encode = staticmethod(json_encoder_from_config(json_cfg))
+        self.response_encoding = ResponseEncoding.from_config(self.db_conns['pscore_postgres'].get('response_encoding'))
+        self.admission = AsyncAdmissionController.from_config(self.db_conns['pscore_postgres'])
+        self.readiness = ReadinessState.from_config(self.db_conns['pscore_postgres'])
+        self.orchestrator = self._initialize_orchestrator()
+        self.conversation_api = None
+        self.http_client = None
+        self._connector = None
+        self._connector_lock = asyncio.Lock()
+        # Connectors replaced after a disconnect, closing once their connections are returned
+        self._retiring = set()
+        self.metrics = Metrics()
+        self.metrics.configure(self.db_conns['pscore_postgres'].get('metrics'), self._metrics_sources)
+        self._initialize_plan_sessions()
+        self.jobs = AsyncJobManager.from_config(self.db_conns['pscore_postgres'], self._run_job_query) \
+            if self.orchestrator else None
+        self.app = Starlette(
+            routes=[
+                Route('/livez', self.liveness),
+                Route('/readyz', self.readiness_check),
+                Route('/health', self.health_check),
+                Route('/metrics', self.metrics_endpoint),
+                Route('/api/traces', self.recent_traces),
+                Route('/api/traces/{trace_id}', self.get_trace),
+                Route('/api/tools', self.list_tools),
+                Route('/api/tools/batch', self.run_batch, methods=['POST']),
+                Route('/api/tools/{tool_name}', self.run_tool, methods=['POST']),
+                Route('/api/orchestrator/complex', self.process_complex_query, methods=['POST']),
+                Route('/api/orchestrator/stream', self.stream_complex_query, methods=['GET', 'POST']),
+                Route('/api/orchestrator/jobs', self.submit_orchestrator_job, methods=['POST']),
+                Route('/api/orchestrator/jobs/{job_id}', self.orchestrator_job, methods=['GET', 'DELETE']),
+            ],
+            middleware=[
+                Middleware(TracingMiddleware),
+                Middleware(MetricsMiddleware, metrics=self.metrics),
+                Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+                Middleware(AdmissionMiddleware, server=self),
+            ],
+            lifespan=self.lifespan,
+        )
+        logger.info("PayU Finance async HTTP Server initialized")
+
+    def _initialize_orchestrator(self):
+        """Only the orchestrator's prompt building, plan parsing and step loop are used here"""
+        try:
+            api_key = os.getenv('TOQAN_API_KEY')
+            if not api_key:
+                logger.error("❌ TOQAN_API_KEY is not set; AI Orchestrator disabled")
+                return None
+            self.api_key = api_key
+            orchestrator = EnhancedAIOrchestrator(api_key)
+            logger.info("✅ AI Orchestrator initialized successfully")
+            return orchestrator
+        except Exception as e:
+            logger.error(f"❌ Failed to initialize AI Orchestrator: {e}")
+            return None
+
+    def _initialize_plan_sessions(self):
+        plan_cfg = self.db_conns['pscore_postgres'].get('plan_session', {})
+        isolation_level = plan_cfg.get('isolation_level', 'REPEATABLE READ').upper()
+        if isolation_level not in ISOLATION_LEVELS:
+            raise ValueError(f"Unsupported isolation level for a plan snapshot: {isolation_level}")
+        self.plan_session_options = {
+            "isolation_level": isolation_level,
+            "postgresql_readonly": plan_cfg.get('read_only', True),
+            "postgresql_deferrable": plan_cfg.get('deferrable', False),
+        }
+        if self.orchestrator:
+            self.orchestrator.phase_observer = self.metrics.observe_phase
+            # Plans run in-process here, so plan sessions are always available
+            self.orchestrator.plan_session_factory = self.plan_session_execute
+            self.orchestrator.execution_mode = 'plan_session' if plan_cfg.get('enable', False) else 'http'
+            logger.info(f"✅ Orchestrator execution mode: {self.orchestrator.execution_mode}")
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, app):
+        self.http_client = httpx.AsyncClient(timeout=30)
+        self.conversation_api = AsyncConversationAPI(self.api_key, self.http_client) if self.orchestrator else None
+        interval = (self.db_conns['pscore_postgres'].get('readiness') or {}).get('interval_seconds', 5)
+        probe = asyncio.create_task(self._readiness_loop(interval))
+        try:
+            yield
+        finally:
+            self.readiness.draining = True
+            probe.cancel()
+            if self.jobs:
+                await self.jobs.shutdown()
+            await self.http_client.aclose()
+            self.tools.shutdown()
+            await self._close_connector()
+            self.metrics.shutdown()
+            tracer.shutdown()
+
+    async def _get_connector(self):
+        """Process-wide async connector, created on first use inside the worker's event loop"""
+        async with self._connector_lock:
+            if self._connector is None:
+                try:
+                    # The SSH tunnel starts synchronously; keep it off the event loop
+                    with tracer.span('db.connector.create'):
+                        self._connector = await asyncio.to_thread(
+                            AsyncPostgresConnector, self.db_conns['pscore_postgres'], self.env)
+                    self.metrics.attach_db_timer(self._connector.engine.sync_engine)
+                    tracer.attach_sql_tracing(self._connector.engine.sync_engine)
+                except Exception as e:
+                    logger.error(f"❌ Failed to create database connection: {e}")
+                    raise
+            return self._connector
+
+    async def _readiness_loop(self, interval_seconds):
+        """Background SELECT 1 on the shared pool; /readyz only reads the result"""
+        while True:
+            started = time.perf_counter()
+            try:
+                async with self._connection() as conn:
+                    await conn.execute(text('SELECT 1'))
+                self.readiness.record(True, (time.perf_counter() - started) * 1000)
+            except Exception as e:
+                logger.warning(f"⚠️ Readiness probe failed: {e}")
+                self.readiness.record(False, (time.perf_counter() - started) * 1000, str(e))
+            await asyncio.sleep(interval_seconds)
+
+    @contextlib.asynccontextmanager
+    async def _connection(self):
+        """Pooled connection of the shared connector; a disconnect replaces the connector"""
+        connector = await self._get_connector()
+        try:
+            async with connector.get_conn() as conn:
+                yield conn
+        except DBAPIError as e:
+            if connector.is_disconnect(e):
+                await self._discard_connector(connector)
+            raise
+
+    async def _discard_connector(self, connector):
+        """Replace the connector the disconnect came from; it closes once other requests are done with it"""
+        async with self._connector_lock:
+            if self._connector is not connector:
+                # Already replaced after an earlier failure
+                return
+            self._connector = None
+        logger.warning("⚠️ Database connection lost; reconnecting on the next request")
+        task = asyncio.create_task(connector.aretire())
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    async def _close_connector(self):
+        """Worker exit: close the shared connector now"""
+        async with self._connector_lock:
+            connector, self._connector = self._connector, None
+        if connector:
+            await connector.aclose()
+
+    async def liveness(self, request):
+        return JSONResponse({"status": "alive"})
+
+    async def readiness_check(self, request):
+        ready, body = self.readiness.status()
+        return JSONResponse(body, status_code=200 if ready else 503)
+
+    async def health_check(self, request):
+        try:
+            async with self._connection() as conn:
+                result = (await conn.execute(text('SELECT 1 as test'))).fetchone()
+                test_passed = result[0] == 1 if result else False
+            return JSONResponse({
+                "status": "healthy",
+                "service": "PayU Finance HTTP Server (async)",
+                "version": "2.0.0",
+                "database": "connected" if test_passed else "connection_failed",
+                "environment": self.env,
+                "ai_orchestrator": "enabled" if self.orchestrator else "disabled",
+                "endpoints": {
+                    "health": "/health",
+                    "liveness": "/livez",
+                    "readiness": "/readyz",
+                    "tools": "/api/tools",
+                    "batch": "/api/tools/batch",
+                    "metrics": "/metrics",
+                    "traces": "/api/traces",
+                    "orchestrator_api": "/api/orchestrator/complex",
+                    "orchestrator_stream": "/api/orchestrator/stream",
+                    "orchestrator_jobs": "/api/orchestrator/jobs"
+                }
+            })
+        except Exception as e:
+            logger.error(f"Health check failed: {e}")
+            return JSONResponse({
+                "status": "unhealthy",
+                "service": "PayU Finance HTTP Server (async)",
+                "database": "disconnected",
+                "error": str(e)
+            }, status_code=500)
+
+    def _metrics_sources(self):
+        """Scrape-time inputs of the metrics: pool, caches and admission of this worker"""
+        connector = self._connector
+        return {"engine": connector.engine if connector else None, "tools": self.tools,
+                "admission": self.admission}
+
+    async def metrics_endpoint(self, request):
+        body = self.metrics.render(**self._metrics_sources())
+        return Response(body, headers={'content-type': METRICS_CONTENT_TYPE})
+
+    async def recent_traces(self, request):
+        return JSONResponse({"enabled": tracer.enabled, "scope": "process", "traces": tracer.recent()})
+
+    async def get_trace(self, request):
+        trace_id = request.path_params['trace_id']
+        spans = tracer.trace(trace_id)
+        if spans is None:
+            return JSONResponse({"success": False, "scope": tracer.lookup_scope,
+                                 "error": f"Trace {trace_id} not found"}, status_code=404)
+        return JSONResponse({"success": True, "trace_id": trace_id, "scope": tracer.lookup_scope, "spans": spans})
+
+    async def list_tools(self, request):
+        return JSONResponse(tool_listing(self.orchestrator is not None))
+
+    def _respond(self, request, body, status_code=200):
+        """JSON, or MessagePack when the request's Accept header prefers it"""
+        started = time.perf_counter()
+        try:
+            if http_msgpack.wants_msgpack(request.headers.get('accept')):
+                return Response(http_msgpack.dumps(body), status_code=status_code,
+                                media_type=http_msgpack.MSGPACK_MEDIA_TYPE)
+            return JSONResponse(body, status_code=status_code)
+        finally:
+            add_serialize_time(time.perf_counter() - started)
+
+    def _tool_response(self, request, body, with_etag=True):
+        """200 tool response with the same compression/ETag/304 handling as the Flask server"""
+        response = self._respond(request, body)
+        if self.response_encoding is None:
+            return response
+        started = time.perf_counter()
+        not_modified, content, headers = self.response_encoding.prepare(
+            response.body,
+            request.headers.get('accept-encoding'),
+            request.headers.get('if-none-match'),
+            with_etag=with_etag,
+        )
+        add_serialize_time(time.perf_counter() - started)
+        if not_modified:
+            return Response(status_code=304, headers=headers)
+        return Response(content, media_type=response.media_type, headers=headers)
+
+    async def _run_tool(self, tool_name, data, use_cache=True):
+        """One tool on a pooled async connection; the sync handler runs via run_sync"""
+        async with self._connection() as conn:
+            return await conn.run_sync(lambda sync_conn: self.tools.run_tool(tool_name, sync_conn, data, use_cache))
+
+    async def run_tool(self, request):
+        tool_name = request.path_params['tool_name']
+        if tool_name not in TOOL_NAMES:
+            return self._respond(request, {"success": False, "error": f"Unknown tool: {tool_name}"}, status_code=404)
+        try:
+            data = await _request_json(request)
+            return self._tool_response(request, await self._run_tool(tool_name, data))
+        except ValueError as e:
+            # Also covers a body that is not valid JSON
+            return self._respond(request, {"success": False, "error": str(e)}, status_code=400)
+        except Exception as e:
+            logger.error(f"❌ Error in {tool_name}: {e}")
+            return self._respond(request, {
+                "success": False,
+                "error": str(e),
+                "traceback": traceback.format_exc()
+            }, status_code=500)
+
+    async def _batch_call(self, tool_name, parameters, semaphore):
+        """One call of a batch on its own pooled connection: (status, result, error)"""
+        async with semaphore:
+            try:
+                return 200, await self._run_tool(tool_name, parameters), None
+            except ValueError as e:
+                return 400, None, str(e)
+            except Exception as e:
+                logger.error(f"❌ Error in {tool_name} (batch): {e}")
+                return 500, None, str(e)
+
+    async def run_batch(self, request):
+        try:
+            max_invocations, max_concurrency = batch_limits(self.db_conns['pscore_postgres'])
+            batch = ToolBatch.from_request(await _request_json(request), max_invocations)
+        except ValueError as e:
+            return self._respond(request, {"success": False, "error": str(e)}, status_code=400)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        for wave in batch.waves:
+            calls = batch.prepare(wave)
+            outcomes = await asyncio.gather(*(self._batch_call(invocation.tool, parameters, semaphore)
+                                              for invocation, parameters in calls))
+            for (invocation, _), (status, result, error) in zip(calls, outcomes):
+                batch.record(invocation, status, result, error)
+        # Batch bodies carry timings, so they would never revalidate
+        return self._tool_response(request, batch.response(), with_etag=False)
+
+    def plan_session_execute(self):
+        """Marker factory: plans are executed by _execute_tool_sequence below, never by the orchestrator itself"""
+        raise RuntimeError("The async server executes plans itself")
+
+    async def _execute_tool_sequence(self, tool_sequence, execution_mode, on_event=None):
+        """Run the orchestrator's step loop with in-process tool calls (per step, or on one snapshot)"""
+        if execution_mode == 'plan_session':
+            connector = await self._get_connector()
+            async with connector.get_conn() as conn:
+                await conn.execution_options(**self.plan_session_options)
+                trans = await conn.begin()
+                try:
+                    async def run(tool_name, parameters):
+                        return await conn.run_sync(
+                            lambda sync_conn: self.tools.run_tool(tool_name, sync_conn, parameters, use_cache=False))
+                    return await self._run_steps(tool_sequence, run, on_event)
+                finally:
+                    # Nothing to commit on a read-only snapshot
+                    await trans.rollback()
+        return await self._run_steps(tool_sequence, self._run_tool, on_event)
+
+    async def _run_steps(self, tool_sequence, run, on_event=None):
+        """
+        The step loop in a worker thread. Cancelling the caller cannot stop that thread, so
+        it sets a flag the loop checks before every step and event, and then waits for the
+        thread: a plan_session connection is only rolled back and released once no step
+        can still be running on it.
+        """
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+
+        def check_cancelled():
+            if cancelled.is_set():
+                raise StepsCancelled("Orchestrator request cancelled")
+
+        def execute_tool(tool_name, parameters):
+            # Called from the worker thread: schedule the tool on the event loop and wait for it
+            check_cancelled()
+            try:
+                result = asyncio.run_coroutine_threadsafe(run(tool_name, parameters), loop).result()
+                return {"success": True, "tool": tool_name, "parameters": parameters, "result": result}
+            except Exception as e:
+                logger.error(f"❌ Error in {tool_name} (orchestrator step): {e}")
+                return {"success": False, "error": str(e), "tool": tool_name, "parameters": parameters}
+
+        def emit(event, data):
+            check_cancelled()
+            if on_event:
+                on_event(event, data)
+
+        steps = asyncio.ensure_future(
+            asyncio.to_thread(self.orchestrator._run_tool_sequence, tool_sequence, execute_tool, emit))
+        try:
+            return await asyncio.shield(steps)
+        except asyncio.CancelledError:
+            cancelled.set()
+            # The step in flight finishes on its connection; the loop stops before the next one
+            while not steps.done():
+                with contextlib.suppress(asyncio.CancelledError):
+                    await asyncio.shield(steps)
+            raise
+
+    async def _process_query(self, user_query, execution_mode=None, on_event=None):
+        """EnhancedAIOrchestrator.process_complex_query with the LLM wait and tool calls on the event loop"""
+        orchestrator = self.orchestrator
+        emit = on_event or (lambda event, data: None)
+        started = phase_started = time.perf_counter()
+        try:
+            execution_mode = orchestrator._resolve_execution_mode(execution_mode)
+            master_prompt = orchestrator._build_enhanced_master_prompt(user_query)
+            phase_started = orchestrator._phase_done('prompt', phase_started)
+            emit('status', {"phase": "llm", "message": "Waiting for the LLM plan"})
+            with tracer.span('orchestrator.llm'):
+                conversation_id, llm_response = await self.conversation_api.create_conversation(master_prompt)
+            logger.info(f"LLM response received for conversation: {conversation_id}")
+            phase_started = orchestrator._phase_done('llm', phase_started)
+
+            parsed_response = orchestrator._parse_enhanced_llm_response(llm_response)
+            phase_started = orchestrator._phase_done('parse', phase_started)
+            if not parsed_response:
+                return {
+                    "success": False,
+                    "error": "Failed to parse LLM response into valid tool sequence",
+                    "raw_response": str(llm_response)
+                }
+
+            emit('plan', orchestrator._plan_event(conversation_id, parsed_response))
+            emit('status', {"phase": "tools", "message": f"Running {len(parsed_response['tools'])} tool steps"})
+            with tracer.span('orchestrator.tools', execution_mode=execution_mode):
+                execution_result = await self._execute_tool_sequence(parsed_response['tools'], execution_mode,
+                                                                     on_event)
+            orchestrator._phase_done('tools', phase_started)
+            return orchestrator._build_final_result(user_query, conversation_id, execution_mode,
+                                                    parsed_response, execution_result)
+        except Exception as e:
+            logger.error(f"Error processing complex query: {e}")
+            return {
+                "success": False,
+                "error": f"Processing failed: {str(e)}",
+                "user_query": user_query
+            }
+        finally:
+            orchestrator._phase_done('total', started)
+
+    async def stream_complex_query(self, request):
+        """Same query as process_complex_query, answered with Server-Sent Events as it progresses"""
+        if not self.orchestrator:
+            return self._respond(request, {
+                "success": False,
+                "error": "AI Orchestrator not initialized. Check server logs for details."
+            }, status_code=503)
+        # POST body for fetch(), query string for EventSource
+        if request.method == 'POST':
+            try:
+                data = await _request_json(request)
+            except ValueError:
+                data = None
+            data = data if isinstance(data, dict) else {}
+        else:
+            data = request.query_params
+        query = data.get('query')
+        user_query = query.strip() if isinstance(query, str) else ''
+        if not user_query:
+            return self._respond(request, {
+                "success": False,
+                "error": "Missing 'query' field in request body",
+                "expected_format": {"query": "Your complex query here"}
+            }, status_code=400)
+        logger.info(f"🤖 Streaming orchestrator query: {user_query}")
+        return StreamingResponse(self._stream_query(user_query, data.get('execution_mode')),
+                                 media_type=http_sse.MEDIA_TYPE, headers=http_sse.HEADERS)
+
+    async def _stream_query(self, user_query, execution_mode):
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        def on_event(event, data):
+            # Step events come from the step loop's worker thread
+            loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+        async def run():
+            with tracer.span('orchestrator.process_complex_query'):
+                result = await self._process_query(user_query, execution_mode, on_event)
+            events.put_nowait(('final', result))
+
+        task = asyncio.create_task(run())
+        event_id = 0
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(events.get(), http_sse.KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield http_sse.KEEPALIVE
+                    continue
+                event_id += 1
+                yield http_sse.format_event(event, JSONResponse.encode(data), event_id)
+                if event == 'final':
+                    return
+        finally:
+            # Client went away: stop waiting on the LLM, or stop the step loop and wait for it
+            # to let go of its connection (_run_steps)
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def _run_job_query(self, user_query, execution_mode, on_event):
+        with tracer.span('orchestrator.process_complex_query'):
+            return await self._process_query(user_query, execution_mode, on_event)
+
+    async def submit_orchestrator_job(self, request):
+        """Queue a query as a background task; poll the returned job URL"""
+        if not self.jobs:
+            return self._respond(request, {
+                "success": False,
+                "error": "AI Orchestrator not initialized. Check server logs for details."
+            }, status_code=503)
+        try:
+            data = await _request_json(request)
+        except ValueError:
+            data = None
+        query = data.get('query') if isinstance(data, dict) else None
+        if not isinstance(query, str) or not query.strip():
+            return self._respond(request, {
+                "success": False,
+                "error": "Missing 'query' field in request body",
+                "expected_format": {"query": "Your complex query here"}
+            }, status_code=400)
+        try:
+            job = self.jobs.submit(query.strip(), data.get('execution_mode'))
+        except JobQueueFull as e:
+            response = self._respond(request, {"success": False, "error": str(e), "retry_after": e.retry_after},
+                                     status_code=503)
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        location = f"/api/orchestrator/jobs/{job['job_id']}"
+        logger.info(f"🤖 Queued orchestrator job {job['job_id']}: {job['query']}")
+        response = self._respond(request, dict(job, status_url=location), status_code=202)
+        response.headers['Location'] = location
+        return response
+
+    async def orchestrator_job(self, request):
+        """Job status and result (GET) or cancellation (DELETE)"""
+        job_id = request.path_params['job_id']
+        if not self.jobs:
+            job = None
+        elif request.method == 'DELETE':
+            job = self.jobs.cancel(job_id)
+        else:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return self._respond(request, {"success": False, "error": f"Job {job_id} not found (or expired)"},
+                                 status_code=404)
+        return self._respond(request, job)
+
+    async def process_complex_query(self, request):
+        data = None
+        try:
+            if not self.orchestrator:
+                return self._respond(request, {
+                    "success": False,
+                    "error": "AI Orchestrator not initialized. Check server logs for details."
+                }, status_code=503)
+
+            data = await _request_json(request)
+            if not data or 'query' not in data:
+                return self._respond(request, {
+                    "success": False,
+                    "error": "Missing 'query' field in request body",
+                    "expected_format": {"query": "Your complex query here"}
+                }, status_code=400)
+
+            user_query = data['query'].strip()
+            if not user_query:
+                return self._respond(request, {"success": False, "error": "Query cannot be empty"}, status_code=400)
+
+            logger.info(f"🤖 Processing orchestrator query: {user_query}")
+            with tracer.span('orchestrator.process_complex_query'):
+                result = await self._process_query(user_query, data.get('execution_mode'))
+
+            if result.get('success'):
+                logger.info(f"✅ Orchestrator query completed: {len(result.get('executed_steps', []))} steps")
+            else:
+                logger.error(f"❌ Orchestrator query failed: {result.get('error')}")
+            return self._respond(request, result)
+
+        except Exception as e:
+            logger.error(f"❌ Error in orchestrator endpoint: {e}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return self._respond(request, {
+                "success": False,
+                "error": f"Server error: {str(e)}",
+                "user_query": data.get('query', '') if isinstance(data, dict) else '',
+                "traceback": traceback.format_exc()
+            }, status_code=500)
+
+
+def create_app():
+    """App factory for `uvicorn --factory`; each worker process builds its own server"""
+    return AsyncPayUFinanceServer().app
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(create_app(), host=os.getenv('HOST', '127.0.0.1'), port=int(os.getenv('PORT', '5000')))
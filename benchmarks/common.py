@@ -0,0 +1,62 @@
+# File: benchmarks/common.py - Shared helpers for the benchmark scripts
+# Run benchmarks from the repository root, e.g. `python -m benchmarks.header_details`.
+
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from db.base_connector import load_db_config
+from db.postgres_connector import PostgresConnector
+
+
+def open_connector(connection_name: str = 'fixture_postgres') -> PostgresConnector:
+    """Connector for a named connection in config/databases.yaml"""
+    env, db_conns = load_db_config()
+    return PostgresConnector(db_conns[connection_name], environment=env)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def time_calls(fn: Callable[[], object], iterations: int = 50, warmup: int = 5) -> Dict[str, float]:
+    """Call fn repeatedly and return latency statistics in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "iterations": iterations,
+        "mean_ms": statistics.mean(samples),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": max(samples),
+    }
+
+
+def print_results(title: str, rows: List[Dict[str, object]]):
+    """Print benchmark rows as an aligned table"""
+    print(f"📊 {title}")
+    if not rows:
+        print("   (no results)")
+        return
+    columns = list(rows[0].keys())
+    widths = {col: max(len(col), *(len(_fmt(row.get(col))) for row in rows)) for col in columns}
+    print("   " + "  ".join(col.ljust(widths[col]) for col in columns))
+    for row in rows:
+        print("   " + "  ".join(_fmt(row.get(col)).ljust(widths[col]) for col in columns))
+    print()
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
@@ -0,0 +1,107 @@
+# File: benchmarks/header_details.py - Legacy DISTINCT/LEFT JOIN header query vs LATERAL lookups
+"""
+Compares the previous get_user_header_details query (plain LEFT JOINs +
+SELECT DISTINCT ... LIMIT 1) with the current LATERAL version for the users
+with the most child rows in users_amlresponsedata / users_pan / users_aadhaar.
+
+    python -m benchmarks.header_details --connection fixture_postgres --iterations 50
+"""
+
+import argparse
+
+from sqlalchemy import text
+
+from benchmarks.common import open_connector, print_results, time_calls
+from repository.user_repository import get_user_header_details
+
+LEGACY_HEADER_QUERY = """
+    SELECT DISTINCT
+        user_master.id AS user_id,
+        user_master.name AS full_name,
+        user_master.first_name AS first_name,
+        user_master.middle_name AS middle_name,
+        user_master.last_name AS last_name,
+        user_master.email_id AS email_address,
+        user_master.phone_id AS phone_id,
+        user_pan.number AS pan_number,
+        user_aadhaar.digits AS aadhaar_digits,
+        user_aadhaar.embedded_data->'photo'->>'document_image' AS document_image,
+        user_phone.phone AS phone_number,
+        user_phone.otp_verified_at AS otp_verification_time,
+        user_email.verified_at AS email_verified_at,
+        user_aadhaar.is_valid,
+        user_pan.is_valid,
+        users_aml.decision As aml_isHit
+    FROM users_masteruser user_master
+    LEFT JOIN users_pan user_pan
+        ON user_pan.master_user_id = user_master.id
+        AND user_pan.is_valid = true
+    LEFT JOIN users_masteruserextra user_extra
+        ON user_extra.master_user_id = user_master.id
+    LEFT JOIN users_aadhaar user_aadhaar
+        ON user_aadhaar.master_user_id = user_master.id
+        AND user_aadhaar.is_valid = true
+    LEFT JOIN users_phonenumber user_phone
+        ON user_phone.phone = user_master.phone_id
+    LEFT JOIN users_email user_email
+        ON user_email.email = user_master.email_id
+    LEFT JOIN users_amlresponsedata users_aml
+        ON users_aml.master_user_id = user_master.id
+    WHERE user_master.id = :user_id
+    LIMIT 1
+"""
+
+# Users whose auxiliary rows multiply the most under the legacy joins
+HEAVY_USERS_QUERY = """
+    SELECT master_user_id, count(*) AS child_rows
+    FROM (
+        SELECT master_user_id FROM users_amlresponsedata
+        UNION ALL
+        SELECT master_user_id FROM users_pan WHERE is_valid = true
+        UNION ALL
+        SELECT master_user_id FROM users_aadhaar WHERE is_valid = true
+    ) children
+    GROUP BY master_user_id
+    ORDER BY child_rows DESC
+    LIMIT :limit
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark get_user_header_details query shapes")
+    parser.add_argument('--connection', default='fixture_postgres')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--user-ids', type=int, nargs='*', help="Defaults to the users with most child rows")
+    parser.add_argument('--heavy-users', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    connector = open_connector(args.connection)
+    try:
+        with connector.get_conn() as conn:
+            if args.user_ids:
+                users = [(user_id, None) for user_id in args.user_ids]
+            else:
+                users = [tuple(row) for row in conn.execute(text(HEAVY_USERS_QUERY), {"limit": args.heavy_users})]
+
+            rows = []
+            for user_id, child_rows in users:
+                legacy = time_calls(
+                    lambda: conn.execute(text(LEGACY_HEADER_QUERY), {"user_id": user_id}).fetchone(),
+                    args.iterations,
+                )
+                lateral = time_calls(lambda: get_user_header_details(conn, user_id), args.iterations)
+                rows.append({
+                    "user_id": user_id,
+                    "child_rows": child_rows if child_rows is not None else "-",
+                    "legacy_p50": legacy["p50_ms"],
+                    "legacy_p95": legacy["p95_ms"],
+                    "lateral_p50": lateral["p50_ms"],
+                    "lateral_p95": lateral["p95_ms"],
+                })
+            print_results(f"get_user_header_details latency (ms, {args.iterations} iterations)", rows)
+    finally:
+        connector.close()
+
+
+if __name__ == '__main__':
+    main()
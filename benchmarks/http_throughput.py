@@ -0,0 +1,103 @@
+# File: benchmarks/http_throughput.py - Tool endpoint throughput of a running HTTP server
+"""
+Drives the tool endpoints of an already running server with concurrent
+clients and reports requests/second and latency percentiles. Run it once
+against the Flask development server and once against gunicorn:
+
+    python http_server.py                                   # dev server on :5000
+    python -m benchmarks.http_throughput --url http://127.0.0.1:5000 --label dev
+
+    gunicorn -c config/gunicorn.conf.py --bind 127.0.0.1:5001 wsgi:app
+    python -m benchmarks.http_throughput --url http://127.0.0.1:5001 --label gunicorn
+
+The default user is the fixture user from seed_fixture.py; point the server
+at the seeded fixture database or pass --user-id/--phone.
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.common import percentile, print_results
+from seed_fixture import FIXTURE_USER_ID, fixture_phone
+
+
+def tool_requests(user_id, phone):
+    return [
+        ('/api/tools/search_users', {"search_term": phone}),
+        ('/api/tools/get_user_details', {"user_id": user_id}),
+        ('/api/tools/get_user_kyc_info', {"user_id": user_id}),
+        ('/api/tools/get_user_aml_status', {"user_id": user_id}),
+        ('/api/tools/get_user_address', {"user_id": user_id}),
+    ]
+
+
+def run_load(base_url, calls, concurrency, duration_seconds):
+    """Each client loops over `calls` until the time is up; returns {endpoint: [latency ms]}, errors"""
+    latencies = {endpoint: [] for endpoint, _ in calls}
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration_seconds
+
+    def client(index):
+        session = requests.Session()
+        i = index
+        while time.perf_counter() < deadline:
+            endpoint, payload = calls[i % len(calls)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                response = session.post(base_url + endpoint, json=payload, timeout=60)
+                ok = response.status_code == 200
+            except requests.RequestException as e:
+                ok, response = False, e
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                if ok:
+                    latencies[endpoint].append(elapsed)
+                else:
+                    errors.append(f"{endpoint}: {getattr(response, 'status_code', response)}")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    return latencies, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tool endpoint throughput of a running server")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--label', default='server')
+    parser.add_argument('--user-id', type=int, default=FIXTURE_USER_ID)
+    parser.add_argument('--phone', default=fixture_phone(FIXTURE_USER_ID))
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds")
+    args = parser.parse_args(argv)
+
+    calls = tool_requests(args.user_id, args.phone)
+    latencies, errors = run_load(args.url.rstrip('/'), calls, args.concurrency, args.duration)
+
+    rows = []
+    for endpoint, samples in latencies.items():
+        rows.append({
+            "endpoint": endpoint,
+            "requests": len(samples),
+            "req_per_s": len(samples) / args.duration,
+            "p50_ms": percentile(samples, 50),
+            "p95_ms": percentile(samples, 95),
+            "p99_ms": percentile(samples, 99),
+        })
+    total = sum(len(samples) for samples in latencies.values())
+    rows.append({"endpoint": "TOTAL", "requests": total, "req_per_s": total / args.duration,
+                 "p50_ms": percentile([x for s in latencies.values() for x in s], 50),
+                 "p95_ms": percentile([x for s in latencies.values() for x in s], 95),
+                 "p99_ms": percentile([x for s in latencies.values() for x in s], 99)})
+    print_results(f"{args.label}: {args.concurrency} clients for {args.duration:.0f}s against {args.url}", rows)
+    if errors:
+        print(f"   ❌ {len(errors)} failed requests, e.g. {errors[:3]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+# File: benchmarks/json_encoding.py - Response serialisation cost per encoder
+"""
+Encodes realistic tool responses with Flask's default provider and with
+each json_encoder() configuration from http_json.py, and reports the time
+per response and the body size.
+
+Payloads are synthetic by default (a full search_users page, a user header,
+KYC with PAN history and an Aadhaar photo, AML with alerts). Each row has
+exactly the fields of the repository field lists (USER_SEARCH_FIELDS,
+HEADER_FIELDS, PAN_FIELDS, AML_FIELDS, ...) with the value types those
+columns return, and fixture identifiers from seed_fixture. With --user-id
+they are real tool responses from the given connection.
+
+    python -m benchmarks.json_encoding
+    python -m benchmarks.json_encoding --connection fixture_postgres --user-id 1000 --phone 5550001000
+"""
+
+import argparse
+import base64
+import datetime
+import os
+
+from flask import Flask
+
+from benchmarks.common import print_results, time_calls
+from http_json import json_encoder, orjson
+from repository.user_repository import (
+    AADHAAR_KYC_FIELDS,
+    AML_FIELDS,
+    CKYC_FIELDS,
+    HEADER_FIELDS,
+    PAN_FIELDS,
+    USER_SEARCH_FIELDS,
+)
+from repository.user_summary_repository import KYC_STATUS_FIELDS
+from seed_fixture import FIXTURE_NAME, FIXTURE_USER_ID, fixture_email, fixture_phone
+
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+JOINED = datetime.datetime(2021, 3, 1, 10, 15, 30, 123456, tzinfo=IST)
+BIRTH_DATE = datetime.date(1988, 5, 17)
+
+
+def _project(values, fields):
+    """A row with exactly the columns a repository function returns for these fields"""
+    return {field: values[field] for field in fields}
+
+
+def _search_row(user_id, photo):
+    first_name, last_name = FIXTURE_NAME.split()
+    return _project({
+        "id": user_id,
+        "customer_id": f"FXCUST{user_id:08d}",
+        "name": f"{FIXTURE_NAME} {user_id}",
+        "first_name": first_name,
+        "middle_name": None,
+        "last_name": last_name,
+        "gender": "M",
+        "date_of_birth": BIRTH_DATE,
+        "email_id": fixture_email(user_id),
+        "phone_id": f"+91{fixture_phone(user_id)}",
+        "pan_number": f"FXPAN{user_id % 10000:04d}F",
+        "nsdl_name": f"{FIXTURE_NAME.upper()} {user_id}",
+        "document_image": photo,
+    }, USER_SEARCH_FIELDS)
+
+
+def _header(user_id, photo):
+    first_name, last_name = FIXTURE_NAME.split()
+    return _project({
+        "user_id": user_id,
+        "full_name": f"{FIXTURE_NAME} {user_id}",
+        "first_name": first_name,
+        "middle_name": None,
+        "last_name": last_name,
+        "email_address": fixture_email(user_id),
+        "phone_id": f"+91{fixture_phone(user_id)}",
+        "pan_number": f"FXPAN{user_id % 10000:04d}F",
+        "aadhaar_digits": f"{user_id * 7 % 10000:04d}",
+        "document_image": photo,
+        "phone_number": f"+91{fixture_phone(user_id)}",
+        "otp_verification_time": JOINED,
+        "email_verified_at": JOINED,
+        "is_valid": True,
+        "aml_ishit": "Hit",
+    }, HEADER_FIELDS)
+
+
+def _pan(user_id, n, copies):
+    return _project({
+        "id": user_id * 100 + n,
+        "nsdl_valid": True,
+        "number": f"FXPAN{user_id % 10000:04d}F",
+        "date_of_birth": BIRTH_DATE,
+        "is_valid": n == copies,
+        "created_at": JOINED + datetime.timedelta(days=n),
+        "nsdl_name": f"{FIXTURE_NAME.upper()} {user_id}",
+        "status": 40 if n == copies else 100,
+        "status_text": "Approved" if n == copies else "Expired",
+        "gender": "M",
+    }, PAN_FIELDS)
+
+
+def synthetic_payloads():
+    """Tool response bodies built from the repository field lists, with the column types they return"""
+    user_id = FIXTURE_USER_ID
+    photo = base64.b64encode(os.urandom(48 * 1024)).decode('ascii')
+    users = [_search_row(user_id + i, photo) for i in range(50)]
+    pans = [_pan(user_id, n, 20) for n in range(20, 0, -1)]
+    aadhaar_kyc = _project({
+        "aadhaar_photo_b64": photo,
+        "aadhaar_masked": f"XXXX XXXX {user_id * 7 % 10000:04d}",
+        "aadhaar_status": "Approved",
+        "aadhaar_name": f"{FIXTURE_NAME} {user_id}",
+        "aadhaar_dob": BIRTH_DATE,
+        "aadhaar_gender": "M",
+        "aadhaar_date_verified": JOINED.strftime('%Y-%m-%dT%H:%M:%S'),
+        "aadhaar_careof": f"S/O Fixture Father {user_id}",
+        "aadhaar_address": f"{user_id} Fixture Street",
+    }, AADHAAR_KYC_FIELDS)
+    ckyc_info = _project({
+        "ckyc_number": f"FXCKYC{user_id:08d}",
+        "ckyc_masked_aadhaar": f"XXXX XXXX {user_id % 10000:04d}",
+        "ckyc_phone": f"+91{fixture_phone(user_id)}",
+        "ckyc_date_extracted": JOINED.strftime('%d-%m-%Y'),
+        "ckyc_father_name": f"FIXTURE FATHER {user_id}",
+        "ckyc_status": "Approved",
+        "ckyc_has_documents": True,
+    }, CKYC_FIELDS)
+    kyc_status = _project({
+        "kyc_mode": 3,
+        "kyc_is_valid": True,
+        "kyc_expiry_date": BIRTH_DATE.replace(year=2030),
+        "pan_status": "Approved",
+        "aadhaar_status": "Approved",
+    }, KYC_STATUS_FIELDS)
+    # The Alerts array is json selected straight from the screening response, so it decodes to dicts
+    alerts = [{"AlertId": f"FXAPP-{user_id}-1-{i}", "Score": i * 7 % 100, "WatchList": "FIXTURE"}
+              for i in range(1, 51)]
+    aml_details = _project({
+        "matched_status": "Yes",
+        "alert_count": str(len(alerts)),
+        "alerts": alerts,
+        "report_data": f"Fixture screening report FXAPP-{user_id}-1",
+        "aml_ishit": "Hit",
+    }, AML_FIELDS)
+    aml_details["alerts_total"] = len(alerts)
+    return {
+        "search_users (50 users)": {
+            "success": True, "search_term": fixture_phone(user_id), "total_found": len(users), "users": users,
+        },
+        "get_user_details (header)": {
+            "success": True, "user_id": user_id, "header_details": _header(user_id, photo), "additional_info": {},
+        },
+        "get_user_kyc_info (photo + 20 PANs)": {
+            "success": True, "user_id": user_id, "kyc_status": kyc_status, "pan_info": pans,
+            "aadhaar_kyc": aadhaar_kyc, "ckyc_info": ckyc_info,
+            "summary": {"pan_records": len(pans), "has_aadhaar_kyc": True, "has_ckyc": True},
+        },
+        "get_user_aml_status (50 alerts)": {
+            "success": True, "user_id": user_id, "aml_details": aml_details, "has_aml_data": True,
+        },
+    }
+
+
+def database_payloads(connection_name, user_id, phone):
+    from db.base_connector import load_db_config
+    from db.postgres_connector import PostgresConnector
+    from tool_service import ToolService
+
+    env, db_conns = load_db_config()
+    tools = ToolService(env, {'pscore_postgres': db_conns[connection_name]})
+    connector = PostgresConnector(db_conns[connection_name], environment=env)
+    try:
+        with connector.get_conn() as conn:
+            return {
+                "search_users": tools.run_tool('search_users', conn, {"search_term": phone}, use_cache=False),
+                "get_user_details": tools.run_tool('get_user_details', conn, {"user_id": user_id}, use_cache=False),
+                "get_user_kyc_info": tools.run_tool('get_user_kyc_info', conn, {"user_id": user_id}, use_cache=False),
+                "get_user_aml_status": tools.run_tool('get_user_aml_status', conn, {"user_id": user_id}, use_cache=False),
+            }
+    finally:
+        tools.shutdown()
+        connector.close()
+
+
+def encoders():
+    app = Flask(__name__)
+    flask_default = app.json
+    candidates = [
+        ("flask default (stdlib, http dates)", lambda obj: flask_default.dumps(obj).encode('utf-8')),
+        ("stdlib, iso dates", json_encoder('stdlib', 'iso')),
+    ]
+    if orjson is not None:
+        candidates += [
+            ("orjson, http dates", json_encoder('orjson', 'http')),
+            ("orjson, iso dates", json_encoder('orjson', 'iso')),
+        ]
+    return candidates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark JSON encoders on tool responses")
+    parser.add_argument('--connection', default='fixture_postgres')
+    parser.add_argument('--user-id', type=int, help="Encode real tool responses for this user")
+    parser.add_argument('--phone', default=fixture_phone(FIXTURE_USER_ID))
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    payloads = (database_payloads(args.connection, args.user_id, args.phone)
+                if args.user_id else synthetic_payloads())
+    if orjson is None:
+        print("⚠️  orjson is not installed; only the stdlib encoders are compared")
+
+    rows = []
+    for payload_name, payload in payloads.items():
+        baseline = None
+        for encoder_name, encode in encoders():
+            stats = time_calls(lambda: encode(payload), args.iterations)
+            baseline = baseline or stats["mean_ms"]
+            rows.append({
+                "payload": payload_name,
+                "encoder": encoder_name,
+                "bytes": len(encode(payload)),
+                "mean_ms": stats["mean_ms"],
+                "p95_ms": stats["p95_ms"],
+                "speedup": baseline / stats["mean_ms"] if stats["mean_ms"] else 0.0,
+            })
+    print_results(f"JSON encoding per response ({args.iterations} iterations)", rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+# File: benchmarks/load_test.py - Load generator built on PayUFinanceHTTPClient
+"""
+Replays a weighted mix of tool calls against a running server through the
+client in Temp/test_http_client.py, and reports latency percentiles,
+throughput, error and shed rates per call and overall:
+
+    python -m benchmarks.load_test --url http://127.0.0.1:5000 --concurrency 32 --duration 60
+    python -m benchmarks.load_test --rps 200 --concurrency 64 --mix search=4,details=2,kyc=1,aml=1,address=1
+
+Two modes:
+
+  * closed loop (default): --concurrency clients, each sends its next
+    call as soon as the previous one returns;
+  * open loop (--rps): calls are scheduled at a fixed rate and spread over
+    --concurrency clients; latency is measured from the scheduled time,
+    so waiting behind a slow call counts (no coordinated omission). Give
+    it enough clients for rps x latency.
+
+Calls are spread over --sample-users users (default 100) sampled from
+the fixture connection, which seed_fixture.py creates and fills with
+synthetic users; --user-id with --phone pins every call to one user
+instead. Point the server at the same fixture database.
+Each client keeps the ETag cache of PayUFinanceHTTPClient, so repeat
+lookups are conditional requests; --no-conditional sends every call in
+full. 429/503 answers (admission control) are counted as shed, not as
+errors. The first --warmup seconds are not measured.
+
+--save writes the results with the build (--label, git revision) to a JSON
+file; --compare prints the differences against such a file:
+
+    python -m benchmarks.load_test --label main --save logs/load_main.json
+    python -m benchmarks.load_test --label branch --compare logs/load_main.json
+"""
+
+import argparse
+import datetime
+import json
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import requests
+from sqlalchemy import text
+
+from benchmarks.common import open_connector, percentile, print_results
+from Temp.test_http_client import PayUFinanceHTTPClient
+
+# Mix name -> call on the client for one (user_id, phone)
+CALLS = {
+    'search': lambda client, user_id, phone: client.search_users(phone),
+    'details': lambda client, user_id, phone: client.get_user_details(user_id),
+    'kyc': lambda client, user_id, phone: client.get_user_kyc_info(user_id),
+    'aml': lambda client, user_id, phone: client.get_user_aml_status(user_id),
+    'address': lambda client, user_id, phone: client.get_user_address(user_id),
+}
+DEFAULT_MIX = 'search=4,details=2,kyc=1,aml=1,address=1'
+SHED_STATUSES = (429, 503)
+
+# Spread over the whole table (heavy users included), the same sample for the same --seed
+SAMPLE_USERS_QUERY = """
+    SELECT id, phone_id FROM users_masteruser
+    WHERE phone_id IS NOT NULL
+    ORDER BY md5(id::text || :seed)
+    LIMIT :limit
+"""
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """'search=4,details=2' -> {'search': 4, 'details': 2}"""
+    mix = {}
+    for item in spec.split(','):
+        name, _, weight = item.strip().partition('=')
+        if name not in CALLS:
+            raise argparse.ArgumentTypeError(f"Unknown call {name!r}; choose from {', '.join(CALLS)}")
+        try:
+            mix[name] = int(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Weight for {name!r} must be an integer")
+        if mix[name] < 0:
+            raise argparse.ArgumentTypeError(f"Weight for {name!r} must not be negative")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("The mix needs at least one call with a positive weight")
+    return {name: weight for name, weight in mix.items() if weight}
+
+
+def sample_users(connection_name: str, limit: int, seed: int = 0) -> List[Tuple[int, str]]:
+    connector = open_connector(connection_name)
+    try:
+        with connector.get_conn() as conn:
+            result = conn.execute(text(SAMPLE_USERS_QUERY), {"limit": limit, "seed": str(seed)})
+            return [(row[0], row[1]) for row in result]
+    finally:
+        connector.close()
+
+
+class _Samples:
+    """Outcomes of the measured calls, shared by the clients"""
+
+    def __init__(self, names):
+        self.latencies = {name: [] for name in names}
+        self.errors = {name: 0 for name in names}
+        self.shed = {name: 0 for name in names}
+        self.error_examples: List[str] = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, elapsed_ms: float, outcome: str, detail: str = None):
+        with self._lock:
+            if outcome == 'ok':
+                self.latencies[name].append(elapsed_ms)
+            elif outcome == 'shed':
+                self.shed[name] += 1
+            else:
+                self.errors[name] += 1
+                if len(self.error_examples) < 5:
+                    self.error_examples.append(f"{name}: {detail}")
+
+
+def _new_client(base_url: str, prefer_msgpack: bool):
+    """Client plus a function returning the status of its last response"""
+    client = PayUFinanceHTTPClient(base_url, prefer_msgpack=prefer_msgpack)
+    last = {}
+    client.session.hooks['response'].append(lambda response, *args, **kwargs: last.update(status=response.status_code))
+    return client, lambda: last.pop('status', None)
+
+
+def _call(client, last_status, name, user, conditional):
+    """('ok' | 'shed' | 'error', detail)"""
+    if not conditional:
+        client._etag_cache.clear()
+    try:
+        body = CALLS[name](client, *user)
+    except (requests.RequestException, ValueError) as e:
+        status = last_status()
+        if status in SHED_STATUSES:
+            return 'shed', status
+        return 'error', f"{status or type(e).__name__}: {e}"
+    status = last_status()
+    if status in SHED_STATUSES:
+        return 'shed', status
+    if status not in (200, 304):
+        return 'error', f"HTTP {status}: {str(body)[:200]}"
+    if isinstance(body, dict) and body.get('success') is False:
+        return 'error', f"tool error: {body.get('error')}"
+    return 'ok', None
+
+
+def run_load(base_url, mix, users, concurrency, duration_seconds, warmup_seconds=0.0, rps=None,
+             prefer_msgpack=False, conditional=True, seed=0) -> _Samples:
+    """Closed loop when rps is None, otherwise calls scheduled at rps over the clients"""
+    names, weights = list(mix), list(mix.values())
+    samples = _Samples(names)
+    started = time.perf_counter()
+    measure_from = started + warmup_seconds
+    deadline = measure_from + duration_seconds
+
+    def worker(index):
+        client, last_status = _new_client(base_url, prefer_msgpack)
+        rng = random.Random(seed + index)
+        k = index
+        while True:
+            if rps:
+                # Open loop: this client takes every concurrency-th slot of the schedule
+                scheduled = started + k / rps
+                k += concurrency
+                if scheduled >= deadline:
+                    return
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                scheduled = time.perf_counter()
+                if scheduled >= deadline:
+                    return
+            name = rng.choices(names, weights)[0]
+            outcome, detail = _call(client, last_status, name, rng.choice(users), conditional)
+            if scheduled >= measure_from:
+                samples.record(name, (time.perf_counter() - scheduled) * 1000, outcome, detail)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return samples
+
+
+def _row(name, latencies, errors, shed, duration_seconds):
+    total = len(latencies) + errors + shed
+    return {
+        "call": name,
+        "requests": total,
+        "req_per_s": len(latencies) / duration_seconds,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies) if latencies else 0.0,
+        "errors": errors,
+        "shed": shed,
+        "error_pct": 100.0 * errors / total if total else 0.0,
+    }
+
+
+def summarize(samples: _Samples, duration_seconds: float) -> List[Dict[str, object]]:
+    """One row per call and a TOTAL row; req_per_s counts successful calls"""
+    rows = [_row(name, samples.latencies[name], samples.errors[name], samples.shed[name], duration_seconds)
+            for name in samples.latencies]
+    rows.append(_row("TOTAL", [x for s in samples.latencies.values() for x in s],
+                     sum(samples.errors.values()), sum(samples.shed.values()), duration_seconds))
+    return rows
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict, rows: List[Dict[str, object]]) -> List[Dict[str, object]]:
+    """Per call: baseline and current p50/p95/p99 and throughput, change in percent"""
+    before = {row["call"]: row for row in baseline["results"]}
+
+    def change(old, new):
+        return f"{100.0 * (new - old) / old:+.1f}%" if old else "-"
+
+    diff = []
+    for row in rows:
+        old = before.get(row["call"])
+        if old is None:
+            continue
+        diff.append({
+            "call": row["call"],
+            "p50_ms": f"{old['p50_ms']:.2f} -> {row['p50_ms']:.2f} ({change(old['p50_ms'], row['p50_ms'])})",
+            "p95_ms": f"{old['p95_ms']:.2f} -> {row['p95_ms']:.2f} ({change(old['p95_ms'], row['p95_ms'])})",
+            "p99_ms": f"{old['p99_ms']:.2f} -> {row['p99_ms']:.2f} ({change(old['p99_ms'], row['p99_ms'])})",
+            "req_per_s": f"{old['req_per_s']:.1f} -> {row['req_per_s']:.1f} "
+                         f"({change(old['req_per_s'], row['req_per_s'])})",
+            "error_pct": f"{old['error_pct']:.2f} -> {row['error_pct']:.2f}",
+            "shed": f"{old['shed']} -> {row['shed']}",
+        })
+    return diff
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a mix of tool calls against a running server")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--label', default='server', help="Build or configuration name, saved with the results")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Weighted calls from {', '.join(CALLS)} (default {DEFAULT_MIX})")
+    parser.add_argument('--concurrency', type=int, default=32, help="Clients")
+    parser.add_argument('--rps', type=float, help="Target request rate (open loop); default: closed loop")
+    parser.add_argument('--duration', type=float, default=30.0, help="Measured seconds")
+    parser.add_argument('--warmup', type=float, default=5.0, help="Unmeasured seconds before the run")
+    parser.add_argument('--user-id', type=int, help="Send every call for this user (with --phone)")
+    parser.add_argument('--phone', help="Phone number of --user-id")
+    parser.add_argument('--sample-users', type=int, default=100, help="Spread calls over this many users from --connection")
+    parser.add_argument('--connection', default='fixture_postgres', help="Seeded by seed_fixture.py")
+    parser.add_argument('--msgpack', action='store_true', help="Ask for MessagePack responses")
+    parser.add_argument('--no-conditional', dest='conditional', action='store_false',
+                        help="Do not send If-None-Match for repeat lookups")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Results file from an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    if args.user_id is not None or args.phone is not None:
+        if args.user_id is None or args.phone is None:
+            parser.error("--user-id and --phone go together")
+        users = [(args.user_id, args.phone)]
+    else:
+        users = sample_users(args.connection, args.sample_users, args.seed)
+        if not users:
+            parser.error(f"No users with a phone number in {args.connection}; run seed_fixture.py first")
+
+    samples = run_load(args.url.rstrip('/'), args.mix, users, args.concurrency, args.duration,
+                       warmup_seconds=args.warmup, rps=args.rps, prefer_msgpack=args.msgpack,
+                       conditional=args.conditional, seed=args.seed)
+    rows = summarize(samples, args.duration)
+
+    mode = f"{args.rps:g} req/s over {args.concurrency} clients" if args.rps else f"{args.concurrency} clients"
+    print_results(f"{args.label}: {mode} for {args.duration:.0f}s against {args.url}", rows)
+    if samples.error_examples:
+        print(f"   ❌ Failed requests, e.g. {samples.error_examples[:3]}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print_results(f"{baseline.get('label')} ({baseline.get('git_revision')}) -> {args.label}",
+                      compare(baseline, rows))
+
+    if args.save:
+        result = {
+            "label": args.label,
+            "git_revision": git_revision(),
+            "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "settings": {
+                "url": args.url,
+                "mix": args.mix,
+                "concurrency": args.concurrency,
+                "rps": args.rps,
+                "duration": args.duration,
+                "warmup": args.warmup,
+                "users": len(users),
+                "msgpack": args.msgpack,
+                "conditional": args.conditional,
+            },
+            "results": rows,
+        }
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Results saved to {args.save}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# File: benchmarks/plan_session.py - Per-step pooled checkouts vs one plan-scoped snapshot
+"""
+Runs the usual orchestrator plan (search -> details -> KYC -> AML -> address)
+the way the HTTP tool routes do it (one pooled checkout from the server's
+shared connector per step, each in its own transaction) and inside
+db.plan_session.snapshot_transaction (one checkout, one read-only
+REPEATABLE READ transaction). Both use the same connector, so the
+difference is checkouts, transactions and round trips, not connection setup.
+
+    python -m benchmarks.plan_session --connection fixture_postgres --phone 5550001000
+"""
+
+import argparse
+
+from benchmarks.common import open_connector, print_results, time_calls
+from db.plan_session import snapshot_transaction
+from repository.user_repository import (
+    get_additional_info,
+    get_aml_details,
+    get_user_aadhaar_kyc,
+    get_user_address,
+    get_user_ckyc,
+    get_user_header_details,
+    get_user_pans,
+    get_users,
+)
+from seed_fixture import FIXTURE_USER_ID, fixture_phone
+
+
+def run_plan(conn, phone):
+    users = get_users(conn, phone)
+    if not users:
+        return
+    user_id = users[0]['id']
+    get_user_header_details(conn, user_id)
+    get_additional_info(conn, user_id)
+    get_user_pans(conn, user_id)
+    get_user_aadhaar_kyc(conn, user_id)
+    get_user_ckyc(conn, user_id)
+    get_aml_details(conn, user_id)
+    get_user_address(conn, user_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark plan-scoped connection reuse")
+    parser.add_argument('--connection', default='fixture_postgres')
+    parser.add_argument('--phone', default=fixture_phone(FIXTURE_USER_ID))
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    steps = [get_users, get_user_header_details, get_additional_info, get_user_pans,
+             get_user_aadhaar_kyc, get_user_ckyc, get_aml_details, get_user_address]
+
+    shared = open_connector(args.connection)
+
+    def per_step_checkouts():
+        # What the HTTP tool routes do: each request checks a connection out of the shared pool
+        user_id = None
+        for step in steps:
+            with shared.get_conn() as conn:
+                if step is get_users:
+                    users = step(conn, args.phone)
+                    if not users:
+                        return
+                    user_id = users[0]['id']
+                else:
+                    step(conn, user_id)
+
+    def plan_snapshot():
+        with snapshot_transaction(shared) as conn:
+            run_plan(conn, args.phone)
+
+    try:
+        rows = []
+        for name, fn in (("pooled checkout per step", per_step_checkouts), ("plan snapshot", plan_snapshot)):
+            stats = time_calls(fn, args.iterations, warmup=2)
+            rows.append({"mode": name, "p50_ms": stats["p50_ms"], "p95_ms": stats["p95_ms"], "mean_ms": stats["mean_ms"]})
+    finally:
+        shared.close()
+    print_results(f"Orchestrator plan latency ({len(steps)} tool calls, {args.iterations} iterations)", rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# File: benchmarks/session_profiles.py - Repository latency with and without session profiles
+"""
+Runs each repository query class with the server default settings and then
+with the session_profiles from config/databases.yaml applied, so the
+effect of each profile (work_mem, jit, random_page_cost, ...) is visible.
+
+    python -m benchmarks.session_profiles --user-id 1000 --name-term "Sankar"
+"""
+
+import argparse
+
+from benchmarks.common import open_connector, print_results, time_calls
+from db.base_connector import load_db_config
+from db.session_profiles import configure_session_profiles
+from repository.user_repository import (
+    get_aml_details,
+    get_user_address,
+    get_user_header_details,
+    get_user_pans,
+    get_users,
+)
+from seed_fixture import FIXTURE_USER_ID, fixture_phone
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark per-query-class session profiles")
+    parser.add_argument('--connection', default='fixture_postgres')
+    parser.add_argument('--profiles-from', default='pscore_postgres',
+                        help="Connection whose session_profiles section is benchmarked")
+    parser.add_argument('--user-id', type=int, default=FIXTURE_USER_ID)
+    parser.add_argument('--phone', default=fixture_phone(FIXTURE_USER_ID))
+    parser.add_argument('--name-term', default='Sankar')
+    parser.add_argument('--iterations', type=int, default=30)
+    args = parser.parse_args(argv)
+
+    _, db_conns = load_db_config()
+    profiles_cfg = db_conns[args.profiles_from].get('session_profiles', {})
+
+    cases = [
+        ("get_user_address", "point_lookup", lambda conn: get_user_address(conn, args.user_id)),
+        ("get_user_pans", "point_lookup", lambda conn: get_user_pans(conn, args.user_id)),
+        ("get_user_header_details", "point_lookup", lambda conn: get_user_header_details(conn, args.user_id)),
+        ("get_users (phone)", "point_lookup", lambda conn: get_users(conn, args.phone)),
+        ("get_users (name)", "broad_scan", lambda conn: get_users(conn, args.name_term)),
+        ("get_aml_details", "json_extraction", lambda conn: get_aml_details(conn, args.user_id)),
+    ]
+
+    connector = open_connector(args.connection)
+    rows = []
+    try:
+        with connector.get_conn() as conn:
+            for name, profile, call in cases:
+                def run_in_transaction():
+                    # SET LOCAL is per transaction, so time the realistic one-transaction-per-call shape
+                    try:
+                        call(conn)
+                    finally:
+                        conn.rollback()
+
+                configure_session_profiles(connector.engine, {})
+                default = time_calls(run_in_transaction, args.iterations)
+                configure_session_profiles(connector.engine, profiles_cfg)
+                tuned = time_calls(run_in_transaction, args.iterations)
+                rows.append({
+                    "query": name,
+                    "profile": profile,
+                    "default_p50": default["p50_ms"],
+                    "default_p95": default["p95_ms"],
+                    "profile_p50": tuned["p50_ms"],
+                    "profile_p95": tuned["p95_ms"],
+                })
+    finally:
+        connector.close()
+    print_results(f"Session profile effect (ms, {args.iterations} iterations)", rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# File: config/gunicorn.conf.py - Production WSGI serving for the PayU Finance HTTP server
+#
+#   gunicorn -c config/gunicorn.conf.py wsgi:app
+#   kill -HUP <master pid>     # graceful reload: new workers start, old ones finish in-flight requests
+#
+# Every setting can be overridden from the environment (PAYU_HTTP_*).
+
+import multiprocessing
+import os
+
+bind = os.getenv('PAYU_HTTP_BIND', '0.0.0.0:5000')
+
+# Requests mostly wait on Postgres (through the tunnel) and the LLM, so use a few
+# threaded workers rather than many processes: each worker owns a connection pool
+# (pool_size + max_overflow in PostgresConnector) and its own background threads.
+workers = int(os.getenv('PAYU_HTTP_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = 'gthread'
+# Must stay above 1: /api/orchestrator/complex calls the tool routes of this same server
+threads = int(os.getenv('PAYU_HTTP_THREADS', 8))
+
+# Orchestrator queries wait tens of seconds on the LLM
+timeout = int(os.getenv('PAYU_HTTP_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('PAYU_HTTP_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+# Recycle workers now and then so slow leaks don't accumulate
+max_requests = int(os.getenv('PAYU_HTTP_MAX_REQUESTS', 10000))
+max_requests_jitter = 1000
+
+# Build the app in each worker, never before the fork: the SSH tunnel, the
+# engine pool and the listener/index threads do not survive fork()
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('PAYU_HTTP_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker {worker.pid} started")
+
+
+def worker_exit(server, worker):
+    """Stop the worker's background threads and close its tunnel on shutdown/reload"""
+    app = getattr(worker, 'wsgi', None)
+    payu_server = getattr(app, 'extensions', {}).get('payu_server') if app else None
+    if payu_server is not None:
+        payu_server.shutdown()
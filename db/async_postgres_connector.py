@@ -0,0 +1,55 @@
+#db/async_postgres_connector.py
+"""
+asyncio flavour of PostgresConnector (asyncpg driver, same config, same
+SSH tunnel, query stats, session profiles and pooler guard).
+
+The repository functions are synchronous and take a Connection; run them
+on an AsyncConnection with run_sync, which drives asyncpg from the event
+loop without a thread per call:
+
+    async with connector.get_conn() as conn:
+        users = await conn.run_sync(get_users, "9845267602")
+"""
+
+import asyncio
+import time
+import uuid
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from db.postgres_connector import PostgresConnector
+
+
+class AsyncPostgresConnector(PostgresConnector):
+    DRIVER = 'asyncpg'
+
+    def _create_engine(self, uri, pooler_cfg):
+        connect_args = {}
+        if self.transaction_pooling:
+            # asyncpg prepares every statement under a cached name; behind PgBouncer in
+            # transaction mode the name may not exist on the next backend
+            connect_args = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            }
+        return create_async_engine(
+            uri,
+            pool_size=pooler_cfg.get('pool_size', 5),
+            max_overflow=pooler_cfg.get('max_overflow', 10),
+            pool_timeout=30,
+            pool_recycle=1800,
+            pool_pre_ping=not self.transaction_pooling,
+            connect_args=connect_args,
+        )
+
+    async def aclose(self):
+        await self.engine.dispose()
+        self.close()
+
+    async def aretire(self, drain_timeout: float = 60):
+        """retire() for the event loop: the asyncpg connections are closed on it"""
+        deadline = time.monotonic() + drain_timeout
+        while self._checked_out() and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+        await self.aclose()
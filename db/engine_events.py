@@ -0,0 +1,35 @@
+#db/engine_events.py
+"""
+Register engine event listeners once per engine.
+
+Query stats, metrics and tracing all hook the cursor events of every
+connector's engine, and connectors call them again whenever an engine is
+(re)built. EngineListeners remembers which engines an instrument already
+hooked so a second attach is a no-op.
+"""
+
+import threading
+import weakref
+from typing import Callable, Dict
+
+
+class EngineListeners:
+    """The engines one instrument has registered its listeners on"""
+
+    def __init__(self):
+        # Weak rather than by id(): an engine rebuilt after a discard can reuse a collected
+        # engine's id and would otherwise never get its listeners
+        self._engines = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def attach(self, engine, listeners: Dict[str, Callable]) -> bool:
+        """event.listen each {event name: listener} on engine; False if it was already attached"""
+        from sqlalchemy import event
+
+        with self._lock:
+            if engine in self._engines:
+                return False
+            self._engines.add(engine)
+        for name, listener in listeners.items():
+            event.listen(engine, name, listener)
+        return True
@@ -0,0 +1,178 @@
+#db/notify_listener.py
+"""
+Background LISTEN loop that turns Postgres change notifications into
+cache invalidations.
+
+Triggers from db/sql/user_change_notify.sql publish
+{"table": ..., "user_id": ...} on the configured channel. NOTIFY is not
+replicated to read replicas, so the listener must connect to the primary.
+While disconnected the cache is cleared and falls back to its short TTL,
+since notifications sent in the gap are lost.
+
+Cache loads read the replica, which may not have replayed the change yet
+when the notification arrives. Each invalidation therefore carries a WAL
+position on the primary at or past the change's commit; the cache only
+keeps a reload once the replica has replayed that far (replay_lsn()).
+A trigger can't see its own commit record, so the listener reads
+pg_current_wal_insert_lsn() itself: NOTIFY is delivered only after the
+sending transaction has committed.
+
+Manual check against a local Postgres:
+    python -m db.notify_listener --connection fixture_postgres
+"""
+
+import argparse
+import json
+import logging
+import select
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import text
+
+from db.postgres_connector import PostgresConnector
+
+logger = logging.getLogger("payu-fin-db")
+
+DEFAULT_CHANNEL = 'user_data_changed'
+
+
+def parse_lsn(value: str) -> int:
+    """'16/B374D848' -> a comparable integer"""
+    high, low = value.split('/')
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+def replay_lsn(conn) -> Optional[int]:
+    """WAL position the server behind `conn` has replayed; None on a primary, which is always current"""
+    value = conn.execute(text("SELECT pg_last_wal_replay_lsn()::text")).scalar()
+    return parse_lsn(value) if value else None
+
+
+class UserChangeListener:
+    """Daemon thread holding one dedicated LISTEN connection"""
+
+    def __init__(self, connector_factory: Callable[[], PostgresConnector], cache=None,
+                 channel: str = DEFAULT_CHANNEL, poll_timeout: float = 5.0,
+                 reconnect_delay: float = 5.0, on_notification: Optional[Callable[[str, int], None]] = None):
+        self.connector_factory = connector_factory
+        self.cache = cache
+        self.channel = channel
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self.on_notification = on_notification
+        self.notifications_received = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="user-change-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_timeout + 1)
+
+    def _set_connected(self, connected: bool):
+        if self.cache is not None:
+            if not connected:
+                self.cache.clear()
+            self.cache.listener_connected = connected
+
+    def _run(self):
+        while not self._stop.is_set():
+            connector = None
+            raw = None
+            try:
+                connector = self.connector_factory()
+                if getattr(connector, 'transaction_pooling', False):
+                    raise RuntimeError("LISTEN needs a session: point listen_connection at Postgres, not a transaction pooler")
+                raw = connector.engine.raw_connection()
+                dbapi_conn = raw.driver_connection
+                dbapi_conn.autocommit = True
+                with dbapi_conn.cursor() as cur:
+                    cur.execute("SELECT pg_is_in_recovery()")
+                    if cur.fetchone()[0]:
+                        raise RuntimeError("listen_connection is a replica; NOTIFY is only delivered on the primary")
+                    cur.execute(f'LISTEN "{self.channel}"')
+                logger.info(f"✅ Listening for user data changes on '{self.channel}'")
+                self._set_connected(True)
+                self._listen(dbapi_conn)
+            except Exception as e:
+                logger.error(f"❌ User change listener error: {e}")
+            finally:
+                self._set_connected(False)
+                if raw is not None:
+                    try:
+                        raw.invalidate()
+                    except Exception:
+                        pass
+                if connector:
+                    connector.close()
+            self._stop.wait(self.reconnect_delay)
+
+    def _listen(self, dbapi_conn):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([dbapi_conn], [], [], self.poll_timeout)
+            if not readable:
+                continue
+            dbapi_conn.poll()
+            while dbapi_conn.notifies:
+                payloads = [notify.payload for notify in dbapi_conn.notifies]
+                del dbapi_conn.notifies[:]
+                # Read after delivery, so at or past every commit in the batch; anything
+                # delivered while it runs waits for the next position
+                lsn = self._primary_lsn(dbapi_conn)
+                for payload in payloads:
+                    self._handle(payload, lsn)
+
+    @staticmethod
+    def _primary_lsn(dbapi_conn) -> int:
+        with dbapi_conn.cursor() as cur:
+            cur.execute("SELECT pg_current_wal_insert_lsn()::text")
+            return parse_lsn(cur.fetchone()[0])
+
+    def _handle(self, payload: str, lsn: Optional[int] = None):
+        try:
+            data = json.loads(payload)
+            table, user_id = data['table'], int(data['user_id'])
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed change notification: {payload!r}")
+            return
+        self.notifications_received += 1
+        if self.cache is not None:
+            self.cache.invalidate_table(table, user_id, lsn)
+        if self.on_notification:
+            self.on_notification(table, user_id)
+
+
+def main(argv=None):
+    from db.base_connector import load_db_config
+
+    parser = argparse.ArgumentParser(description="Print user change notifications")
+    parser.add_argument('--connection', default='pscore_postgres')
+    parser.add_argument('--channel', default=DEFAULT_CHANNEL)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    env, db_conns = load_db_config()
+    listener = UserChangeListener(
+        lambda: PostgresConnector(db_conns[args.connection], environment=env),
+        channel=args.channel,
+        on_notification=lambda table, user_id: print(f"🔔 {table} changed for user {user_id}"),
+    )
+    listener.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        listener.stop()
+
+
+if __name__ == '__main__':
+    main()
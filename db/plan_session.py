@@ -0,0 +1,48 @@
+#db/plan_session.py
+"""
+One connection and one snapshot for a whole orchestrator plan.
+
+Steps of a plan (search -> details -> KYC -> AML -> address) normally each
+open their own connector over HTTP, so every step pays for a connect and
+sees a slightly different database. snapshot_transaction() checks out a
+single pooled connection and opens a READ ONLY REPEATABLE READ transaction
+on it: every statement in the plan reads the same snapshot, and nothing
+can be written by mistake. The transaction is rolled back at the end; the
+isolation/read-only characteristics are reset when the connection goes
+back to the pool.
+
+Keep the transaction short: run the LLM call before opening it.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("payu-fin-db")
+
+ISOLATION_LEVELS = ('READ COMMITTED', 'REPEATABLE READ', 'SERIALIZABLE')
+
+
+@contextmanager
+def snapshot_transaction(connector, isolation_level: str = 'REPEATABLE READ',
+                         read_only: bool = True, deferrable: bool = False):
+    """Yield a connection inside a single (by default read-only, repeatable-read) transaction"""
+    isolation_level = isolation_level.upper()
+    if isolation_level not in ISOLATION_LEVELS:
+        raise ValueError(f"Unsupported isolation level for a plan snapshot: {isolation_level}")
+    started = time.perf_counter()
+    with connector.get_conn() as conn:
+        conn.execution_options(
+            isolation_level=isolation_level,
+            postgresql_readonly=read_only,
+            # Only meaningful for SERIALIZABLE READ ONLY: waits for a safe snapshot instead of risking aborts
+            postgresql_deferrable=deferrable,
+        )
+        trans = conn.begin()
+        try:
+            yield conn
+        finally:
+            # Nothing to commit on a read-only snapshot
+            trans.rollback()
+            logger.info(f"Plan snapshot ({isolation_level}{' READ ONLY' if read_only else ''}) "
+                        f"held for {(time.perf_counter() - started) * 1000:.0f} ms")
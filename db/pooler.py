@@ -0,0 +1,88 @@
+#db/pooler.py
+"""
+Support for running behind PgBouncer in transaction pooling mode.
+
+With `pool_mode = transaction` a client connection is bound to a server
+backend only for the duration of one transaction. Anything that outlives
+a transaction (SET without LOCAL, PREPARE, LISTEN, session advisory locks,
+WITH HOLD cursors, temp tables) either leaks into another client's
+transaction or is lost. Under this mode the connector:
+
+  * attaches a statement guard that rejects session-scoped statements
+    (or only logs them with strict: false),
+  * skips pool_pre_ping: it checks the client <-> PgBouncer socket, not a
+    server backend, and PgBouncer runs its own server_check_query,
+  * keeps per-query settings transaction-scoped (db/session_profiles.py
+    already uses set_config(..., true)).
+
+psycopg2 never creates named prepared statements and applies isolation
+level/read-only flags in each BEGIN, so nothing else needs turning off.
+
+Configured per connection in config/databases.yaml:
+
+    pooler:
+      mode: transaction     # session (default) | transaction
+      strict: true          # raise PoolerSafetyError instead of logging
+"""
+
+import logging
+import re
+from typing import Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger("payu-fin-db")
+
+SESSION = 'session'
+TRANSACTION = 'transaction'
+POOL_MODES = (SESSION, TRANSACTION)
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+
+# (pattern, reason) for statements whose effect outlives the transaction
+_SESSION_STATE_PATTERNS = (
+    (re.compile(r'^\s*SET\s+(?!LOCAL\b)(?!TRANSACTION\b)', re.I), "SET without LOCAL changes the server session"),
+    (re.compile(r'^\s*RESET\b', re.I), "RESET changes the server session"),
+    (re.compile(r'^\s*(PREPARE|DEALLOCATE)\b', re.I), "named prepared statements live on one server backend"),
+    (re.compile(r'^\s*(LISTEN|UNLISTEN)\b', re.I), "LISTEN needs a dedicated session"),
+    (re.compile(r'^\s*DISCARD\b', re.I), "DISCARD is for session pooling"),
+    (re.compile(r'\bWITH\s+HOLD\b', re.I), "WITH HOLD cursors outlive the transaction"),
+    (re.compile(r'\bCREATE\s+(GLOBAL\s+|LOCAL\s+)?TEMP(ORARY)?\s+TABLE\b', re.I), "temp tables live on one server backend"),
+    (re.compile(r'\bpg_(try_)?advisory_lock(_shared)?\s*\(', re.I), "session advisory locks; use pg_advisory_xact_lock"),
+    (re.compile(r'\bset_config\s*\([^()]*,\s*false\s*\)', re.I), "set_config(..., false) changes the server session"),
+)
+
+
+class PoolerSafetyError(RuntimeError):
+    """Raised for a statement that is unsafe under transaction pooling"""
+
+
+def session_state_reason(statement: str) -> Optional[str]:
+    """Why a statement is unsafe under transaction pooling, or None"""
+    sql = _COMMENT_RE.sub(' ', statement)
+    for pattern, reason in _SESSION_STATE_PATTERNS:
+        if pattern.search(sql):
+            return reason
+    return None
+
+
+def attach_transaction_pooling_guard(engine, strict: bool = True):
+    """Check every statement on the engine before it is sent"""
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        reason = session_state_reason(statement)
+        if reason is None:
+            return
+        message = f"Statement unsafe under transaction pooling ({reason}): {statement.strip()[:200]}"
+        if strict:
+            raise PoolerSafetyError(message)
+        logger.warning(message)
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+
+
+def pool_mode(db_cfg) -> str:
+    mode = (db_cfg.get('pooler') or {}).get('mode', SESSION)
+    if mode not in POOL_MODES:
+        raise ValueError(f"Unknown pooler mode: {mode} (expected one of {', '.join(POOL_MODES)})")
+    return mode
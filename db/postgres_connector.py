@@ -1,10 +1,20 @@
+import threading
+import time
+
 from sqlalchemy import create_engine
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.pool import QueuePool
 from sshtunnel import SSHTunnelForwarder
 from sqlalchemy import text
 
+from db.pooler import TRANSACTION, attach_transaction_pooling_guard, pool_mode
+from db.query_stats import query_stats
+from db.session_profiles import configure_session_profiles
+
 
 class PostgresConnector:
+    DRIVER = 'psycopg2'
+
     def __init__(self, db_cfg, environment):
         print(f"[DEBUG] Initializing PostgresConnector with environment: {environment}")
         self.db_cfg = db_cfg
@@ -31,16 +41,39 @@ class PostgresConnector:
             local_host, local_port = self.db_cfg['host'], self.db_cfg['port']
             print(f"[DEBUG] Using direct DB connection to {local_host}:{local_port}")
 
-        uri = f"postgresql+psycopg2://{db_cfg['user']}:{db_cfg['password']}@{local_host}:{local_port}/{db_cfg['database']}"
+        uri = f"postgresql+{self.DRIVER}://{db_cfg['user']}:{db_cfg['password']}@{local_host}:{local_port}/{db_cfg['database']}"
         print(f"[DEBUG] SQLAlchemy URI: {uri}")
-        self.engine = create_engine(
+        # Behind PgBouncer in transaction mode (see db/pooler.py) pre-ping only tests the bouncer socket
+        self.pool_mode = pool_mode(self.db_cfg)
+        self.transaction_pooling = self.pool_mode == TRANSACTION
+        pooler_cfg = self.db_cfg.get('pooler') or {}
+        self.engine = self._create_engine(uri, pooler_cfg)
+        # Engine events live on the sync engine (the async engine wraps one)
+        sync_engine = getattr(self.engine, 'sync_engine', self.engine)
+        if self.transaction_pooling:
+            attach_transaction_pooling_guard(sync_engine, strict=pooler_cfg.get('strict', True))
+
+        query_log_cfg = self.db_cfg.get('query_log', {})
+        if query_log_cfg.get('enable', False):
+            query_stats.configure(
+                slow_query_ms=query_log_cfg.get('slow_query_ms', 200),
+                log_file=query_log_cfg.get('log_file'),
+                measure_result_bytes=query_log_cfg.get('measure_result_bytes', False),
+            )
+            query_stats.attach(sync_engine)
+
+        if 'session_profiles' in self.db_cfg:
+            configure_session_profiles(sync_engine, self.db_cfg['session_profiles'])
+
+    def _create_engine(self, uri, pooler_cfg):
+        return create_engine(
             uri,
             poolclass=QueuePool,
-            pool_size=5,
-            max_overflow=10,
+            pool_size=pooler_cfg.get('pool_size', 5),
+            max_overflow=pooler_cfg.get('max_overflow', 10),
             pool_timeout=30,
             pool_recycle=1800,
-            pool_pre_ping=True
+            pool_pre_ping=not self.transaction_pooling
         )
 
     def get_conn(self):
@@ -50,6 +83,37 @@ class PostgresConnector:
         if self.ssh_tunnel:
             self.ssh_tunnel.stop()
 
+    def is_disconnect(self, exc) -> bool:
+        """
+        True when the error means this connector is unusable (server connection
+        or SSH tunnel gone); False for errors on a healthy connection, such as
+        a statement_timeout cancel.
+        """
+        if not isinstance(exc, DBAPIError):
+            return False
+        if exc.connection_invalidated:
+            return True
+        # Connecting failed rather than a query: only a dead tunnel needs rebuilding
+        return self.ssh_tunnel is not None and not self.ssh_tunnel.is_active
+
+    def _checked_out(self) -> int:
+        return self.engine.pool.checkedout()
+
+    def retire(self, drain_timeout: float = 60):
+        """
+        Close a connector replaced after a disconnect, in the background:
+        connections other requests still hold are left to finish (or fail on
+        their own), then the engine is disposed and the SSH tunnel stopped.
+        """
+        def close_when_drained():
+            deadline = time.monotonic() + drain_timeout
+            while self._checked_out() and time.monotonic() < deadline:
+                time.sleep(0.5)
+            self.engine.dispose()
+            self.close()
+
+        threading.Thread(target=close_when_drained, name="connector-retire", daemon=True).start()
+
 def main():
     # Replace these values with your actual database/SSH configuration
  
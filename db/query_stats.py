@@ -0,0 +1,225 @@
+#db/query_stats.py
+"""
+Engine-level query instrumentation.
+
+Hooks SQLAlchemy's before/after_cursor_execute events, fingerprints each
+statement (literals and bind parameters replaced by '?'), and keeps per
+fingerprint latency histograms, row counts and byte counts. Statements
+slower than the configured threshold are written as JSON lines to the
+slow query log.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from db.engine_events import EngineListeners
+
+logger = logging.getLogger("payu-fin-db")
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_BIND_RE = re.compile(r'%\([^)]+\)s|%s|:\w+')
+_NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_statement(statement: str) -> str:
+    """Strip comments, literals and bind parameters so equivalent statements compare equal"""
+    sql = _COMMENT_RE.sub(' ', statement)
+    sql = _STRING_RE.sub('?', sql)
+    # '::' casts look like ':name' binds; protect them first
+    sql = sql.replace('::', '\x00')
+    sql = _BIND_RE.sub('?', sql)
+    sql = sql.replace('\x00', '::')
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(?)', sql)
+    return _SPACE_RE.sub(' ', sql).strip().rstrip(';').strip()
+
+
+def fingerprint_statement(statement: str) -> str:
+    return hashlib.md5(normalize_statement(statement).encode('utf-8')).hexdigest()[:16]
+
+
+class QueryStats:
+    """Aggregated numbers for one statement fingerprint"""
+
+    def __init__(self, fingerprint: str, normalized: str):
+        self.fingerprint = fingerprint
+        self.normalized = normalized
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, elapsed_ms: float, rows: int, bytes_sent: int, bytes_received: int):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += max(rows, 0)
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{bound}ms" for bound in LATENCY_BUCKETS_MS] + ["inf"]
+        return {
+            "fingerprint": self.fingerprint,
+            "statement": self.normalized,
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "histogram": dict(zip(labels, self.buckets)),
+        }
+
+
+class QueryStatsCollector:
+    """Process-wide statement statistics fed by SQLAlchemy engine events"""
+
+    def __init__(self, slow_query_ms: float = 200.0, log_file: Optional[str] = None,
+                 measure_result_bytes: bool = False):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, QueryStats] = {}
+        self._normalized_cache: Dict[str, tuple] = {}
+        self._listeners = EngineListeners()
+        self.slow_logger = logging.getLogger("payu-fin-slow-queries")
+        self.configure(slow_query_ms, log_file, measure_result_bytes)
+
+    def configure(self, slow_query_ms: float = 200.0, log_file: Optional[str] = None,
+                  measure_result_bytes: bool = False):
+        """Apply the `query_log` section of a connection config"""
+        self.slow_query_ms = float(slow_query_ms)
+        self.measure_result_bytes = measure_result_bytes
+        if log_file and not any(getattr(h, 'baseFilename', None) == os.path.abspath(log_file)
+                                for h in self.slow_logger.handlers):
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            handler = logging.FileHandler(log_file)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.slow_logger.addHandler(handler)
+
+    def attach(self, engine):
+        """Register the cursor events on an engine (idempotent)"""
+        self._listeners.attach(engine, {
+            'before_cursor_execute': self._before_cursor_execute,
+            'after_cursor_execute': self._after_cursor_execute,
+            'handle_error': self._handle_error,
+        })
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['query_start_time'].pop()) * 1000
+        rows = getattr(cursor, 'rowcount', -1)
+        bytes_sent = len(getattr(cursor, 'query', None) or statement.encode('utf-8'))
+        bytes_received = self._result_bytes(cursor) if self.measure_result_bytes else 0
+        stats = self._record(statement, elapsed_ms, rows, bytes_sent, bytes_received)
+        if elapsed_ms >= self.slow_query_ms:
+            self._log_slow_query(stats, statement, parameters, elapsed_ms, rows, bytes_received)
+
+    def _handle_error(self, exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_start_time'):
+            conn.info['query_start_time'].pop()
+        statement = exception_context.statement
+        if statement:
+            with self._lock:
+                self._get_stats(statement).errors += 1
+
+    def _result_bytes(self, cursor) -> int:
+        """Approximate size of a buffered result set; re-reads rows, so opt-in only"""
+        if not self._is_rewindable(cursor):
+            return 0
+        rows = cursor.fetchall()
+        # Client-side psycopg2 cursors scroll over rows already in memory; this cannot lose data
+        cursor.scroll(0, mode='absolute')
+        return sum(len(str(value)) for row in rows for value in row if value is not None)
+
+    @staticmethod
+    def _is_rewindable(cursor) -> bool:
+        """Only an unread, buffered client-side psycopg2 cursor can be read and rewound safely.
+
+        Named (server-side / stream_results) cursors cannot move backwards and
+        driver adapters such as asyncpg's have no scroll at all; those are
+        never measured.
+        """
+        if getattr(cursor, 'description', None) is None:
+            return False
+        if not type(cursor).__module__.startswith('psycopg2'):
+            return False
+        if getattr(cursor, 'name', True) is not None or not hasattr(cursor, 'scroll'):
+            return False
+        return getattr(cursor, 'rownumber', None) == 0 and getattr(cursor, 'rowcount', -1) > 0
+
+    def _get_stats(self, statement: str) -> QueryStats:
+        cached = self._normalized_cache.get(statement)
+        if cached is None:
+            normalized = normalize_statement(statement)
+            cached = (hashlib.md5(normalized.encode('utf-8')).hexdigest()[:16], normalized)
+            if len(self._normalized_cache) < 10000:
+                self._normalized_cache[statement] = cached
+        fingerprint, normalized = cached
+        stats = self._stats.get(fingerprint)
+        if stats is None:
+            stats = self._stats[fingerprint] = QueryStats(fingerprint, normalized)
+        return stats
+
+    def _record(self, statement, elapsed_ms, rows, bytes_sent, bytes_received) -> QueryStats:
+        with self._lock:
+            stats = self._get_stats(statement)
+            stats.record(elapsed_ms, rows, bytes_sent, bytes_received)
+            return stats
+
+    def _log_slow_query(self, stats: QueryStats, statement, parameters, elapsed_ms, rows, bytes_received):
+        self.slow_logger.warning(json.dumps({
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "event": "slow_query",
+            "fingerprint": stats.fingerprint,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "threshold_ms": self.slow_query_ms,
+            "rows": rows,
+            "bytes_received": bytes_received,
+            "param_keys": sorted(parameters) if isinstance(parameters, dict) else None,
+            "statement": stats.normalized[:2000],
+        }))
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """All fingerprints, most total DB time first"""
+        with self._lock:
+            items = [stats.to_dict() for stats in self._stats.values()]
+        return sorted(items, key=lambda item: item['total_ms'], reverse=True)
+
+    def top(self, n: int = 10) -> List[Dict[str, Any]]:
+        return self.snapshot()[:n]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# Shared by every PostgresConnector in the process so stats survive per-request connectors
+query_stats = QueryStatsCollector()
@@ -0,0 +1,101 @@
+#db/session_profiles.py
+"""
+Per-query-class Postgres settings applied with transaction scope.
+
+Profiles come from the connection's `session_profiles` section in
+config/databases.yaml, e.g.
+
+    session_profiles:
+      point_lookup: {work_mem: 4MB, jit: "off", statement_timeout: 2s}
+      broad_scan:   {work_mem: 64MB, statement_timeout: 15s}
+
+Repository functions call apply_session_profile(conn, '<class>') before
+their statement. Settings are applied with set_config(..., is_local => true),
+i.e. SET LOCAL: they end with the transaction and never leak into the
+pooled session. Settings another profile touched are put back to the
+session default, so profiles don't bleed into each other when several
+lookups share one transaction.
+
+Profiles are kept per engine (by its connection pool, which
+execution_options() copies of the engine share), so every connection in
+config/databases.yaml keeps its own section.
+"""
+
+import logging
+import re
+import weakref
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger("payu-fin-db")
+
+POINT_LOOKUP = 'point_lookup'
+BROAD_SCAN = 'broad_scan'
+JSON_EXTRACTION = 'json_extraction'
+
+_SETTING_RE = re.compile(r'^[a-z_][a-z0-9_.]*$')
+
+# engine.pool -> (profiles, every setting any profile touches)
+_profiles_by_pool = weakref.WeakKeyDictionary()
+
+
+def _setting_value(value: Any) -> str:
+    # YAML turns bare on/off into booleans
+    if isinstance(value, bool):
+        return 'on' if value else 'off'
+    return str(value)
+
+
+def configure_session_profiles(engine, cfg: Optional[Dict[str, Dict[str, Any]]]):
+    """Install the profiles for connections from `engine`; an empty config disables them"""
+    profiles = {}
+    for name, settings in (cfg or {}).items():
+        for setting in settings or {}:
+            if not _SETTING_RE.match(setting):
+                raise ValueError(f"Invalid setting name in session profile {name}: {setting!r}")
+        profiles[name] = {setting: _setting_value(value) for setting, value in (settings or {}).items()}
+    if not profiles:
+        _profiles_by_pool.pop(engine.pool, None)
+        return
+    all_settings = tuple(sorted({setting for settings in profiles.values() for setting in settings}))
+    _profiles_by_pool[engine.pool] = (profiles, all_settings)
+
+
+def _profiles_for(conn):
+    pool = getattr(getattr(conn, 'engine', None), 'pool', None)
+    return _profiles_by_pool.get(pool) if pool is not None else None
+
+
+def get_session_profiles(engine) -> Dict[str, Dict[str, str]]:
+    entry = _profiles_by_pool.get(engine.pool)
+    return dict(entry[0]) if entry else {}
+
+
+def apply_session_profile(conn, profile: str):
+    """SET LOCAL the settings of `profile` on the connection's current transaction"""
+    entry = _profiles_for(conn)
+    if entry is None:
+        return
+    profiles, all_settings = entry
+    settings = profiles.get(profile, {})
+
+    # conn.info belongs to the pooled DBAPI connection; a weak reference (unlike id()) can't
+    # match a later transaction, so each new transaction gets its settings applied again
+    transaction = conn.get_transaction() if getattr(conn, 'in_transaction', lambda: False)() else None
+    applied = conn.info.get('session_profile')
+    if transaction is not None and applied and applied[0]() is transaction and applied[1] == profile:
+        return
+
+    params = {}
+    calls = []
+    for i, setting in enumerate(all_settings):
+        params[f"n{i}"] = setting
+        if setting in settings:
+            params[f"v{i}"] = settings[setting]
+            calls.append(f"set_config(:n{i}, :v{i}, true)")
+        else:
+            calls.append(f"set_config(:n{i}, (SELECT reset_val FROM pg_settings WHERE name = :n{i}), true)")
+    # Tagged so statement-level tooling (query_plan_check.py) can tell it from the query it prepares
+    conn.execute(text("SELECT " + ", ".join(calls)).execution_options(session_profile=profile), params)
+    conn.info['session_profile'] = (weakref.ref(conn.get_transaction()), profile)
@@ -0,0 +1,152 @@
+-- Tables read by the repository, for the local fixture database only
+-- (fixture_postgres in config/databases.yaml). Production owns its own
+-- schema; this file mirrors the columns the queries use, plus the
+-- updated_at columns the incremental refreshes read. Applied and filled
+-- with synthetic users by seed_fixture.py.
+
+CREATE TABLE IF NOT EXISTS users_masteruser (
+    id                      bigint PRIMARY KEY,
+    customer_id             varchar(64),
+    name                    text,
+    first_name              text,
+    middle_name             text,
+    last_name               text,
+    gender                  varchar(8),
+    date_of_birth           date,
+    email_id                text,
+    phone_id                text,
+    um_uuid                 uuid,
+    created_at              timestamptz NOT NULL DEFAULT now(),
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS users_masteruser_phone_id_idx ON users_masteruser (phone_id);
+CREATE INDEX IF NOT EXISTS users_masteruser_email_id_idx ON users_masteruser (email_id);
+
+CREATE TABLE IF NOT EXISTS users_masteruserextra (
+    id                      bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    master_user_id          bigint NOT NULL,
+    mother_name             text,
+    father_name             text,
+    spouse_name             text,
+    alternate_phone         text,
+    community               text,
+    marital_status          text,
+    educational_qualification text,
+    category                text,
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS users_masteruserextra_master_user_idx ON users_masteruserextra (master_user_id);
+
+CREATE TABLE IF NOT EXISTS users_pan (
+    id                      bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    master_user_id          bigint NOT NULL,
+    number                  varchar(10),
+    nsdl_name               text,
+    nsdl_valid              boolean,
+    date_of_birth           date,
+    gender                  varchar(8),
+    is_valid                boolean NOT NULL DEFAULT false,
+    status                  integer,
+    created_at              timestamptz NOT NULL DEFAULT now(),
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS users_pan_master_user_idx ON users_pan (master_user_id);
+
+CREATE TABLE IF NOT EXISTS users_aadhaar (
+    id                      bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    master_user_id          bigint NOT NULL,
+    digits                  varchar(4),
+    name                    text,
+    gender                  varchar(8),
+    date_of_birth           date,
+    phone_linked            boolean,
+    address_id              bigint,
+    is_verification_skipped boolean NOT NULL DEFAULT false,
+    is_valid                boolean NOT NULL DEFAULT false,
+    status                  integer,
+    embedded_data           jsonb,
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS users_aadhaar_master_user_idx ON users_aadhaar (master_user_id);
+
+CREATE TABLE IF NOT EXISTS users_kycverification (
+    id                      bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    master_user_id          bigint NOT NULL,
+    mode                    integer,
+    aadhaar_id              bigint,
+    ckyc_id                 bigint,
+    source_id               bigint,
+    is_valid                boolean NOT NULL DEFAULT false,
+    expiry_date             date,
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS users_kycverification_master_user_idx ON users_kycverification (master_user_id);
+
+CREATE TABLE IF NOT EXISTS users_ckyc (
+    id                      bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    master_user_id          bigint NOT NULL,
+    number                  text,
+    aadhaar_digits          varchar(4),
+    phone                   text,
+    ckyc_data_origin        text,
+    ckyc_source             text,
+    base_search_type        text,
+    base_search_value       text,
+    auth_factor_value       text,
+    document_ids            jsonb,
+    validation_failures     jsonb,
+    details                 jsonb,
+    is_confirmed            boolean,
+    is_valid                boolean NOT NULL DEFAULT false,
+    status                  integer,
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS users_ckyc_master_user_idx ON users_ckyc (master_user_id);
+
+CREATE TABLE IF NOT EXISTS users_address (
+    id                      bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    master_user_id          bigint NOT NULL,
+    address_type            integer,
+    line1                   text,
+    line2                   text,
+    landmark                text,
+    city                    text,
+    state                   text,
+    postal_code_id          bigint,
+    linked_id               bigint,
+    status                  integer,
+    is_valid                boolean NOT NULL DEFAULT false,
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS users_address_master_user_idx ON users_address (master_user_id);
+
+CREATE TABLE IF NOT EXISTS users_phonenumber (
+    id                      bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    phone                   text NOT NULL,
+    otp_verified_at         timestamptz,
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS users_email (
+    id                      bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    email                   text NOT NULL,
+    verified_at             timestamptz,
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS users_amlresponsedata (
+    id                      bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    master_user_id          bigint NOT NULL,
+    application_id          text,
+    decision                text,
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS users_amlrequestresponselog (
+    id                      bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    application_id          text,
+    response                text,
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS users_amlrequestresponselog_application_idx
+    ON users_amlrequestresponselog (application_id);
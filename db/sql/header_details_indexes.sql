@@ -0,0 +1,18 @@
+-- Indexes backing the LATERAL ... ORDER BY id DESC LIMIT 1 lookups in
+-- repository/user_repository.py:get_user_header_details.
+-- Run on the primary; they replicate to the read replica.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_pan_valid_latest_idx
+    ON users_pan (master_user_id, id DESC) WHERE is_valid = true;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_aadhaar_valid_latest_idx
+    ON users_aadhaar (master_user_id, id DESC) WHERE is_valid = true;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_phonenumber_phone_latest_idx
+    ON users_phonenumber (phone, id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_email_email_latest_idx
+    ON users_email (email, id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_amlresponsedata_latest_idx
+    ON users_amlresponsedata (master_user_id, id DESC);
@@ -0,0 +1,8 @@
+-- Index behind the incremental refresh in repository/identifier_index.py:
+-- rows changed since the last refresh are found by updated_at (the new-id
+-- half of the refresh uses the primary key).
+-- Run on the primary; it replicates to the read replica. If
+-- identifier_index.updated_at_column names another column, index that one.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_masteruser_updated_at_idx
+    ON users_masteruser (updated_at);
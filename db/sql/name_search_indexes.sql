@@ -0,0 +1,20 @@
+-- Trigram indexes behind the guarded name search in
+-- repository/search_guard.py (lower(column) LIKE '%term%' and 'term%').
+-- Run on the primary; they replicate to the read replica.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_masteruser_name_trgm_idx
+    ON users_masteruser USING gin (lower(name) gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_masteruser_first_name_trgm_idx
+    ON users_masteruser USING gin (lower(first_name) gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_masteruser_middle_name_trgm_idx
+    ON users_masteruser USING gin (lower(middle_name) gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_masteruser_last_name_trgm_idx
+    ON users_masteruser USING gin (lower(last_name) gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_pan_valid_nsdl_name_trgm_idx
+    ON users_pan USING gin (lower(nsdl_name) gin_trgm_ops) WHERE is_valid = true;
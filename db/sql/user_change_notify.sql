@@ -0,0 +1,131 @@
+-- Change notifications consumed by db/notify_listener.py to invalidate the
+-- per-user result cache (repository/user_cache.py).
+-- Install on the primary: NOTIFY is not replicated to read replicas.
+--
+--   psql -v channel=user_data_changed -f db/sql/user_change_notify.sql
+--
+-- The channel must match result_cache.channel in config/databases.yaml;
+-- it is passed to every trigger as its second argument, so re-run this
+-- file with the new -v channel=... whenever that setting changes.
+--
+-- The first trigger argument says how a row maps to users_masteruser.id:
+--   master_user_id | id | phone | email | aml_application
+
+\if :{?channel}
+\else
+    \set channel user_data_changed
+\endif
+
+CREATE OR REPLACE FUNCTION notify_user_data_changed() RETURNS trigger AS $$
+DECLARE
+    key_kind text := TG_ARGV[0];
+    channel text := TG_ARGV[1];
+    affected_users bigint[] := ARRAY[]::bigint[];
+    affected_user bigint;
+BEGIN
+    IF key_kind = 'master_user_id' THEN
+        IF TG_OP <> 'INSERT' THEN affected_users := affected_users || OLD.master_user_id; END IF;
+        IF TG_OP <> 'DELETE' THEN affected_users := affected_users || NEW.master_user_id; END IF;
+    ELSIF key_kind = 'id' THEN
+        IF TG_OP <> 'INSERT' THEN affected_users := affected_users || OLD.id; END IF;
+        IF TG_OP <> 'DELETE' THEN affected_users := affected_users || NEW.id; END IF;
+    ELSIF key_kind = 'phone' THEN
+        affected_users := ARRAY(
+            SELECT id FROM users_masteruser
+            WHERE phone_id IN (
+                CASE WHEN TG_OP <> 'INSERT' THEN OLD.phone END,
+                CASE WHEN TG_OP <> 'DELETE' THEN NEW.phone END
+            )
+        );
+    ELSIF key_kind = 'email' THEN
+        affected_users := ARRAY(
+            SELECT id FROM users_masteruser
+            WHERE email_id IN (
+                CASE WHEN TG_OP <> 'INSERT' THEN OLD.email END,
+                CASE WHEN TG_OP <> 'DELETE' THEN NEW.email END
+            )
+        );
+    ELSIF key_kind = 'aml_application' THEN
+        affected_users := ARRAY(
+            SELECT master_user_id FROM users_amlresponsedata
+            WHERE application_id IN (
+                CASE WHEN TG_OP <> 'INSERT' THEN OLD.application_id END,
+                CASE WHEN TG_OP <> 'DELETE' THEN NEW.application_id END
+            )
+        );
+    END IF;
+
+    -- Identical payloads within one transaction are delivered only once
+    FOREACH affected_user IN ARRAY affected_users LOOP
+        IF affected_user IS NOT NULL THEN
+            PERFORM pg_notify(
+                channel,
+                json_build_object('table', TG_TABLE_NAME, 'user_id', affected_user)::text
+            );
+        END IF;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Tables behind the cached KYC / AML / address sections
+DROP TRIGGER IF EXISTS users_pan_notify_change ON users_pan;
+CREATE TRIGGER users_pan_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users_pan
+    FOR EACH ROW EXECUTE FUNCTION notify_user_data_changed('master_user_id', :'channel');
+
+DROP TRIGGER IF EXISTS users_aadhaar_notify_change ON users_aadhaar;
+CREATE TRIGGER users_aadhaar_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users_aadhaar
+    FOR EACH ROW EXECUTE FUNCTION notify_user_data_changed('master_user_id', :'channel');
+
+DROP TRIGGER IF EXISTS users_kycverification_notify_change ON users_kycverification;
+CREATE TRIGGER users_kycverification_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users_kycverification
+    FOR EACH ROW EXECUTE FUNCTION notify_user_data_changed('master_user_id', :'channel');
+
+DROP TRIGGER IF EXISTS users_address_notify_change ON users_address;
+CREATE TRIGGER users_address_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users_address
+    FOR EACH ROW EXECUTE FUNCTION notify_user_data_changed('master_user_id', :'channel');
+
+DROP TRIGGER IF EXISTS users_amlresponsedata_notify_change ON users_amlresponsedata;
+CREATE TRIGGER users_amlresponsedata_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users_amlresponsedata
+    FOR EACH ROW EXECUTE FUNCTION notify_user_data_changed('master_user_id', :'channel');
+
+-- The screening response log joins to the user through users_amlresponsedata.application_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_amlresponsedata_application_idx
+    ON users_amlresponsedata (application_id);
+
+DROP TRIGGER IF EXISTS users_amlrequestresponselog_notify_change ON users_amlrequestresponselog;
+CREATE TRIGGER users_amlrequestresponselog_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users_amlrequestresponselog
+    FOR EACH ROW EXECUTE FUNCTION notify_user_data_changed('aml_application', :'channel');
+
+-- Remaining tables read by the header / additional info / CKYC sections,
+-- so those sections can use the long TTL as well
+DROP TRIGGER IF EXISTS users_ckyc_notify_change ON users_ckyc;
+CREATE TRIGGER users_ckyc_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users_ckyc
+    FOR EACH ROW EXECUTE FUNCTION notify_user_data_changed('master_user_id', :'channel');
+
+DROP TRIGGER IF EXISTS users_masteruserextra_notify_change ON users_masteruserextra;
+CREATE TRIGGER users_masteruserextra_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users_masteruserextra
+    FOR EACH ROW EXECUTE FUNCTION notify_user_data_changed('master_user_id', :'channel');
+
+DROP TRIGGER IF EXISTS users_masteruser_notify_change ON users_masteruser;
+CREATE TRIGGER users_masteruser_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users_masteruser
+    FOR EACH ROW EXECUTE FUNCTION notify_user_data_changed('id', :'channel');
+
+DROP TRIGGER IF EXISTS users_phonenumber_notify_change ON users_phonenumber;
+CREATE TRIGGER users_phonenumber_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users_phonenumber
+    FOR EACH ROW EXECUTE FUNCTION notify_user_data_changed('phone', :'channel');
+
+DROP TRIGGER IF EXISTS users_email_notify_change ON users_email;
+CREATE TRIGGER users_email_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON users_email
+    FOR EACH ROW EXECUTE FUNCTION notify_user_data_changed('email', :'channel');
@@ -0,0 +1,37 @@
+-- Precomputed per-user header / KYC / AML summary read by
+-- repository/user_summary_repository.py and refreshed incrementally by
+-- refresh_user_summary.py. Create on the primary; reads go to the replica.
+
+CREATE TABLE IF NOT EXISTS user_summary (
+    user_id                 bigint PRIMARY KEY,
+    customer_id             varchar(64),
+    full_name               text,
+    first_name              text,
+    middle_name             text,
+    last_name               text,
+    gender                  text,
+    date_of_birth           date,
+    email_address           text,
+    phone_id                text,
+    pan_number              text,
+    pan_is_valid            boolean,
+    pan_status_text         text,
+    aadhaar_digits          text,
+    aadhaar_is_valid        boolean,
+    aadhaar_status          text,
+    document_image          text,
+    kyc_mode                integer,
+    kyc_is_valid            boolean,
+    kyc_expiry_date         date,
+    phone_number            text,
+    otp_verification_time   timestamptz,
+    email_verified_at       timestamptz,
+    aml_decision            text,
+    refreshed_at            timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS user_summary_refresh_state (
+    id                      integer PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    last_refreshed_at       timestamptz NOT NULL,
+    users_refreshed         bigint NOT NULL DEFAULT 0
+);
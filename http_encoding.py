@@ -0,0 +1,140 @@
+# File: http_encoding.py - Compression and conditional requests for tool responses
+"""
+Applied to /api/tools/* responses by both servers:
+
+  * Content-Encoding negotiated from Accept-Encoding (br when the brotli
+    package is installed, then gzip) for bodies of at least min_bytes;
+    base64 Aadhaar photos and AML alert arrays compress well.
+  * a strong ETag from a hash of the uncompressed body. Each content
+    coding is its own representation, so the coding is appended inside
+    the quotes ("<hash>-gzip"). If-None-Match compares the hash only, so a
+    tag saved from a gzip response also matches the identity one.
+  * If-None-Match matching the ETag gives 304 with no body. The tool
+    routes are POST but read-only lookups, so 304 is returned for them as
+    it would be for GET.
+
+Configured per connection in config/databases.yaml:
+
+    response_encoding:
+      enable: true
+      min_bytes: 1024
+      gzip_level: 6
+      brotli_quality: 4
+      etag: true
+"""
+
+import gzip
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+CODING_SUFFIXES = {'br': '-br', 'gzip': '-gzip'}
+
+
+def strong_etag(body: bytes, coding: Optional[str] = None) -> str:
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    return f'"{digest}{CODING_SUFFIXES.get(coding, "")}"'
+
+
+def _opaque_tag(tag: str) -> str:
+    """Entity tag without W/, quotes or a content-coding suffix"""
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in CODING_SUFFIXES.values():
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison (RFC 9110 13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return _opaque_tag(etag) in {_opaque_tag(tag) for tag in if_none_match.split(',') if tag.strip()}
+
+
+def _accepted_codings(accept_encoding: Optional[str]) -> Dict[str, float]:
+    """{coding: q} from an Accept-Encoding header"""
+    codings = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[name] = q
+    return codings
+
+
+class ResponseEncoding:
+    """Compression and ETag settings from the connection's `response_encoding` section"""
+
+    def __init__(self, min_bytes: int = 1024, gzip_level: int = 6, brotli_quality: int = 4, etag: bool = True):
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.etag = etag
+        # Server preference when the client weighs codings equally
+        self.codings: List[str] = (['br'] if brotli is not None else []) + ['gzip']
+
+    @classmethod
+    def from_config(cls, cfg) -> Optional["ResponseEncoding"]:
+        cfg = cfg or {}
+        if not cfg.get('enable', False):
+            return None
+        return cls(
+            min_bytes=cfg.get('min_bytes', 1024),
+            gzip_level=cfg.get('gzip_level', 6),
+            brotli_quality=cfg.get('brotli_quality', 4),
+            etag=cfg.get('etag', True),
+        )
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Optional[str]:
+        accepted = _accepted_codings(accept_encoding)
+        best, best_q = None, 0.0
+        for coding in self.codings:
+            q = accepted.get(coding, accepted.get('*', 0.0))
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def compress(self, body: bytes, coding: str) -> bytes:
+        if coding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        # mtime=0 keeps the output (and any cache keyed on it) stable
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def prepare(self, body: bytes, accept_encoding: Optional[str], if_none_match: Optional[str],
+                with_etag: bool = True) -> Tuple[bool, bytes, Dict[str, str]]:
+        """
+        (not_modified, body, headers) for a 200 response body. Headers to add:
+        Vary, and ETag / Content-Encoding when they apply.
+        """
+        # Accept: the body may be JSON or MessagePack (http_msgpack.py)
+        headers = {'Vary': 'Accept, Accept-Encoding'}
+        coding = self.negotiate(accept_encoding) if len(body) >= self.min_bytes else None
+        if self.etag and with_etag:
+            headers['ETag'] = strong_etag(body, coding)
+            # Lookups return personal data: revalidate every time, never store in shared caches
+            headers['Cache-Control'] = 'private, no-cache'
+            if etag_matches(if_none_match, headers['ETag']):
+                return True, b'', headers
+        if coding:
+            body = self.compress(body, coding)
+            headers['Content-Encoding'] = coding
+        return False, body, headers
@@ -0,0 +1,120 @@
+# File: http_json.py - JSON encoding for HTTP responses
+"""
+Response bodies are dominated by serialisation on large payloads (search
+pages, KYC with PAN history, AML alerts). json_encoder() builds the encoder
+both servers use; FastJSONProvider plugs it into Flask (app.json), the
+async server calls it directly.
+
+  provider: orjson (default when installed) or stdlib
+  date_format:
+    iso   date -> "1990-05-17", datetime -> "2024-03-01T10:15:30.123456+05:30"
+    http  Flask's legacy RFC 822 strings ("Fri, 01 Mar 2024 10:15:30 GMT"),
+          which drop microseconds and the date/datetime distinction
+
+Decimal and UUID become strings, as with Flask's default provider.
+
+Configured per connection in config/databases.yaml:
+
+    json_responses:
+      provider: orjson
+      date_format: iso
+"""
+
+import datetime
+import decimal
+import json
+import logging
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+logger = logging.getLogger("payu-fin-http")
+
+PROVIDERS = ('orjson', 'stdlib')
+DATE_FORMATS = ('iso', 'http')
+
+
+def _make_default(date_format: str):
+    """default= hook for the types the encoders do not handle natively"""
+
+    def default(value):
+        if isinstance(value, (decimal.Decimal, uuid.UUID)):
+            return str(value)
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return http_date(value) if date_format == 'http' else value.isoformat()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    return default
+
+
+def json_encoder(provider: str = 'orjson', date_format: str = 'iso', sort_keys: bool = True) -> Callable[[Any], bytes]:
+    """obj -> UTF-8 JSON bytes with the configured encoder and date format"""
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown JSON provider: {provider} (expected one of {', '.join(PROVIDERS)})")
+    if date_format not in DATE_FORMATS:
+        raise ValueError(f"Unknown date format: {date_format} (expected one of {', '.join(DATE_FORMATS)})")
+    if provider == 'orjson' and orjson is None:
+        logger.warning("orjson is not installed; using the stdlib JSON encoder")
+        provider = 'stdlib'
+
+    if provider == 'orjson':
+        default = _make_default(date_format)
+        # Python dicts may have int keys (stdlib json turns them into strings; orjson needs the option)
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if date_format == 'http':
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+
+        def encode(obj):
+            return orjson.dumps(obj, default=default, option=option)
+        return encode
+
+    default = _make_default(date_format)
+    encoder = json.JSONEncoder(default=default, sort_keys=sort_keys, ensure_ascii=False, separators=(',', ':'))
+
+    def encode(obj):
+        return encoder.encode(obj).encode('utf-8')
+    return encode
+
+
+def json_encoder_from_config(cfg: Optional[Dict[str, Any]]) -> Callable[[Any], bytes]:
+    cfg = cfg or {}
+    return json_encoder(cfg.get('provider', 'orjson'), cfg.get('date_format', 'iso'))
+
+
+def json_loads(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider (jsonify, request.get_json) on top of json_encoder()"""
+
+    def __init__(self, app, encode: Callable[[Any], bytes]):
+        super().__init__(app)
+        self.encode = encode
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return self.encode(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        return json_loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.encode(obj) + b"\n", mimetype="application/json")
+
+
+def install_json_provider(app, cfg: Optional[Dict[str, Any]]):
+    """Replace app.json when the connection has a `json_responses` section"""
+    if cfg is None:
+        return
+    app.json = FastJSONProvider(app, json_encoder_from_config(cfg))
+    logger.info(f"✅ JSON responses: {cfg.get('provider', 'orjson')} ({cfg.get('date_format', 'iso')} dates)")
@@ -0,0 +1,120 @@
+# File: http_msgpack.py - MessagePack response format for machine-to-machine callers
+"""
+Tool, batch and orchestrator responses are sent as MessagePack instead of
+JSON when the request's Accept header prefers application/msgpack (and the
+msgpack package is installed). Bodies are smaller, and packing and
+unpacking cost less CPU than JSON.
+
+Values keep their types instead of becoming strings:
+
+  datetime with tzinfo   MessagePack timestamp (ext -1)
+  naive datetime         ext 2, ISO 8601 text (no time zone to convert to a timestamp)
+  date                   ext 1, ISO 8601 text
+  bytes                  bin
+  Decimal, UUID          str, as in JSON
+
+loads() restores all of them (timestamps as UTC datetimes); callers use
+decode_response() to handle either format.
+"""
+
+import datetime
+import decimal
+import json
+import uuid
+from typing import Any, Optional
+
+try:
+    import msgpack
+except ImportError:  # optional; everyone gets JSON
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, 'application/x-msgpack')
+
+EXT_DATE = 1
+EXT_NAIVE_DATETIME = 2
+
+
+def available() -> bool:
+    return msgpack is not None
+
+
+def _media_ranges(accept: Optional[str]):
+    """(media type, q) pairs from an Accept header"""
+    for item in (accept or '').split(','):
+        media_type, _, params = item.strip().partition(';')
+        media_type = media_type.strip().lower()
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        yield media_type, q
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    """True when the client ranks MessagePack above JSON; JSON wins ties and wildcards"""
+    if msgpack is None:
+        return False
+    msgpack_q = json_q = 0.0
+    for media_type, q in _media_ranges(accept):
+        if media_type in MSGPACK_MEDIA_TYPES:
+            msgpack_q = max(msgpack_q, q)
+        elif media_type in ('application/json', 'application/*', '*/*'):
+            json_q = max(json_q, q)
+    return msgpack_q > json_q
+
+
+def _default(value):
+    if isinstance(value, datetime.datetime):
+        # Reached only for naive datetimes; aware ones are packed as timestamps
+        return msgpack.ExtType(EXT_NAIVE_DATETIME, value.isoformat().encode('ascii'))
+    if isinstance(value, datetime.date):
+        return msgpack.ExtType(EXT_DATE, value.isoformat().encode('ascii'))
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not MessagePack serializable")
+
+
+def _ext_hook(code, data):
+    if code == EXT_DATE:
+        return datetime.date.fromisoformat(data.decode('ascii'))
+    if code == EXT_NAIVE_DATETIME:
+        return datetime.datetime.fromisoformat(data.decode('ascii'))
+    return msgpack.ExtType(code, data)
+
+
+def dumps(obj: Any) -> bytes:
+    return msgpack.packb(obj, default=_default, datetime=True, use_bin_type=True)
+
+
+def loads(data: bytes) -> Any:
+    return msgpack.unpackb(data, ext_hook=_ext_hook, timestamp=3, raw=False, strict_map_key=False)
+
+
+def accept_header(prefer_msgpack: bool = True) -> str:
+    """Accept header for a client that can read MessagePack (JSON stays acceptable)"""
+    if prefer_msgpack and msgpack is not None:
+        return f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.5"
+    return "application/json"
+
+
+def decode_response(response) -> Any:
+    """Body of a requests/httpx response in whichever format the server chose"""
+    content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type in MSGPACK_MEDIA_TYPES:
+        return loads(response.content)
+    return response.json()
+
+
+def response_text(response) -> str:
+    """Readable body for error messages"""
+    content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type in MSGPACK_MEDIA_TYPES:
+        return json.dumps(loads(response.content), default=str)
+    return response.text
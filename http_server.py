@@ -1,24 +1,33 @@
 # File: http_server.py - Complete PayU Finance HTTP Server with AI Orchestrator
+import contextvars
 import logging
 import os
-from flask import Flask, request, jsonify, render_template_string, send_from_directory
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from flask import Flask, Response, g, request, jsonify, render_template_string, send_from_directory
 from flask_cors import CORS
 import traceback
 from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 
-# Import your existing database components with aliases to avoid name collisions
+# Import your existing database components
 from db.base_connector import load_db_config
 from db.postgres_connector import PostgresConnector
-from repository.user_repository import (
-    get_users as repo_get_users, 
-    get_additional_info as repo_get_additional_info, 
-    get_user_pans as repo_get_user_pans, 
-    get_user_aadhaar_kyc as repo_get_user_aadhaar_kyc,
-    get_user_ckyc as repo_get_user_ckyc,
-    get_user_header_details as repo_get_user_header_details,
-    get_aml_details as repo_get_aml_details,
-    get_user_address as repo_get_user_address
-)
+from db.plan_session import snapshot_transaction
+from tool_service import ToolService, tool_listing
+from tool_batch import ToolBatch, batch_limits
+from http_json import install_json_provider
+from http_encoding import ResponseEncoding
+import http_msgpack
+import http_sse
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics, add_serialize_time
+from tracing import SERVER, traced_path, tracer
+from readiness import ReadinessProbe, ReadinessState
+from orchestrator_jobs import JobManager, JobQueueFull
+from admission import PRIORITY_HEADER, AdmissionController, Rejected, admitted_path, request_priority
 
 # Import AI Orchestrator
 from ai_orchestrator import EnhancedAIOrchestrator
@@ -208,19 +217,41 @@ class PayUFinanceHTTPServer:
         CORS(self.app)
         self.env = None
         self.db_conns = None
+        self.tools = None
+        self.response_encoding = None
+        self.plan_session_options = None
+        self._connector = None
+        self._connector_lock = threading.Lock()
+        self.metrics = Metrics()
+        self.admission = None
+        self.readiness = None
+        self.readiness_probe = None
+        self.jobs = None
         
         # Initialize AI Orchestrator
         self.orchestrator = self._initialize_orchestrator()
         
         self._setup_routes()
         self._initialize_config()
+        tracer.configure(self.db_conns['pscore_postgres'].get('tracing'))
+        self.tools = ToolService(self.env, self.db_conns)
+        install_json_provider(self.app, self.db_conns['pscore_postgres'].get('json_responses'))
+        self.response_encoding = ResponseEncoding.from_config(self.db_conns['pscore_postgres'].get('response_encoding'))
+        self.admission = AdmissionController.from_config(self.db_conns['pscore_postgres'])
+        self.metrics.configure(self.db_conns['pscore_postgres'].get('metrics'), self._metrics_sources)
+        self._initialize_plan_sessions()
+        self._initialize_readiness()
         logger.info("PayU Finance HTTP Server with AI Orchestrator initialized")
     
     def _initialize_orchestrator(self):
         """Initialize the AI Orchestrator"""
         try:
-            api_key = os.getenv('TOQAN_API_KEY', 'sk_f203979e694f67bb72ad235ba5fcb70976a41c87141a6d3386c3a7f3ef8bb61e0675f3cc25d0f12086dd2b472d4f9a045c1411bab04f18276dafefe50f9e')
-            orchestrator = EnhancedAIOrchestrator(api_key)
+            api_key = os.getenv('TOQAN_API_KEY')
+            if not api_key:
+                logger.error("❌ TOQAN_API_KEY is not set; AI Orchestrator disabled")
+                return None
+            # The orchestrator calls the tool routes over HTTP; point it at wherever this server listens
+            orchestrator = EnhancedAIOrchestrator(api_key, base_url=os.getenv('PAYU_TOOLS_BASE_URL', 'http://127.0.0.1:5000'))
             logger.info("✅ AI Orchestrator initialized successfully")
             return orchestrator
         except Exception as e:
@@ -237,19 +268,211 @@ class PayUFinanceHTTPServer:
             logger.error(f"❌ Failed to load database configuration: {e}")
             raise
     
-    def _get_fresh_connection(self):
-        """Create a fresh database connection for each request"""
+    def _initialize_plan_sessions(self):
+        """Let the orchestrator run whole plans on one connection and snapshot when enabled"""
+        plan_cfg = self.db_conns['pscore_postgres'].get('plan_session', {})
+        self.plan_session_options = {
+            "isolation_level": plan_cfg.get('isolation_level', 'REPEATABLE READ'),
+            "read_only": plan_cfg.get('read_only', True),
+            "deferrable": plan_cfg.get('deferrable', False),
+        }
+        if self.orchestrator:
+            self.orchestrator.phase_observer = self.metrics.observe_phase
+            self.orchestrator.plan_session_factory = self.plan_session
+            self.orchestrator.execution_mode = 'plan_session' if plan_cfg.get('enable', False) else 'http'
+            logger.info(f"✅ Orchestrator execution mode: {self.orchestrator.execution_mode}")
+            self.jobs = JobManager.from_config(
+                self.db_conns['pscore_postgres'],
+                lambda query, mode, on_event: self.orchestrator.process_complex_query(query, mode, on_event=on_event))
+    
+    def _initialize_readiness(self):
+        """Background database probe behind /readyz"""
+        db_cfg = self.db_conns['pscore_postgres']
+        self.readiness = ReadinessState.from_config(db_cfg)
+        self.readiness_probe = ReadinessProbe(self.readiness, self._probe_database,
+                                              (db_cfg.get('readiness') or {}).get('interval_seconds', 5))
+        self.readiness_probe.start()
+    
+    def _probe_database(self):
+        """SELECT 1 on a pooled connection of the shared connector"""
+        with self._connection() as conn:
+            conn.execute(text('SELECT 1')).fetchone()
+    
+    @contextmanager
+    def plan_session(self):
+        """
+        Tool runner for one orchestrator plan: every step runs in-process on the
+        same connection and read-only snapshot. The result cache is bypassed so
+        all sections come from that snapshot.
+        """
+        with snapshot_transaction(self._get_connector(), **self.plan_session_options) as conn:
+            def run_tool(tool_name, parameters):
+                try:
+                    result = self.tools.run_tool(tool_name, conn, parameters, use_cache=False)
+                    return {"success": True, "tool": tool_name, "parameters": parameters, "result": result}
+                except Exception as e:
+                    logger.error(f"❌ Error in {tool_name} (plan session): {e}")
+                    return {"success": False, "error": str(e), "tool": tool_name, "parameters": parameters}
+            yield run_tool
+    
+    def _get_connector(self):
+        """
+        Process-wide connector (engine pool + SSH tunnel), created on first use.
+        Under a pre-forking server every worker builds its own after the fork.
+        """
+        with self._connector_lock:
+            if self._connector is None:
+                try:
+                    with tracer.span('db.connector.create'):
+                        self._connector = PostgresConnector(self.db_conns['pscore_postgres'], environment=self.env)
+                    self.metrics.attach_db_timer(self._connector.engine)
+                    tracer.attach_sql_tracing(self._connector.engine)
+                except Exception as e:
+                    logger.error(f"❌ Failed to create database connection: {e}")
+                    raise
+            return self._connector
+    
+    @contextmanager
+    def _connection(self):
+        """Pooled connection of the shared connector; a disconnect replaces the connector"""
+        connector = self._get_connector()
         try:
-            pg_cfg = self.db_conns['pscore_postgres']
-            connector = PostgresConnector(pg_cfg, environment=self.env)
-            return connector
-        except Exception as e:
-            logger.error(f"❌ Failed to create database connection: {e}")
+            with connector.get_conn() as conn:
+                yield conn
+        except DBAPIError as e:
+            if connector.is_disconnect(e):
+                self._discard_connector(connector)
             raise
     
+    def _discard_connector(self, connector):
+        """
+        Replace the shared connector after a disconnect (e.g. the tunnel went
+        away). Only the connector the failure came from is replaced, and it is
+        closed once the requests still using it are done.
+        """
+        with self._connector_lock:
+            if self._connector is not connector:
+                # Already replaced after an earlier failure
+                return
+            self._connector = None
+        logger.warning("⚠️ Database connection lost; reconnecting on the next request")
+        connector.retire()
+    
+    def _close_connector(self):
+        """Worker exit: close the shared connector now"""
+        with self._connector_lock:
+            connector, self._connector = self._connector, None
+        if connector:
+            connector.engine.dispose()
+            connector.close()
+    
+    def shutdown(self):
+        """Stop background threads and release the connector (worker exit / reload)"""
+        self.readiness.draining = True
+        self.readiness_probe.stop()
+        if self.jobs:
+            self.jobs.shutdown()
+        self.tools.shutdown()
+        self._close_connector()
+        self.metrics.shutdown()
+        tracer.shutdown()
+    
+    def _metrics_sources(self):
+        """Scrape-time inputs of the metrics: pool, caches and admission of this worker"""
+        connector = self._connector
+        return {"engine": connector.engine if connector else None, "tools": self.tools,
+                "admission": self.admission}
+    
     def _setup_routes(self):
         """Setup all API routes"""
         
+        @self.app.before_request
+        def start_request_span():
+            if not traced_path(request.path):
+                return
+            # Child of the caller's span when it sent a traceparent (the orchestrator does)
+            span = tracer.start_span(f"{request.method} {request.path}", SERVER,
+                                     {"http.method": request.method, "http.route": request.path},
+                                     traceparent=request.headers.get('traceparent'))
+            g.trace = (span, tracer.activate(span))
+        
+        # Registered first, so it runs last and the span covers encoding too
+        @self.app.after_request
+        def finish_request_span(response):
+            span, token = g.pop('trace', (None, None))
+            if span is not None:
+                span.set_attribute('http.status_code', response.status_code)
+                response.headers['traceparent'] = span.traceparent
+            tracer.finish(span, token)
+            return response
+        
+        @self.app.teardown_request
+        def finish_failed_request_span(exc):
+            span, token = g.pop('trace', (None, None))
+            if span is not None:
+                span.set_error(f"{type(exc).__name__}: {exc}" if exc else "unhandled error")
+            tracer.finish(span, token)
+        
+        @self.app.before_request
+        def start_request_metrics():
+            g.metrics_token = self.metrics.start_request()
+        
+        # Registered before the encoding hook, so it runs after it (after_request runs in reverse)
+        @self.app.after_request
+        def record_request_metrics(response):
+            token = g.pop('metrics_token', None)
+            if token is not None:
+                self.metrics.finish_request(token, request.path, request.method, response.status_code)
+            return response
+        
+        @self.app.teardown_request
+        def record_failed_request_metrics(exc):
+            # Unhandled exceptions skip after_request
+            token = g.pop('metrics_token', None)
+            if token is not None:
+                self.metrics.finish_request(token, request.path, request.method, 500)
+        
+        # After the span and metrics hooks, so shed requests are still traced and counted
+        @self.app.before_request
+        def admit_tool_request():
+            if self.admission is None or request.method != 'POST' or not admitted_path(request.path):
+                return None
+            priority = request_priority(request.path, request.headers.get(PRIORITY_HEADER))
+            # A batch runs up to max_concurrency calls at once, each on its own connection
+            weight = batch_limits(self.db_conns['pscore_postgres'])[1] if request.path == '/api/tools/batch' else 1
+            try:
+                g.admission_ticket = self.admission.acquire(priority, weight)
+            except Rejected as e:
+                return self._respond(e.body()), e.status, e.headers()
+            return None
+        
+        @self.app.teardown_request
+        def release_admission(exc):
+            ticket = g.pop('admission_ticket', None)
+            if ticket is not None:
+                self.admission.release(ticket)
+        
+        @self.app.after_request
+        def encode_tool_response(response):
+            """Compression, ETag and 304 for successful tool responses"""
+            if (self.response_encoding is None or response.status_code != 200
+                    or not request.path.startswith('/api/tools/') or response.direct_passthrough):
+                return response
+            # Batch bodies carry timings, so they would never revalidate
+            started = time.perf_counter()
+            not_modified, body, headers = self.response_encoding.prepare(
+                response.get_data(),
+                request.headers.get('Accept-Encoding'),
+                request.headers.get('If-None-Match'),
+                with_etag=request.path != '/api/tools/batch',
+            )
+            add_serialize_time(time.perf_counter() - started)
+            if not_modified:
+                response.status_code = 304
+            response.set_data(body)
+            response.headers.update(headers)
+            return response
+        
         @self.app.route('/')
         def home():
             """API test page"""
@@ -266,17 +489,25 @@ class PayUFinanceHTTPServer:
                     "message": "Please make sure the orchestrator web interface file is in the same directory"
                 }), 404
         
+        @self.app.route('/livez')
+        def liveness():
+            """The process is up; no I/O"""
+            return jsonify({"status": "alive"})
+        
+        @self.app.route('/readyz')
+        def readiness():
+            """Last background database probe; no I/O"""
+            ready, body = self.readiness.status()
+            return jsonify(body), 200 if ready else 503
+        
         @self.app.route('/health')
         def health_check():
             """Health check endpoint with database test"""
             try:
-                connector = self._get_fresh_connection()
-                with connector.get_conn() as conn:
+                with self._connection() as conn:
                     result = conn.execute(text('SELECT 1 as test')).fetchone()
                     test_passed = result[0] == 1 if result else False
                 
-                connector.close()
-                
                 return jsonify({
                     "status": "healthy",
                     "service": "PayU Finance HTTP Server",
@@ -288,8 +519,15 @@ class PayUFinanceHTTPServer:
                         "api_tester": "/",
                         "orchestrator_ui": "/orchestrator",
                         "health": "/health",
+                        "liveness": "/livez",
+                        "readiness": "/readyz",
                         "tools": "/api/tools",
-                        "orchestrator_api": "/api/orchestrator/complex"
+                        "batch": "/api/tools/batch",
+                        "metrics": "/metrics",
+                        "traces": "/api/traces",
+                        "orchestrator_api": "/api/orchestrator/complex",
+                        "orchestrator_stream": "/api/orchestrator/stream",
+                        "orchestrator_jobs": "/api/orchestrator/jobs"
                     }
                 })
                 
@@ -302,55 +540,30 @@ class PayUFinanceHTTPServer:
                     "error": str(e)
                 }), 500
         
+        @self.app.route('/metrics')
+        def metrics():
+            """Prometheus metrics (does not open a database connection)"""
+            body = self.metrics.render(**self._metrics_sources())
+            return Response(body, content_type=METRICS_CONTENT_TYPE)
+        
+        @self.app.route('/api/traces')
+        def recent_traces():
+            """Recent traces collected in this worker process"""
+            return jsonify({"enabled": tracer.enabled, "scope": "process", "traces": tracer.recent()})
+        
+        @self.app.route('/api/traces/<trace_id>')
+        def get_trace(trace_id):
+            """Spans of one trace, in start order; scope says whether other workers' spans are included"""
+            spans = tracer.trace(trace_id)
+            if spans is None:
+                return jsonify({"success": False, "scope": tracer.lookup_scope,
+                                "error": f"Trace {trace_id} not found"}), 404
+            return jsonify({"success": True, "trace_id": trace_id, "scope": tracer.lookup_scope, "spans": spans})
+        
         @self.app.route('/api/tools')
         def list_tools():
             """List available tools"""
-            tools = [
-                {
-                    "name": "search_users",
-                    "description": "Search for users by phone, email, name, or ID",
-                    "endpoint": "/api/tools/search_users",
-                    "method": "POST"
-                },
-                {
-                    "name": "get_user_details", 
-                    "description": "Get comprehensive user details",
-                    "endpoint": "/api/tools/get_user_details",
-                    "method": "POST"
-                },
-                {
-                    "name": "get_user_kyc_info",
-                    "description": "Get user KYC information", 
-                    "endpoint": "/api/tools/get_user_kyc_info",
-                    "method": "POST"
-                },
-                {
-                    "name": "get_user_aml_status",
-                    "description": "Get user AML status",
-                    "endpoint": "/api/tools/get_user_aml_status", 
-                    "method": "POST"
-                },
-                {
-                    "name": "get_user_address",
-                    "description": "Get user address information",
-                    "endpoint": "/api/tools/get_user_address",
-                    "method": "POST"
-                }
-            ]
-            
-            if self.orchestrator:
-                tools.append({
-                    "name": "ai_orchestrator",
-                    "description": "Process complex queries with multi-tool coordination",
-                    "endpoint": "/api/orchestrator/complex",
-                    "method": "POST"
-                })
-            
-            return jsonify({
-                "tools": tools,
-                "total_tools": len(tools),
-                "ai_orchestrator_enabled": self.orchestrator is not None
-            })
+            return jsonify(tool_listing(self.orchestrator is not None))
         
         # AI Orchestrator endpoint
         @self.app.route('/api/orchestrator/complex', methods=['POST'])
@@ -358,14 +571,14 @@ class PayUFinanceHTTPServer:
             """Process complex queries through the AI Orchestrator"""
             try:
                 if not self.orchestrator:
-                    return jsonify({
+                    return self._respond({
                         "success": False,
                         "error": "AI Orchestrator not initialized. Check server logs for details."
                     }), 503
                     
                 data = request.get_json()
                 if not data or 'query' not in data:
-                    return jsonify({
+                    return self._respond({
                         "success": False,
                         "error": "Missing 'query' field in request body",
                         "expected_format": {"query": "Your complex query here"}
@@ -373,15 +586,15 @@ class PayUFinanceHTTPServer:
                 
                 user_query = data['query'].strip()
                 if not user_query:
-                    return jsonify({
+                    return self._respond({
                         "success": False,
                         "error": "Query cannot be empty"
                     }), 400
                 
                 logger.info(f"🤖 Processing orchestrator query: {user_query}")
                 
-                # Process the query through the AI Orchestrator
-                result = self.orchestrator.process_complex_query(user_query)
+                # Process the query through the AI Orchestrator ('http' or 'plan_session'; default from config)
+                result = self.orchestrator.process_complex_query(user_query, data.get('execution_mode'))
                 
                 # Log result
                 if result.get('success'):
@@ -390,207 +603,193 @@ class PayUFinanceHTTPServer:
                 else:
                     logger.error(f"❌ Orchestrator query failed: {result.get('error')}")
                 
-                return jsonify(result)
+                return self._respond(result)
                 
             except Exception as e:
                 logger.error(f"❌ Error in orchestrator endpoint: {e}")
                 logger.error(f"Traceback: {traceback.format_exc()}")
-                return jsonify({
+                return self._respond({
                     "success": False,
                     "error": f"Server error: {str(e)}",
                     "user_query": data.get('query', '') if 'data' in locals() else '',
                     "traceback": traceback.format_exc()
                 }), 500
         
+        @self.app.route('/api/orchestrator/stream', methods=['GET', 'POST'])
+        def stream_complex_query():
+            """Process a query through the AI Orchestrator, streaming progress as Server-Sent Events"""
+            if not self.orchestrator:
+                return self._respond({
+                    "success": False,
+                    "error": "AI Orchestrator not initialized. Check server logs for details."
+                }), 503
+            # POST body for fetch(), query string for EventSource
+            data = request.get_json(silent=True) if request.method == 'POST' else request.args
+            data = data if isinstance(data, dict) else {}
+            query = data.get('query')
+            user_query = query.strip() if isinstance(query, str) else ''
+            if not user_query:
+                return self._respond({
+                    "success": False,
+                    "error": "Missing 'query' field in request body",
+                    "expected_format": {"query": "Your complex query here"}
+                }), 400
+            
+            logger.info(f"🤖 Streaming orchestrator query: {user_query}")
+            # The copy carries the request's trace into the orchestrator thread
+            events = self._stream_query(user_query, data.get('execution_mode'), contextvars.copy_context())
+            return Response(events, mimetype=http_sse.MEDIA_TYPE, headers=http_sse.HEADERS)
+        
+        @self.app.route('/api/orchestrator/jobs', methods=['POST'])
+        def submit_orchestrator_job():
+            """Queue a query for the orchestrator worker pool; poll the returned job URL"""
+            if not self.jobs:
+                return self._respond({
+                    "success": False,
+                    "error": "AI Orchestrator not initialized. Check server logs for details."
+                }), 503
+            data = request.get_json(silent=True)
+            query = data.get('query') if isinstance(data, dict) else None
+            if not isinstance(query, str) or not query.strip():
+                return self._respond({
+                    "success": False,
+                    "error": "Missing 'query' field in request body",
+                    "expected_format": {"query": "Your complex query here"}
+                }), 400
+            try:
+                job = self.jobs.submit(query.strip(), data.get('execution_mode'))
+            except JobQueueFull as e:
+                return self._respond({"success": False, "error": str(e), "retry_after": e.retry_after}), 503, \
+                    {"Retry-After": str(e.retry_after)}
+            location = f"/api/orchestrator/jobs/{job['job_id']}"
+            logger.info(f"🤖 Queued orchestrator job {job['job_id']}: {job['query']}")
+            return self._respond(dict(job, status_url=location)), 202, {"Location": location}
+        
+        @self.app.route('/api/orchestrator/jobs/<job_id>', methods=['GET', 'DELETE'])
+        def orchestrator_job(job_id):
+            """Job status and result (GET) or cancellation (DELETE)"""
+            if not self.jobs:
+                job = None
+            elif request.method == 'DELETE':
+                job = self.jobs.cancel(job_id)
+            else:
+                job = self.jobs.get(job_id)
+            if job is None:
+                return self._respond({"success": False, "error": f"Job {job_id} not found (or expired)"}), 404
+            return self._respond(job)
+        
+        @self.app.route('/api/tools/batch', methods=['POST'])
+        def run_batch():
+            """Run several tool invocations (with dependencies) in one request"""
+            try:
+                max_invocations, max_concurrency = batch_limits(self.db_conns['pscore_postgres'])
+                batch = ToolBatch.from_request(request.get_json(), max_invocations)
+            except ValueError as e:
+                return self._respond({"success": False, "error": str(e)}), 400
+            
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batch.invocations))) as pool:
+                for wave in batch.waves:
+                    calls = batch.prepare(wave)
+                    # A context copy per call carries the request's metrics timings into the pool threads
+                    contexts = [contextvars.copy_context() for _ in calls]
+                    outcomes = pool.map(lambda context, call: context.run(self._batch_call, call[0].tool, call[1]),
+                                        contexts, calls)
+                    for (invocation, _), (status, result, error) in zip(calls, outcomes):
+                        batch.record(invocation, status, result, error)
+            return self._respond(batch.response())
+        
         # Existing API endpoints
         @self.app.route('/api/tools/search_users', methods=['POST'])
         def search_users():
             """Search for users"""
-            connector = None
-            try:
-                data = request.get_json()
-                search_term = data.get('search_term')
-                
-                if not search_term:
-                    return jsonify({"error": "Missing search_term parameter", "success": False}), 400
-                
-                logger.info(f"🔍 Searching users with term: {search_term}")
-                
-                connector = self._get_fresh_connection()
-                with connector.get_conn() as conn:
-                    users = repo_get_users(conn, search_term)
-                    
-                    logger.info(f"✅ Found {len(users)} users")
-                    
-                    return jsonify({
-                        "success": True,
-                        "search_term": search_term,
-                        "total_found": len(users),
-                        "users": users
-                    })
-                    
-            except Exception as e:
-                logger.error(f"❌ Error in search_users: {e}")
-                return jsonify({
-                    "success": False,
-                    "error": str(e),
-                    "traceback": traceback.format_exc()
-                }), 500
-            finally:
-                if connector:
-                    connector.close()
+            return self._tool_response('search_users')
         
         @self.app.route('/api/tools/get_user_details', methods=['POST'])
         def get_user_details():
             """Get user details"""
-            connector = None
-            try:
-                data = request.get_json()
-                user_id = data.get('user_id')
-                
-                if not user_id:
-                    return jsonify({"error": "Missing user_id parameter", "success": False}), 400
-                
-                logger.info(f"👤 Getting user details for ID: {user_id}")
-                
-                connector = self._get_fresh_connection()
-                with connector.get_conn() as conn:
-                    header_details = repo_get_user_header_details(conn, user_id)
-                    additional_info = repo_get_additional_info(conn, user_id)
-                    
-                    return jsonify({
-                        "success": True,
-                        "user_id": user_id,
-                        "header_details": header_details,
-                        "additional_info": additional_info
-                    })
-                    
-            except Exception as e:
-                logger.error(f"❌ Error in get_user_details: {e}")
-                return jsonify({
-                    "success": False,
-                    "error": str(e),
-                    "traceback": traceback.format_exc()
-                }), 500
-            finally:
-                if connector:
-                    connector.close()
+            return self._tool_response('get_user_details')
         
         @self.app.route('/api/tools/get_user_kyc_info', methods=['POST'])
         def get_user_kyc_info():
             """Get user KYC info"""
-            connector = None
-            try:
-                data = request.get_json()
-                user_id = data.get('user_id')
-                
-                if not user_id:
-                    return jsonify({"error": "Missing user_id parameter", "success": False}), 400
-                
-                logger.info(f"📋 Getting KYC info for user ID: {user_id}")
-                
-                connector = self._get_fresh_connection()
-                with connector.get_conn() as conn:
-                    pan_info = repo_get_user_pans(conn, user_id)
-                    aadhaar_kyc = repo_get_user_aadhaar_kyc(conn, user_id)
-                    ckyc_info = repo_get_user_ckyc(conn, user_id)
-                    
-                    return jsonify({
-                        "success": True,
-                        "user_id": user_id,
-                        "pan_info": pan_info,
-                        "aadhaar_kyc": aadhaar_kyc,
-                        "ckyc_info": ckyc_info,
-                        "summary": {
-                            "pan_records": len(pan_info),
-                            "has_aadhaar_kyc": bool(aadhaar_kyc),
-                            "has_ckyc": bool(ckyc_info)
-                        }
-                    })
-                    
-            except Exception as e:
-                logger.error(f"❌ Error in get_user_kyc_info: {e}")
-                return jsonify({
-                    "success": False,
-                    "error": str(e),
-                    "traceback": traceback.format_exc()
-                }), 500
-            finally:
-                if connector:
-                    connector.close()
+            return self._tool_response('get_user_kyc_info')
         
         @self.app.route('/api/tools/get_user_aml_status', methods=['POST'])
         def get_user_aml_status():
             """Get user AML status"""
-            connector = None
-            try:
-                data = request.get_json()
-                user_id = data.get('user_id')
-                
-                if not user_id:
-                    return jsonify({"error": "Missing user_id parameter", "success": False}), 400
-                
-                logger.info(f"🚨 Getting AML status for user ID: {user_id}")
-                
-                connector = self._get_fresh_connection()
-                with connector.get_conn() as conn:
-                    aml_details = repo_get_aml_details(conn, user_id)
-                    
-                    return jsonify({
-                        "success": True,
-                        "user_id": user_id,
-                        "aml_details": aml_details,
-                        "has_aml_data": bool(aml_details)
-                    })
-                    
-            except Exception as e:
-                logger.error(f"❌ Error in get_user_aml_status: {e}")
-                return jsonify({
-                    "success": False,
-                    "error": str(e),
-                    "traceback": traceback.format_exc()
-                }), 500
-            finally:
-                if connector:
-                    connector.close()
+            return self._tool_response('get_user_aml_status')
         
         @self.app.route('/api/tools/get_user_address', methods=['POST'])
         def get_user_address():
             """Get user address"""
-            connector = None
+            return self._tool_response('get_user_address')
+    
+    def _stream_query(self, user_query, execution_mode, context):
+        """SSE body: the query runs in its own thread and its progress events are relayed as they arrive"""
+        events = queue.Queue()
+        
+        def run():
             try:
-                data = request.get_json()
-                user_id = data.get('user_id')
-                
-                if not user_id:
-                    return jsonify({"error": "Missing user_id parameter", "success": False}), 400
-                
-                logger.info(f"🏠 Getting address for user ID: {user_id}")
-                
-                connector = self._get_fresh_connection()
-                with connector.get_conn() as conn:
-                    address_info = repo_get_user_address(conn, user_id)
-                    
-                    return jsonify({
-                        "success": True,
-                        "user_id": user_id,
-                        "addresses": address_info,
-                        "address_count": len([addr for addr in address_info.values() if addr])
-                    })
-                    
+                result = self.orchestrator.process_complex_query(
+                    user_query, execution_mode, on_event=lambda event, data: events.put((event, data)))
             except Exception as e:
-                logger.error(f"❌ Error in get_user_address: {e}")
-                return jsonify({
-                    "success": False,
-                    "error": str(e),
-                    "traceback": traceback.format_exc()
-                }), 500
-            finally:
-                if connector:
-                    connector.close()
+                logger.error(f"❌ Error in orchestrator stream: {e}")
+                result = {"success": False, "error": f"Server error: {str(e)}", "user_query": user_query}
+            events.put(('final', result))
+        
+        threading.Thread(target=context.run, args=(run,), name="orchestrator-stream", daemon=True).start()
+        event_id = 0
+        while True:
+            try:
+                event, data = events.get(timeout=http_sse.KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield http_sse.KEEPALIVE
+                continue
+            event_id += 1
+            yield http_sse.format_event(event, self.app.json.dumps(data).encode('utf-8'), event_id)
+            if event == 'final':
+                return
+    
+    def _respond(self, body):
+        """JSON, or MessagePack when the request's Accept header prefers it"""
+        started = time.perf_counter()
+        try:
+            if http_msgpack.wants_msgpack(request.headers.get('Accept')):
+                return self.app.response_class(http_msgpack.dumps(body), mimetype=http_msgpack.MSGPACK_MEDIA_TYPE)
+            return jsonify(body)
+        finally:
+            add_serialize_time(time.perf_counter() - started)
     
-    def run(self, host='127.0.0.1', port=5000, debug=True):
-        """Run the Flask application"""
+    def _tool_response(self, tool_name):
+        """Run one tool for an HTTP request on a pooled connection"""
+        try:
+            data = request.get_json()
+            with self._connection() as conn:
+                return self._respond(self.tools.run_tool(tool_name, conn, data))
+                
+        except ValueError as e:
+            return self._respond({"success": False, "error": str(e)}), 400
+        except Exception as e:
+            logger.error(f"❌ Error in {tool_name}: {e}")
+            return self._respond({
+                "success": False,
+                "error": str(e),
+                "traceback": traceback.format_exc()
+            }), 500
+    
+    def _batch_call(self, tool_name, parameters):
+        """One call of a batch on its own pooled connection: (status, result, error)"""
+        try:
+            with self._connection() as conn:
+                return 200, self.tools.run_tool(tool_name, conn, parameters), None
+        except ValueError as e:
+            return 400, None, str(e)
+        except Exception as e:
+            logger.error(f"❌ Error in {tool_name} (batch): {e}")
+            return 500, None, str(e)
+    
+    def run(self, host='127.0.0.1', port=5000, debug=False):
+        """Run the Flask development server (production: gunicorn -c config/gunicorn.conf.py wsgi:app)"""
         print("🚀 PayU Finance HTTP Server with AI Orchestrator")
         print("=" * 55)
         print(f"📊 Server URL: http://{host}:{port}")
@@ -602,9 +801,15 @@ class PayUFinanceHTTPServer:
         print()
         print("📡 API Endpoints:")
         print("   • GET  /health - Health check")
+        print("   • GET  /livez, /readyz - Liveness and readiness probes (no I/O)")
         print("   • GET  /api/tools - List available tools")
+        print("   • GET  /metrics - Prometheus metrics")
+        print("   • GET  /api/traces/<trace_id> - Spans of a recent trace")
         print("   • POST /api/tools/* - Individual tool endpoints")
+        print("   • POST /api/tools/batch - Several tool calls in one request")
         print("   • POST /api/orchestrator/complex - AI Orchestrator")
+        print("   • POST /api/orchestrator/stream - AI Orchestrator progress as Server-Sent Events")
+        print("   • POST /api/orchestrator/jobs - Queue an AI Orchestrator query (GET/DELETE /api/orchestrator/jobs/<id>)")
         print()
         if self.orchestrator:
             print("✅ AI Orchestrator: ENABLED")
@@ -616,10 +821,18 @@ class PayUFinanceHTTPServer:
         
         self.app.run(host=host, port=port, debug=debug)
 
+
+def create_app():
+    """App factory for WSGI servers; the server object stays reachable for shutdown hooks"""
+    server = PayUFinanceHTTPServer()
+    server.app.extensions['payu_server'] = server
+    return server.app
+
+
 if __name__ == "__main__":
     try:
         server = PayUFinanceHTTPServer()
-        server.run()
+        server.run(debug=os.getenv('FLASK_DEBUG') == '1')
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by user")
     except Exception as e:
@@ -0,0 +1,32 @@
+# File: http_sse.py - Server-Sent Events framing for orchestrator progress
+"""
+/api/orchestrator/stream runs a query like /api/orchestrator/complex but
+answers with a text/event-stream while it runs, so the web UI can show the
+plan and each step as soon as they are known instead of waiting 10-30 s
+for the whole body:
+
+    event: status          waiting for the LLM / running the tools
+    event: plan            reasoning and planned tools
+    event: step_started    one per step, parameters resolved
+    event: step_finished   one per step, with its result or error
+    event: final           the same body /api/orchestrator/complex returns
+
+Events are numbered (id:) and carry JSON from the server's encoder. A
+comment line goes out every KEEPALIVE_SECONDS while nothing else does, so
+proxies do not time the stream out during the LLM wait.
+
+POST takes the usual {"query", "execution_mode"} body (read with fetch);
+GET takes ?query=&execution_mode= for EventSource.
+"""
+
+KEEPALIVE_SECONDS = 15
+KEEPALIVE = b': keep-alive\n\n'
+MEDIA_TYPE = 'text/event-stream'
+
+# No caching, and no buffering in nginx-style proxies in front of the server
+HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def format_event(event: str, data: bytes, event_id: int) -> bytes:
+    """One event; data is encoded JSON (no newlines from the JSON encoders used here)"""
+    return b'id: %d\nevent: %s\ndata: %s\n\n' % (event_id, event.encode('ascii'), data.replace(b'\n', b'\ndata: '))
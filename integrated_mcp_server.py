@@ -23,16 +23,7 @@ from mcp.types import (
 # Import your existing database components
 from db.base_connector import load_db_config
 from db.postgres_connector import PostgresConnector
-from repository.user_repository import (
-    get_users, 
-    get_additional_info, 
-    get_user_pans, 
-    get_user_aadhaar_kyc,
-    get_user_ckyc,
-    get_user_header_details,
-    get_aml_details,
-    get_user_address
-)
+from tool_service import ToolService
 
 # Load environment variables
 load_dotenv()
@@ -47,6 +38,7 @@ class PayUFinanceMCPServer:
     def __init__(self):
         self.server = Server("payu-fin-mcp")
         self.db_connector = None
+        self.tools = None
         self._setup_handlers()
         logger.info("PayU Finance MCP Server initialized")
     
@@ -66,6 +58,8 @@ class PayUFinanceMCPServer:
             
             # Create database connector
             self.db_connector = PostgresConnector(pg_cfg, environment=env)
+            # Same handlers, caches and guards as the HTTP servers; only the text formatting lives here
+            self.tools = ToolService(env, db_conns)
             logger.info("Database connection initialized successfully")
             
         except Exception as e:
@@ -89,6 +83,10 @@ class PayUFinanceMCPServer:
                                 "search_term": {
                                     "type": "string",
                                     "description": "Search term (phone, email, name, or user ID)"
+                                },
+                                "offset": {
+                                    "type": "integer",
+                                    "description": "Skip this many matches (to continue a truncated result)"
                                 }
                             },
                             "required": ["search_term"]
@@ -103,6 +101,11 @@ class PayUFinanceMCPServer:
                                 "user_id": {
                                     "type": "integer",
                                     "description": "User ID to fetch details for"
+                                },
+                                "fields": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "Optional list of fields to return; only the columns and joins they need are queried"
                                 }
                             },
                             "required": ["user_id"]
@@ -117,6 +120,15 @@ class PayUFinanceMCPServer:
                                 "user_id": {
                                     "type": "integer",
                                     "description": "User ID to fetch KYC information for"
+                                },
+                                "pans_offset": {
+                                    "type": "integer",
+                                    "description": "Skip this many PAN records (to continue a truncated result)"
+                                },
+                                "fields": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "Optional list of fields to return; only the columns and joins they need are queried"
                                 }
                             },
                             "required": ["user_id"]
@@ -131,6 +143,15 @@ class PayUFinanceMCPServer:
                                 "user_id": {
                                     "type": "integer",
                                     "description": "User ID to fetch AML status for"
+                                },
+                                "alerts_offset": {
+                                    "type": "integer",
+                                    "description": "Skip this many AML alerts (to continue a truncated result)"
+                                },
+                                "fields": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "Optional list of fields to return; only the columns and joins they need are queried"
                                 }
                             },
                             "required": ["user_id"]
@@ -161,124 +182,28 @@ class PayUFinanceMCPServer:
             if not self.db_connector:
                 await self.initialize_db()
             
+            formatters = {
+                "search_users": self._format_search_users,
+                "get_user_details": self._format_user_details,
+                "get_user_kyc_info": self._format_kyc_info,
+                "get_user_aml_status": self._format_aml_status,
+                "get_user_address": self._format_address,
+            }
+            if name not in formatters:
+                return CallToolResult(
+                    content=[TextContent(
+                        type="text",
+                        text=f"Unknown tool: {name}"
+                    )]
+                )
+            
             try:
                 with self.db_connector.get_conn() as conn:
-                    
-                    if name == "search_users":
-                        search_term = arguments.get("search_term")
-                        logger.info(f"Searching users with term: {search_term}")
-                        
-                        users = get_users(conn, search_term)
-                        
-                        # Format the response nicely
-                        if users:
-                            result_text = f"Found {len(users)} users matching '{search_term}':\n\n"
-                            for i, user in enumerate(users, 1):
-                                result_text += f"{i}. User ID: {user.get('id', 'N/A')}\n"
-                                result_text += f"   Name: {user.get('name', 'N/A')}\n"
-                                result_text += f"   Phone: {user.get('phone_id', 'N/A')}\n"
-                                result_text += f"   Email: {user.get('email_id', 'N/A')}\n"
-                                result_text += f"   Customer ID: {user.get('customer_id', 'N/A')}\n\n"
-                        else:
-                            result_text = f"No users found matching '{search_term}'"
-                        
-                        return CallToolResult(
-                            content=[TextContent(type="text", text=result_text)]
-                        )
-                    
-                    elif name == "get_user_details":
-                        user_id = arguments.get("user_id")
-                        logger.info(f"Getting user details for ID: {user_id}")
-                        
-                        header_details = get_user_header_details(conn, user_id)
-                        additional_info = get_additional_info(conn, user_id)
-                        
-                        result_text = f"User Details for ID {user_id}:\n\n"
-                        result_text += "Header Information:\n"
-                        if header_details:
-                            for key, value in header_details[0].items() if header_details else {}:
-                                result_text += f"  {key}: {value}\n"
-                        
-                        result_text += "\nAdditional Information:\n"
-                        if additional_info:
-                            for key, value in additional_info[0].items() if additional_info else {}:
-                                result_text += f"  {key}: {value}\n"
-                        
-                        return CallToolResult(
-                            content=[TextContent(type="text", text=result_text)]
-                        )
-                    
-                    elif name == "get_user_kyc_info":
-                        user_id = arguments.get("user_id")
-                        logger.info(f"Getting KYC info for user ID: {user_id}")
-                        
-                        pan_info = get_user_pans(conn, user_id)
-                        aadhaar_kyc = get_user_aadhaar_kyc(conn, user_id)
-                        ckyc_info = get_user_ckyc(conn, user_id)
-                        
-                        result_text = f"KYC Information for User {user_id}:\n\n"
-                        result_text += f"PAN Information: {len(pan_info)} records found\n"
-                        result_text += f"Aadhaar KYC: {len(aadhaar_kyc)} records found\n"
-                        result_text += f"CKYC Information: {len(ckyc_info)} records found\n\n"
-                        
-                        # Add detailed info if available
-                        if pan_info:
-                            result_text += "PAN Details:\n"
-                            for pan in pan_info:
-                                result_text += f"  PAN: {pan.get('pan_number', 'N/A')}\n"
-                                result_text += f"  Status: {pan.get('status', 'N/A')}\n"
-                        
-                        return CallToolResult(
-                            content=[TextContent(type="text", text=result_text)]
-                        )
-                    
-                    elif name == "get_user_aml_status":
-                        user_id = arguments.get("user_id")
-                        logger.info(f"Getting AML status for user ID: {user_id}")
-                        
-                        aml_details = get_aml_details(conn, user_id)
-                        
-                        result_text = f"AML Status for User {user_id}:\n\n"
-                        if aml_details:
-                            result_text += f"AML Records: {len(aml_details)} found\n"
-                            for aml in aml_details:
-                                result_text += f"  Alert Count: {aml.get('alert_count', 'N/A')}\n"
-                                result_text += f"  Status: {aml.get('status', 'N/A')}\n"
-                        else:
-                            result_text += "No AML records found"
-                        
-                        return CallToolResult(
-                            content=[TextContent(type="text", text=result_text)]
-                        )
-                    
-                    elif name == "get_user_address":
-                        user_id = arguments.get("user_id")
-                        logger.info(f"Getting address for user ID: {user_id}")
-                        
-                        address_info = get_user_address(conn, user_id)
-                        
-                        result_text = f"Address Information for User {user_id}:\n\n"
-                        if address_info:
-                            for addr in address_info:
-                                result_text += f"Address Type: {addr.get('address_type', 'N/A')}\n"
-                                result_text += f"Address: {addr.get('address_line_1', 'N/A')}\n"
-                                result_text += f"City: {addr.get('city', 'N/A')}\n"
-                                result_text += f"State: {addr.get('state', 'N/A')}\n"
-                                result_text += f"Pincode: {addr.get('pincode', 'N/A')}\n\n"
-                        else:
-                            result_text += "No address records found"
-                        
-                        return CallToolResult(
-                            content=[TextContent(type="text", text=result_text)]
-                        )
-                    
-                    else:
-                        return CallToolResult(
-                            content=[TextContent(
-                                type="text",
-                                text=f"Unknown tool: {name}"
-                            )]
-                        )
+                    body = self.tools.run_tool(name, conn, arguments)
+                result_text = formatters[name](body, arguments) + self._format_truncation(body)
+                return CallToolResult(
+                    content=[TextContent(type="text", text=result_text)]
+                )
                         
             except Exception as e:
                 logger.error(f"Error executing tool {name}: {e}")
@@ -289,8 +214,116 @@ class PayUFinanceMCPServer:
                     )]
                 )
     
+    @staticmethod
+    def _format_search_users(body, arguments):
+        users = body["users"]
+        search_term = body["search_term"]
+        if users:
+            result_text = f"Found {len(users)} users matching '{search_term}':\n\n"
+            for i, user in enumerate(users, 1):
+                result_text += f"{i}. User ID: {user.get('id', 'N/A')}\n"
+                result_text += f"   Name: {user.get('name', 'N/A')}\n"
+                result_text += f"   Phone: {user.get('phone_id', 'N/A')}\n"
+                result_text += f"   Email: {user.get('email_id', 'N/A')}\n"
+                result_text += f"   Customer ID: {user.get('customer_id', 'N/A')}\n\n"
+        else:
+            result_text = f"No users found matching '{search_term}'\n"
+        narrowing = body.get("search_narrowed")
+        if narrowing is not None:
+            result_text += (f"Broad name search narrowed: {narrowing['strategy']} match"
+                            f"{', at most %d rows' % narrowing['row_cap'] if narrowing['row_cap'] else ''}"
+                            f" (about {narrowing['estimated_rows']} users estimated).\n")
+        return result_text
+    
+    @staticmethod
+    def _format_user_details(body, arguments):
+        result_text = f"User Details for ID {body['user_id']}:\n\n"
+        result_text += "Header Information:\n"
+        for key, value in (body["header_details"] or {}).items():
+            result_text += f"  {key}: {value}\n"
+        
+        result_text += "\nAdditional Information:\n"
+        for key, value in (body["additional_info"] or {}).items():
+            result_text += f"  {key}: {value}\n"
+        return result_text
+    
+    @staticmethod
+    def _format_kyc_info(body, arguments):
+        result_text = f"KYC Information for User {body['user_id']}:\n\n"
+        # Not loaded (live mode, no status field named) is left out, unlike a missing record
+        kyc_status = body.get("kyc_status")
+        if kyc_status is not None:
+            for key, value in kyc_status.items():
+                result_text += f"{key}: {value}\n"
+            result_text += "\n" if kyc_status else "KYC Status: no record found\n\n"
+        # Sections that were not requested are left out of the summary rather than reported empty
+        summary = body["summary"]
+        if "pan_records" in summary:
+            result_text += f"PAN Information: {summary['pan_records']} records found\n"
+        if "has_aadhaar_kyc" in summary:
+            result_text += f"Aadhaar KYC: {'found' if summary['has_aadhaar_kyc'] else 'not found'}\n"
+        if "has_ckyc" in summary:
+            result_text += f"CKYC Information: {'found' if summary['has_ckyc'] else 'not found'}\n"
+        result_text += "\n"
+        
+        # Add detailed info if available
+        pan_info = body["pan_info"] or []
+        if pan_info:
+            result_text += "PAN Details:\n"
+            for pan in pan_info:
+                result_text += f"  PAN: {pan.get('number', 'N/A')}\n"
+                result_text += f"  Status: {pan.get('status_text', 'N/A')}\n"
+        return result_text
+    
+    @staticmethod
+    def _format_aml_status(body, arguments):
+        result_text = f"AML Status for User {body['user_id']}:\n\n"
+        aml_details = body["aml_details"]
+        if aml_details:
+            for key, value in aml_details.items():
+                if key == "alerts" and isinstance(value, list):
+                    result_text += f"  alerts: {len(value)} shown\n"
+                else:
+                    result_text += f"  {key}: {value}\n"
+        else:
+            result_text += "No AML records found\n"
+        return result_text
+    
+    @staticmethod
+    def _format_address(body, arguments):
+        result_text = f"Address Information for User {body['user_id']}:\n\n"
+        addresses = [addr for addr in (body["addresses"] or {}).values() if addr]
+        if addresses:
+            for addr in addresses:
+                result_text += f"Address Type: {addr.get('address_type', 'N/A')}\n"
+                result_text += f"Address: {addr.get('line1', 'N/A')}\n"
+                result_text += f"City: {addr.get('city', 'N/A')}\n"
+                result_text += f"State: {addr.get('state', 'N/A')}\n"
+                result_text += f"Postal Code: {addr.get('postal_code_id', 'N/A')}\n\n"
+        else:
+            result_text += "No address records found\n"
+        return result_text
+    
+    @staticmethod
+    def _format_truncation(body):
+        """What was cut to fit the tool's budget, and how to ask for the rest"""
+        truncation = body.get("truncation")
+        if not truncation:
+            return ""
+        result_text = "\nResult truncated:\n"
+        for parameter, value in truncation.get("continuation", {}).items():
+            if parameter == "fields":
+                result_text += f"  Large values omitted; name them in 'fields' to include them: {', '.join(value)}\n"
+            else:
+                result_text += f"  More rows: call again with {parameter}={value}\n"
+        for section in truncation.get("dropped_rows", {}):
+            result_text += f"  Rows dropped from {section} to fit the size limit\n"
+        return result_text
+    
     async def cleanup(self):
         """Cleanup database connections"""
+        if self.tools:
+            self.tools.shutdown()
         if self.db_connector:
             self.db_connector.close()
             logger.info("Database connection closed")
@@ -0,0 +1,518 @@
+# File: metrics.py - In-process metrics in the Prometheus text format
+"""
+GET /metrics on both servers. Counters and histograms are plain dicts of
+floats behind one lock per metric, updated once per request; gauges (pool,
+caches, index) and the per-statement numbers from db/query_stats.py are
+read only when /metrics is scraped.
+
+Per request, a RequestTimings object in a context variable collects the
+time spent in SQL (engine cursor events, see attach_db_timer) and in
+serialisation (encoding, compression), so each route reports total
+latency split into DB and serialisation time:
+
+    payu_http_requests_total{route,method,status}
+    payu_http_request_errors_total{route}            5xx responses
+    payu_http_request_duration_seconds{route}        histogram
+    payu_http_request_db_seconds{route}              histogram
+    payu_http_response_serialize_seconds{route}      histogram
+    payu_orchestrator_phase_seconds{phase}           prompt, llm, parse, tools, total
+    payu_admission_*                                 slots, queue and shed requests (admission.py)
+    payu_db_pool_*, payu_result_cache_*, payu_identifier_index_*, payu_db_statement_*
+
+Routes are labelled by their path for the known routes and "other" for
+anything else, so label cardinality stays fixed.
+
+Under gunicorn or uvicorn --workers a scrape lands on any one worker, so
+the numbers of every worker on the host are merged (SharedMetrics): each
+worker writes its samples to a file in a shared directory every few
+seconds, and the worker answering /metrics sums the counters and
+histograms of all of them. Files of workers that exited are folded into
+an archive so totals never go down while the server runs. Gauges
+describe one process and are reported per live worker with a `worker`
+(pid) label.
+"""
+
+import contextvars
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from db.engine_events import EngineListeners
+from db.query_stats import LATENCY_BUCKETS_MS, query_stats
+from tool_service import TOOL_NAMES
+
+logger = logging.getLogger("payu-fin-metrics")
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_SHARED_DIRECTORY = os.path.join(tempfile.gettempdir(), f"payu-metrics-{os.getuid()}")
+
+# Seconds; orchestrator calls wait tens of seconds on the LLM
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+KNOWN_ROUTES = frozenset(
+    ['/health', '/livez', '/readyz', '/metrics', '/api/traces', '/api/tools', '/api/tools/batch',
+     '/api/orchestrator/complex', '/api/orchestrator/stream', '/api/orchestrator/jobs']
+    + [f'/api/tools/{name}' for name in TOOL_NAMES]
+)
+
+
+def route_label(path: str) -> str:
+    return path if path in KNOWN_ROUTES else 'other'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def family(self) -> Dict[str, Any]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return _family(self.name, self.help, 'counter',
+                       [(f'{self.name}{_labels(self.labelnames, labels)}', value) for labels, value in values])
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def family(self) -> Dict[str, Any]:
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        samples = []
+        for labels, (counts, total, count) in series:
+            samples += histogram_samples(self.name, self.labelnames, labels, self.buckets, counts, total, count)
+        return _family(self.name, self.help, 'histogram', samples)
+
+
+def histogram_samples(name, labelnames, labels, buckets, counts, total, count) -> List[Tuple[str, float]]:
+    """Cumulative _bucket samples plus _sum and _count from per-bucket counts"""
+    samples = []
+    cumulative = 0
+    for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+        cumulative += bucket_count
+        le = 'le="%s"' % (bound if bound == '+Inf' else _number(bound))
+        samples.append((f'{name}_bucket{_labels(labelnames, labels, le)}', cumulative))
+    samples.append((f'{name}_sum{_labels(labelnames, labels)}', total))
+    samples.append((f'{name}_count{_labels(labelnames, labels)}', count))
+    return samples
+
+
+def _family(name: str, help_text: str, kind: str, samples: List[Tuple[str, float]]) -> Dict[str, Any]:
+    """One metric: samples are (name + label string, value)"""
+    return {"name": name, "help": help_text, "type": kind, "samples": [list(sample) for sample in samples]}
+
+
+def _gauge(name: str, help_text: str, samples: Iterable[Tuple[str, float]], kind: str = 'gauge') -> List[Dict[str, Any]]:
+    """A metric read at scrape time; samples are (label string, value)"""
+    samples = list(samples)
+    if not samples:
+        return []
+    return [_family(name, help_text, kind, [(f'{name}{labels}', value) for labels, value in samples])]
+
+
+def render_families(families: List[Dict[str, Any]]) -> str:
+    lines = []
+    for family in families:
+        lines += [f'# HELP {family["name"]} {family["help"]}', f'# TYPE {family["name"]} {family["type"]}']
+        lines += [f'{key} {_number(value)}' for key, value in family["samples"]]
+    return '\n'.join(lines) + '\n'
+
+
+def _with_worker(key: str, pid: int) -> str:
+    name, brace, labels = key.partition('{')
+    return f'{name}{{worker="{pid}"' + (f',{labels}' if brace else '}')
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedMetrics:
+    """
+    The metrics of every worker process on the host, through per-worker
+    files in one directory. The directory is scoped to the parent process
+    (the gunicorn/uvicorn master), so a restarted server starts from zero
+    while a graceful reload keeps counting.
+    """
+
+    ARCHIVE = 'archive.json'
+
+    def __init__(self, collect: Callable[[], List[Dict[str, Any]]], directory: str = DEFAULT_SHARED_DIRECTORY,
+                 flush_interval: float = 5.0):
+        self.collect = collect
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._remove_stale_servers(directory)
+        self.directory = os.path.join(directory, f"server-{os.getppid()}")
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self.path = os.path.join(self.directory, f"worker-{self.pid}.json")
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        with self._locked():
+            # A file under our pid is a dead predecessor's; keep its counts
+            self._archive_dead([self.path] if os.path.exists(self.path) else [])
+        self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _remove_stale_servers(directory: str):
+        for name in os.listdir(directory):
+            if name.startswith('server-') and name[len('server-'):].isdigit() \
+                    and not _pid_alive(int(name[len('server-'):])):
+                server_dir = os.path.join(directory, name)
+                for file_name in os.listdir(server_dir):
+                    try:
+                        os.remove(os.path.join(server_dir, file_name))
+                    except OSError:
+                        pass
+                try:
+                    os.rmdir(server_dir)
+                except OSError:
+                    pass
+
+    @contextmanager
+    def _locked(self):
+        """Serialises scrapes of the host's workers, so an exited worker is archived exactly once"""
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, path: str, data: Dict[str, Any]):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def flush(self) -> List[Dict[str, Any]]:
+        # Collected and written under one lock, so the file never goes back to older counts
+        with self._flush_lock:
+            families = self.collect()
+            self._write(self.path, {"pid": self.pid, "families": families})
+        return families
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Could not write shared metrics: {e}")
+
+    def stop(self):
+        """Final flush on worker exit; the counts are archived by the next scrape"""
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning(f"Could not write shared metrics: {e}")
+
+    def _archive_dead(self, paths: List[str]):
+        """Add the counters and histograms of exited workers to the archive (lock held)"""
+        if not paths:
+            return
+        archive_path = os.path.join(self.directory, self.ARCHIVE)
+        archive = self._read(archive_path) or {"families": []}
+        families = archive["families"]
+        for path in paths:
+            data = self._read(path)
+            if data is not None:
+                families = _merge_totals([families, data["families"]])
+        self._write(archive_path, {"families": families})
+        for path in paths:
+            os.remove(path)
+
+    def merged(self) -> List[Dict[str, Any]]:
+        """This worker's current families merged with every other worker's last flush"""
+        # Flushed first: if this worker dies before its next flush, later scrapes must not see
+        # smaller counts than this one did (Prometheus would read that as a counter reset)
+        own = self.flush()
+        with self._locked():
+            workers = {self.pid: own}
+            dead = []
+            for name in os.listdir(self.directory):
+                if not (name.startswith('worker-') and name.endswith('.json')):
+                    continue
+                path = os.path.join(self.directory, name)
+                data = self._read(path)
+                if data is None or data["pid"] == self.pid:
+                    continue
+                if _pid_alive(data["pid"]):
+                    workers[data["pid"]] = data["families"]
+                else:
+                    dead.append(path)
+            self._archive_dead(dead)
+            archive = self._read(os.path.join(self.directory, self.ARCHIVE)) or {"families": []}
+
+        totals = _merge_totals([archive["families"]] + list(workers.values()))
+        gauges: Dict[str, Dict[str, Any]] = {}
+        for pid, families in sorted(workers.items()):
+            for family in families:
+                if family["type"] != 'gauge':
+                    continue
+                merged = gauges.setdefault(family["name"], dict(family, samples=[]))
+                merged["samples"] += [[_with_worker(key, pid), value] for key, value in family["samples"]]
+        order = [family["name"] for family in own]
+        merged_families = {family["name"]: family for family in totals + list(gauges.values())}
+        names = order + sorted(name for name in merged_families if name not in order)
+        return [merged_families[name] for name in names if name in merged_families]
+
+
+def _merge_totals(family_lists: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Sum the counter and histogram samples of several processes (gauges are left out)"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for families in family_lists:
+        for family in families:
+            if family["type"] == 'gauge':
+                continue
+            target = merged.setdefault(family["name"], dict(family, samples={}))
+            for key, value in family["samples"]:
+                target["samples"][key] = target["samples"].get(key, 0) + value
+    return [dict(family, samples=[[key, value] for key, value in family["samples"].items()])
+            for family in merged.values()]
+
+
+class RequestTimings:
+    __slots__ = ('db_seconds', 'serialize_seconds')
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+
+
+_current_timings: contextvars.ContextVar = contextvars.ContextVar('payu_request_timings', default=None)
+
+
+def add_serialize_time(seconds: float):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.serialize_seconds += seconds
+
+
+class Metrics:
+    """The server's metrics; one per process, merged across workers by SharedMetrics when configured"""
+
+    def __init__(self):
+        self.requests = Counter('payu_http_requests_total', 'HTTP requests', ('route', 'method', 'status'))
+        self.errors = Counter('payu_http_request_errors_total', 'HTTP requests answered with 5xx', ('route',))
+        self.duration = Histogram('payu_http_request_duration_seconds', 'Request latency', ('route',))
+        self.db_time = Histogram('payu_http_request_db_seconds', 'SQL time per request', ('route',))
+        self.serialize_time = Histogram('payu_http_response_serialize_seconds',
+                                        'Response encoding and compression time per request', ('route',))
+        self.orchestrator_phases = Histogram('payu_orchestrator_phase_seconds',
+                                             'Orchestrator time per phase', ('phase',))
+        self._db_listeners = EngineListeners()
+        self.shared: Optional[SharedMetrics] = None
+
+    def configure(self, cfg: Optional[Dict[str, Any]], sources: Callable[[], Dict[str, Any]]):
+        """
+        Apply the connection's `metrics` section; sources() returns the
+        engine/tools/admission keyword arguments for families()
+        """
+        cfg = cfg or {}
+        if cfg.get('share_across_workers', True):
+            self.shared = SharedMetrics(lambda: self.families(**sources()),
+                                        cfg.get('directory') or DEFAULT_SHARED_DIRECTORY,
+                                        float(cfg.get('flush_interval_seconds', 5)))
+
+    def shutdown(self):
+        if self.shared:
+            self.shared.stop()
+
+    def attach_db_timer(self, engine):
+        """Add each statement's time to the current request (engine = the sync engine)"""
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_start_time', []).append(time.perf_counter())
+
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['metrics_start_time'].pop()
+            timings = _current_timings.get()
+            if timings is not None:
+                timings.db_seconds += elapsed
+
+        def _error(exception_context):
+            conn = exception_context.connection
+            if conn is not None and conn.info.get('metrics_start_time'):
+                conn.info['metrics_start_time'].pop()
+
+        self._db_listeners.attach(engine, {
+            'before_cursor_execute': _before,
+            'after_cursor_execute': _after,
+            'handle_error': _error,
+        })
+
+    def start_request(self):
+        """Begin collecting timings for the current request; returns a token for finish_request"""
+        return _current_timings.set(RequestTimings()), time.perf_counter()
+
+    def finish_request(self, token, path: str, method: str, status: int):
+        context_token, started = token
+        elapsed = time.perf_counter() - started
+        timings = _current_timings.get()
+        _current_timings.reset(context_token)
+        route = route_label(path)
+        self.requests.inc((route, method, str(status)))
+        if status >= 500:
+            self.errors.inc((route,))
+        self.duration.observe((route,), elapsed)
+        if timings is not None:
+            self.db_time.observe((route,), timings.db_seconds)
+            self.serialize_time.observe((route,), timings.serialize_seconds)
+
+    def observe_phase(self, phase: str, seconds: float):
+        self.orchestrator_phases.observe((phase,), seconds)
+
+    def families(self, engine=None, tools=None, admission=None) -> List[Dict[str, Any]]:
+        """This process's metrics; engine, tools (ToolService) and admission supply the scrape-time ones"""
+        families = [metric.family() for metric in (self.requests, self.errors, self.duration, self.db_time,
+                                                    self.serialize_time, self.orchestrator_phases)]
+        if engine is not None:
+            families += _pool_lines(engine)
+        if tools is not None:
+            families += _cache_lines(tools)
+        if admission is not None:
+            families += _admission_lines(admission)
+        families += _statement_lines()
+        return families
+
+    def render(self, engine=None, tools=None, admission=None) -> str:
+        """
+        Exposition text for the host when shared across workers (the
+        configured sources supply the scrape-time metrics), else for this process
+        """
+        if self.shared:
+            return render_families(self.shared.merged())
+        return render_families(self.families(engine, tools, admission))
+
+
+def _pool_lines(engine) -> List[Dict[str, Any]]:
+    pool = getattr(engine, 'sync_engine', engine).pool
+    if not all(hasattr(pool, attr) for attr in ('size', 'checkedout', 'checkedin', 'overflow')):
+        return []
+    return (_gauge('payu_db_pool_size', 'Configured pool size', [('', pool.size())])
+            + _gauge('payu_db_pool_checked_out', 'Connections in use', [('', pool.checkedout())])
+            + _gauge('payu_db_pool_checked_in', 'Idle pooled connections', [('', pool.checkedin())])
+            + _gauge('payu_db_pool_overflow', 'Connections beyond pool_size (negative: not yet opened)',
+                     [('', pool.overflow())]))
+
+
+def _cache_lines(tools) -> List[Dict[str, Any]]:
+    lines = []
+    if tools.user_cache is not None:
+        stats = tools.user_cache.stats()
+        lines += _gauge('payu_result_cache_hits_total', 'Result cache hits', [('', stats['hits'])], 'counter')
+        lines += _gauge('payu_result_cache_misses_total', 'Result cache misses', [('', stats['misses'])], 'counter')
+        lines += _gauge('payu_result_cache_invalidations_total', 'Result cache invalidations',
+                        [('', stats['invalidations'])], 'counter')
+        lines += _gauge('payu_result_cache_entries', 'Result cache entries', [('', stats['entries'])])
+        lines += _gauge('payu_result_cache_hit_ratio', 'Result cache hit ratio since start', [('', stats['hit_ratio'])])
+    if tools.identifier_index is not None:
+        stats = tools.identifier_index.stats()
+        lines += _gauge('payu_identifier_index_ready', 'Identifier index built', [('', 1 if stats['ready'] else 0)])
+        if stats['ready']:
+            lines += _gauge('payu_identifier_index_identifiers', 'Identifiers in the index', [('', stats['identifiers'])])
+            lines += _gauge('payu_identifier_index_age_seconds', 'Seconds since the last refresh',
+                            [('', stats['age_seconds'])])
+    return lines
+
+
+def _admission_lines(admission) -> List[Dict[str, Any]]:
+    stats = admission.stats()
+    return (_gauge('payu_admission_in_flight', 'Admission slots held', [('', stats['in_flight'])])
+            + _gauge('payu_admission_limit', 'Admission slots available', [('', stats['max_concurrent'])])
+            + _gauge('payu_admission_queued', 'Requests waiting for a slot',
+                     [(_labels(('priority',), (priority,)), stats[f'queued_{priority}'])
+                      for priority in ('interactive', 'bulk')])
+            + _gauge('payu_admission_admitted_total', 'Requests admitted', [('', stats['admitted'])], 'counter')
+            + _gauge('payu_admission_rejected_total', 'Requests shed with 429/503',
+                     [(_labels(('reason',), (reason,)), count) for reason, count in sorted(stats['rejected'].items())],
+                     'counter'))
+
+
+def _statement_lines() -> List[Dict[str, Any]]:
+    """Per-fingerprint numbers from db/query_stats.py (present when query_log is enabled)"""
+    snapshot = query_stats.snapshot()
+    if not snapshot:
+        return []
+    name = 'payu_db_statement_duration_seconds'
+    buckets = tuple(bound / 1000 for bound in LATENCY_BUCKETS_MS)
+    samples = []
+    for item in snapshot:
+        samples += histogram_samples(name, ('fingerprint',), (item['fingerprint'],), buckets,
+                                     list(item['histogram'].values()), item['total_ms'] / 1000, item['count'])
+    lines = [_family(name, 'Statement latency by fingerprint', 'histogram', samples)]
+    lines += _gauge('payu_db_statement_errors_total', 'Statement errors by fingerprint',
+                    [(_labels(('fingerprint',), (item['fingerprint'],)), item['errors']) for item in snapshot],
+                    'counter')
+    lines += _gauge('payu_db_statement_rows_total', 'Rows returned or affected by fingerprint',
+                    [(_labels(('fingerprint',), (item['fingerprint'],)), item['rows']) for item in snapshot],
+                    'counter')
+    return lines
+
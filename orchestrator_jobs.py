@@ -0,0 +1,330 @@
+# File: orchestrator_jobs.py - Submit/poll jobs for orchestrator queries
+"""
+POST /api/orchestrator/jobs queues an orchestrator query and answers 202
+at once; the query runs on a bounded worker pool instead of the request
+thread, so long LLM waits no longer pin HTTP workers and orchestrator
+concurrency is set independently of the server's thread count:
+
+    POST   /api/orchestrator/jobs              {"query", "execution_mode"} -> 202 + Location
+    GET    /api/orchestrator/jobs/<job_id>     status, progress so far, result when finished
+    DELETE /api/orchestrator/jobs/<job_id>     cancel
+
+Job states: queued -> running -> succeeded | failed | cancelled. A queued
+job is cancelled before it starts; a running one stops at its next phase
+or step boundary (the LLM wait is bounded by the conversation timeout).
+On the asyncio server a running job's task is cancelled at once; in its
+tool phase the job finishes (cancelled) when the step in flight is done.
+
+Job state lives in one JSON file per job under `directory`, so any worker
+process on the host can answer a poll or take a cancel for a job another
+worker runs. Each worker runs its own pool of max_workers; beyond
+max_queued waiting jobs in a worker, submissions get 503 with
+Retry-After. Finished jobs are deleted ttl_seconds after they finish.
+
+A finished job's file holds the full orchestrator result, i.e. customer
+KYC/PAN data and Aadhaar photos. The directory is therefore private to
+the server's user (0700, files 0600, checked at start) and by default
+lives under the system temp directory, not under logs/ where log
+shippers and support bundles pick files up. Keep ttl_seconds short.
+
+Configured per connection in config/databases.yaml:
+
+    orchestrator_jobs:
+      directory: /var/lib/payu-fin-tools/jobs   # default: <tmp>/payu-orchestrator-jobs-<uid>
+      max_workers: 4
+      max_queued: 50
+      ttl_seconds: 600
+"""
+
+import asyncio
+import datetime
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from http_json import json_encoder, json_loads
+
+logger = logging.getLogger("payu-fin-tools")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), f"payu-orchestrator-jobs-{os.getuid()}")
+_encode = json_encoder()
+
+
+class JobCancelled(Exception):
+    """Raised from the progress callback to stop a running job at the next boundary"""
+
+
+class JobQueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Too many orchestrator jobs waiting")
+        self.retry_after = retry_after
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class JobStore:
+    """One JSON file per job, readable by the server's user only; writes are atomic (temp file + rename)"""
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # Raises for a directory this user does not own (e.g. planted in a shared /tmp)
+        os.chmod(directory, 0o700)
+
+    @staticmethod
+    def _create(path: str):
+        return os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb')
+
+    def _path(self, job_id: str, suffix: str = '.json') -> str:
+        return os.path.join(self.directory, job_id + suffix)
+
+    def save(self, job: Dict[str, Any]):
+        path = self._path(job['job_id'])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._create(tmp_path) as f:
+            f.write(_encode(job))
+        os.replace(tmp_path, path)
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not _JOB_ID_RE.match(job_id):
+            return None
+        try:
+            with open(self._path(job_id), 'rb') as f:
+                return json_loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def request_cancel(self, job_id: str):
+        self._create(self._path(job_id, '.cancel')).close()
+
+    def cancel_requested(self, job_id: str) -> bool:
+        return os.path.exists(self._path(job_id, '.cancel'))
+
+    def purge(self, ttl_seconds: float):
+        """Delete jobs that finished more than ttl_seconds ago"""
+        cutoff = time.time() - ttl_seconds
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                job = self.load(name[:-len('.json')])
+                if job is not None and job['status'] in FINISHED:
+                    os.remove(path)
+                    if os.path.exists(self._path(job['job_id'], '.cancel')):
+                        os.remove(self._path(job['job_id'], '.cancel'))
+            except (OSError, ValueError):
+                continue
+
+
+class _JobManagerBase:
+    """Job records and state changes; the subclasses run jobs on threads or asyncio tasks"""
+
+    def __init__(self, run_query, store: JobStore, max_workers: int = 4, max_queued: int = 50,
+                 ttl_seconds: float = 600):
+        # run_query(query, execution_mode, on_event) -> result body (a coroutine function on the async server)
+        self.run_query = run_query
+        self.store = store
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.ttl_seconds = ttl_seconds
+        # Jobs this process accepted and has not finished
+        self._local: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # Moving average of job run time, for Retry-After
+        self._job_seconds = 30.0
+
+    @classmethod
+    def from_config(cls, db_cfg, run_query):
+        cfg = db_cfg.get('orchestrator_jobs') or {}
+        return cls(
+            run_query,
+            JobStore(cfg.get('directory', DEFAULT_DIRECTORY)),
+            max_workers=cfg.get('max_workers', 4),
+            max_queued=cfg.get('max_queued', 50),
+            ttl_seconds=cfg.get('ttl_seconds', 600),
+        )
+
+    def _new_job(self, query: str, execution_mode: Optional[str]) -> Dict[str, Any]:
+        self.store.purge(self.ttl_seconds)
+        with self._lock:
+            queued = sum(1 for job in self._local.values() if job['status'] == QUEUED)
+            if queued >= self.max_queued:
+                retry_after = math.ceil(self._job_seconds * (queued + 1) / max(1, self.max_workers))
+                raise JobQueueFull(min(300, max(1, retry_after)))
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "status": QUEUED,
+                "query": query,
+                "execution_mode": execution_mode,
+                "created_at": _now(),
+                "started_at": None,
+                "finished_at": None,
+                "progress": [],
+                "result": None,
+                "error": None,
+            }
+            self._local[job['job_id']] = job
+        self.store.save(job)
+        return job
+
+    def _start(self, job: Dict[str, Any]) -> bool:
+        """Mark the job running; False when it was cancelled while queued"""
+        if self.store.cancel_requested(job['job_id']):
+            self._finish(job, CANCELLED, error="Cancelled before it started")
+            return False
+        job['status'] = RUNNING
+        job['started_at'] = _now()
+        job['_started'] = time.perf_counter()
+        self.store.save(self._public(job))
+        return True
+
+    def _record_event(self, job: Dict[str, Any], event: str, data: Dict[str, Any]):
+        """Progress callback for the orchestrator: keep a summary of the event, stop if cancelled"""
+        if self.store.cancel_requested(job['job_id']):
+            raise JobCancelled(f"Job {job['job_id']} cancelled")
+        # Step results are in the final result; progress keeps the file small
+        summary = {key: value for key, value in data.items() if key != 'result'}
+        job['progress'].append(dict(summary, event=event, at=_now()))
+        self.store.save(self._public(job))
+
+    def _finish(self, job: Dict[str, Any], status: str, result: Any = None, error: Optional[str] = None):
+        if job['status'] in FINISHED:
+            # Already abandoned at shutdown
+            return
+        job['status'] = status
+        job['result'] = result
+        job['error'] = error
+        job['finished_at'] = _now()
+        started = job.pop('_started', None)
+        if started is not None:
+            self._job_seconds = 0.8 * self._job_seconds + 0.2 * (time.perf_counter() - started)
+        self.store.save(job)
+        with self._lock:
+            self._local.pop(job['job_id'], None)
+
+    def _complete(self, job: Dict[str, Any], result: Dict[str, Any]):
+        if self.store.cancel_requested(job['job_id']):
+            self._finish(job, CANCELLED, result, "Cancelled while running")
+        elif result.get('success'):
+            self._finish(job, SUCCEEDED, result)
+        else:
+            self._finish(job, FAILED, result, result.get('error'))
+
+    @staticmethod
+    def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in job.items() if not key.startswith('_')}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.load(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Request cancellation; returns the job as it stands (None when unknown)"""
+        job = self.store.load(job_id)
+        if job is None or job['status'] in FINISHED:
+            return job
+        self.store.request_cancel(job_id)
+        return dict(job, cancel_requested=True)
+
+    def _abandon_local_jobs(self):
+        """Worker exit: jobs it accepted will never finish"""
+        with self._lock:
+            jobs = list(self._local.values())
+        for job in jobs:
+            self._finish(job, FAILED, error="Server shut down before the job finished")
+
+
+class JobManager(_JobManagerBase):
+    """For the threaded Flask server: jobs run on a ThreadPoolExecutor"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="orchestrator-job")
+
+    def submit(self, query: str, execution_mode: Optional[str] = None) -> Dict[str, Any]:
+        job = self._new_job(query, execution_mode)
+        self._pool.submit(self._run, job)
+        return self._public(job)
+
+    def _run(self, job: Dict[str, Any]):
+        if not self._start(job):
+            return
+        try:
+            result = self.run_query(job['query'], job['execution_mode'],
+                                    lambda event, data: self._record_event(job, event, data))
+        except Exception as e:
+            logger.error(f"❌ Orchestrator job {job['job_id']} failed: {e}")
+            self._finish(job, FAILED, error=str(e))
+            return
+        self._complete(job, result)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._abandon_local_jobs()
+
+
+class AsyncJobManager(_JobManagerBase):
+    """For the asyncio server: jobs are tasks, max_workers of them running at once"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._semaphore = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def submit(self, query: str, execution_mode: Optional[str] = None) -> Dict[str, Any]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        job = self._new_job(query, execution_mode)
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job['job_id']] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job['job_id'], None))
+        return self._public(job)
+
+    async def _run(self, job: Dict[str, Any]):
+        try:
+            async with self._semaphore:
+                if not self._start(job):
+                    return
+                result = await self.run_query(job['query'], job['execution_mode'],
+                                              lambda event, data: self._record_event(job, event, data))
+        except asyncio.CancelledError:
+            self._finish(job, CANCELLED, error="Cancelled")
+            return
+        except Exception as e:
+            logger.error(f"❌ Orchestrator job {job['job_id']} failed: {e}")
+            self._finish(job, FAILED, error=str(e))
+            return
+        self._complete(job, result)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = super().cancel(job_id)
+        task = self._tasks.get(job_id)
+        if task is not None:
+            # Owned by this worker: stop it now rather than at the next boundary. A job in its
+            # tool phase is only marked cancelled once the step loop's worker thread has stopped
+            # using its connection (the server's step runner waits for it before re-raising)
+            task.cancel()
+        return job
+
+    async def shutdown(self):
+        self._abandon_local_jobs()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        # Let running step loops stop before the server disposes of the connection pool
+        await asyncio.gather(*tasks, return_exceptions=True)
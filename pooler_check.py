@@ -0,0 +1,127 @@
+# File: pooler_check.py - Verify the repository is safe behind PgBouncer in transaction mode
+"""
+Runs every repository call from config/query_plans.yaml through a
+connection configured with `pooler: {mode: transaction, strict: true}`
+(e.g. fixture_pgbouncer, a local PgBouncer using config/pgbouncer.ini in
+front of the fixture database) and checks that:
+
+  * no statement trips the transaction-pooling guard (db/pooler.py),
+  * many more client connections than server backends can run the calls
+    concurrently,
+  * no session state is left behind on the server backends: every setting
+    touched by a session profile is back at its reset value and no named
+    prepared statements exist.
+
+Usage:
+    pgbouncer config/pgbouncer.ini &
+    python pooler_check.py --connection fixture_pgbouncer --workers 40
+"""
+
+import argparse
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+
+from db.base_connector import load_db_config
+from db.pooler import PoolerSafetyError
+from db.postgres_connector import PostgresConnector
+from db.session_profiles import get_session_profiles
+from query_plan_check import DEFAULT_CASES_PATH, load_cases
+import repository.user_repository as user_repository
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("payu-fin-pooler-check")
+
+LEAK_CHECK_SQL = """
+    SELECT name, setting, reset_val
+    FROM pg_settings
+    WHERE name = ANY(:names) AND setting IS DISTINCT FROM reset_val
+"""
+
+
+def run_cases(connector: PostgresConnector, cases: List[Dict[str, Any]], workers: int, rounds: int):
+    """Run every case `rounds` times from `workers` threads; returns (errors, backend pids seen)"""
+    errors = []
+    backends = set()
+    lock = threading.Lock()
+
+    def run(case):
+        try:
+            with connector.get_conn() as conn:
+                func = getattr(user_repository, case['function'])
+                func(conn, **case.get('args', {}))
+                pid = conn.execute(text("SELECT pg_backend_pid()")).scalar()
+                conn.rollback()
+            with lock:
+                backends.add(pid)
+        except Exception as e:
+            with lock:
+                errors.append((case['name'], type(e).__name__, str(e)))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(run, [case for _ in range(rounds) for case in cases]))
+    return errors, backends
+
+
+def find_leaks(connector: PostgresConnector, samples: int) -> List[str]:
+    """Sample server backends for settings or prepared statements left over from earlier transactions"""
+    names = sorted({setting for settings in get_session_profiles(connector.engine).values() for setting in settings})
+    leaks = []
+    for _ in range(samples):
+        with connector.get_conn() as conn:
+            pid = conn.execute(text("SELECT pg_backend_pid()")).scalar()
+            for row in conn.execute(text(LEAK_CHECK_SQL), {"names": names}):
+                leaks.append(f"backend {pid}: {row.name} = {row.setting} (reset value {row.reset_val})")
+            prepared = conn.execute(text("SELECT count(*) FROM pg_prepared_statements")).scalar()
+            if prepared:
+                leaks.append(f"backend {pid}: {prepared} named prepared statements")
+            conn.rollback()
+    return leaks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check repository queries under transaction pooling")
+    parser.add_argument('--connection', default='fixture_pgbouncer')
+    parser.add_argument('--cases', default=DEFAULT_CASES_PATH)
+    parser.add_argument('--workers', type=int, default=40, help="Concurrent client connections")
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--leak-samples', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    env, db_conns = load_db_config()
+    db_cfg = dict(db_conns[args.connection])
+    # Enough client connections to outnumber the bouncer's server pool
+    db_cfg['pooler'] = dict(db_cfg.get('pooler') or {}, pool_size=args.workers, max_overflow=0)
+    connector = PostgresConnector(db_cfg, environment=env)
+    if not connector.transaction_pooling:
+        print(f"❌ {args.connection} is not configured with pooler.mode: transaction")
+        return 2
+
+    cases = load_cases(args.cases).get('cases', [])
+    try:
+        errors, backends = run_cases(connector, cases, args.workers, args.rounds)
+        leaks = find_leaks(connector, args.leak_samples)
+    finally:
+        connector.engine.dispose()
+        connector.close()
+
+    print(f"📊 {len(cases) * args.rounds} calls from {args.workers} client connections "
+          f"on {len(backends)} server backends")
+    unsafe = [e for e in errors if e[1] == PoolerSafetyError.__name__]
+    for name, kind, message in errors:
+        print(f"   ❌ {name}: {kind}: {message}")
+    for leak in leaks:
+        print(f"   ❌ session state leak: {leak}")
+    if errors or leaks:
+        print(f"❌ {len(unsafe)} unsafe statements, {len(errors) - len(unsafe)} other errors, {len(leaks)} leaks")
+        return 1
+    print("✅ Safe under transaction pooling")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# File: query_plan_check.py - Capture and compare Postgres plans for every repository query
+"""
+Runs every statement issued by repository/user_repository.py under
+EXPLAIN (ANALYZE, BUFFERS) against a fixture database, stores the plans
+as JSON and flags regressions between two captures.
+
+Usage:
+    python query_plan_check.py capture --label v2.0.0
+    python query_plan_check.py compare query_plans/v2.0.0.json query_plans/v2.1.0.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import yaml
+from sqlalchemy import text
+
+from db.base_connector import load_db_config
+from db.postgres_connector import PostgresConnector
+from db.query_stats import fingerprint_statement
+from repository.search_guard import SearchGuard
+import repository.user_repository as user_repository
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("payu-fin-query-plans")
+
+DEFAULT_CASES_PATH = 'config/query_plans.yaml'
+DEFAULT_OUTPUT_DIR = 'query_plans'
+
+
+class PlanCapturingConnection:
+    """
+    Connection proxy that records the EXPLAIN plan of every repository
+    statement before running it. Session profile set_config calls and the
+    search guard's own EXPLAINs are passed through uncaptured. Captures are
+    keyed by case and statement fingerprint, so adding or dropping a
+    statement doesn't shift the keys of the others.
+    """
+
+    def __init__(self, conn, case_name: str, analyze: bool = True):
+        self._conn = conn
+        self.case_name = case_name
+        self.analyze = analyze
+        self.plans: List[Dict[str, Any]] = []
+        self._seen: Dict[str, int] = {}
+
+    @staticmethod
+    def _is_captured(statement, sql: str) -> bool:
+        options = getattr(statement, 'get_execution_options', lambda: {})()
+        if options.get('session_profile'):
+            return False
+        return not sql.lstrip().upper().startswith('EXPLAIN')
+
+    def _key(self, sql: str) -> str:
+        key = f"{self.case_name}:{fingerprint_statement(sql)}"
+        # The same statement twice in one case (e.g. once per PAN) gets #2, #3, ...
+        self._seen[key] = self._seen.get(key, 0) + 1
+        return key if self._seen[key] == 1 else f"{key}#{self._seen[key]}"
+
+    def execute(self, statement, parameters=None, *args, **kwargs):
+        sql = getattr(statement, 'text', str(statement))
+        if not self._is_captured(statement, sql):
+            return self._conn.execute(statement, parameters, *args, **kwargs)
+        options = "ANALYZE, BUFFERS, FORMAT JSON" if self.analyze else "FORMAT JSON"
+        explain = text(f"EXPLAIN ({options}) {sql.strip().rstrip(';')}")
+        plan = self._conn.execute(explain, parameters or {}).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        self.plans.append({
+            "key": self._key(sql),
+            "sql": sql,
+            "params": parameters or {},
+            "plan": plan[0] if isinstance(plan, list) else plan,
+        })
+        # Run the real statement so the repository function can carry on with its result
+        return self._conn.execute(statement, parameters, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def walk_plan(node: Dict[str, Any]):
+    """Yield every node of an EXPLAIN JSON plan tree"""
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk_plan(child)
+
+
+def summarize_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract the numbers we compare across captures from one EXPLAIN JSON document"""
+    root = plan.get('Plan', {})
+    seq_scans = sorted({
+        node['Relation Name'] for node in walk_plan(root)
+        if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name')
+    })
+    relations = sorted({node['Relation Name'] for node in walk_plan(root) if node.get('Relation Name')})
+    return {
+        "total_cost": root.get('Total Cost'),
+        "plan_rows": root.get('Plan Rows'),
+        "actual_rows": root.get('Actual Rows'),
+        "execution_time_ms": plan.get('Execution Time'),
+        "planning_time_ms": plan.get('Planning Time'),
+        "shared_hit_blocks": root.get('Shared Hit Blocks'),
+        "shared_read_blocks": root.get('Shared Read Blocks'),
+        "seq_scans": seq_scans,
+        "relations": relations,
+    }
+
+
+def load_cases(path: str = DEFAULT_CASES_PATH) -> Dict[str, Any]:
+    with open(path, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def fetch_table_sizes(conn, relations: List[str]) -> Dict[str, int]:
+    """Planner row estimates (pg_class.reltuples) for the given tables"""
+    if not relations:
+        return {}
+    result = conn.execute(
+        text("SELECT relname, reltuples::bigint AS rows FROM pg_class WHERE relname = ANY(:names)"),
+        {"names": list(relations)},
+    )
+    return {row.relname: int(row.rows) for row in result}
+
+
+def capture_plans(cases_cfg: Dict[str, Any], label: str, connection_name: Optional[str] = None,
+                  analyze: bool = True) -> Dict[str, Any]:
+    """Execute every configured repository call and collect the plans of the statements it issues"""
+    env, db_conns = load_db_config()
+    connection_name = connection_name or cases_cfg.get('connection', 'pscore_postgres')
+    connector = PostgresConnector(db_conns[connection_name], environment=env)
+
+    statements = {}
+    try:
+        with connector.get_conn() as conn:
+            for case in cases_cfg.get('cases', []):
+                func = getattr(user_repository, case['function'])
+                proxy = PlanCapturingConnection(conn, case['name'], analyze=analyze)
+                kwargs = dict(case.get('args', {}))
+                if 'search_guard' in case:
+                    # Same settings shape as the connection's search_guard section
+                    kwargs['search_guard'] = SearchGuard.from_config({'enable': True, **(case['search_guard'] or {})})
+                logger.info(f"📐 Capturing plans for {case['name']} ({case['function']})")
+                try:
+                    func(proxy, **kwargs)
+                finally:
+                    # EXPLAIN ANALYZE runs the statement; never leave anything behind on the fixture
+                    conn.rollback()
+                for captured in proxy.plans:
+                    captured["function"] = case['function']
+                    captured["summary"] = summarize_plan(captured["plan"])
+                    statements[captured["key"]] = captured
+
+            relations = {rel for stmt in statements.values() for rel in stmt["summary"]["relations"]}
+            table_sizes = fetch_table_sizes(conn, sorted(relations))
+    finally:
+        connector.close()
+
+    return {
+        "label": label,
+        "captured_at": datetime.now(timezone.utc).isoformat(),
+        "connection": connection_name,
+        "analyze": analyze,
+        "table_sizes": table_sizes,
+        "statements": statements,
+    }
+
+
+def find_regressions(baseline: Optional[Dict[str, Any]], current: Dict[str, Any],
+                     cases_cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Compare two captures; with no baseline only the seq scan checks apply"""
+    large_table_rows = cases_cfg.get('large_table_rows', 10000)
+    large_tables = set(cases_cfg.get('large_tables', []))
+    cost_ratio = cases_cfg.get('cost_ratio', 1.5)
+    table_sizes = current.get('table_sizes', {})
+
+    def is_large(relation):
+        return relation in large_tables or table_sizes.get(relation, 0) >= large_table_rows
+
+    regressions = []
+    baseline_statements = (baseline or {}).get('statements', {})
+    for key, stmt in current.get('statements', {}).items():
+        summary = stmt['summary']
+        before = baseline_statements.get(key, {}).get('summary')
+
+        previous_scans = set(before['seq_scans']) if before else set()
+        for relation in summary['seq_scans']:
+            if is_large(relation) and relation not in previous_scans:
+                regressions.append({
+                    "key": key,
+                    "type": "seq_scan",
+                    "relation": relation,
+                    "estimated_rows": table_sizes.get(relation),
+                    "message": f"Sequential scan on large table {relation}",
+                })
+
+        if before and before.get('total_cost') and summary.get('total_cost'):
+            ratio = summary['total_cost'] / before['total_cost']
+            if ratio >= cost_ratio:
+                regressions.append({
+                    "key": key,
+                    "type": "cost_jump",
+                    "before": before['total_cost'],
+                    "after": summary['total_cost'],
+                    "ratio": round(ratio, 2),
+                    "message": f"Total cost grew {ratio:.2f}x ({before['total_cost']} -> {summary['total_cost']})",
+                })
+
+    for key in baseline_statements:
+        if key not in current.get('statements', {}):
+            regressions.append({"key": key, "type": "missing", "message": "Statement no longer captured"})
+    return regressions
+
+
+def save_capture(capture: Dict[str, Any], output_dir: str = DEFAULT_OUTPUT_DIR) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{capture['label']}.json")
+    with open(path, 'w') as f:
+        json.dump(capture, f, indent=2, default=str)
+    return path
+
+
+def load_capture(path: str) -> Dict[str, Any]:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def print_report(current: Dict[str, Any], regressions: List[Dict[str, Any]]):
+    print(f"📊 Plans for '{current['label']}' ({len(current['statements'])} statements)")
+    for key, stmt in sorted(current['statements'].items()):
+        summary = stmt['summary']
+        print(f"   • {key}: cost={summary['total_cost']} time={summary['execution_time_ms']}ms "
+              f"seq_scans={','.join(summary['seq_scans']) or '-'}")
+    print()
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s):")
+        for reg in regressions:
+            print(f"   • [{reg['type']}] {reg['key']}: {reg['message']}")
+    else:
+        print("✅ No plan regressions")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Capture and compare repository query plans")
+    parser.add_argument('--cases', default=DEFAULT_CASES_PATH, help="YAML file with representative calls")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    capture = sub.add_parser('capture', help="Run EXPLAIN (ANALYZE, BUFFERS) for every repository statement")
+    capture.add_argument('--label', required=True, help="Version label, used as the output file name")
+    capture.add_argument('--connection', help="Connection name from config/databases.yaml")
+    capture.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    capture.add_argument('--baseline', help="Previous capture to compare against")
+    capture.add_argument('--no-analyze', action='store_true', help="Plan only, do not execute statements")
+
+    compare = sub.add_parser('compare', help="Compare two stored captures")
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+
+    args = parser.parse_args(argv)
+    cases_cfg = load_cases(args.cases)
+
+    if args.command == 'capture':
+        current = capture_plans(cases_cfg, args.label, args.connection, analyze=not args.no_analyze)
+        path = save_capture(current, args.output_dir)
+        print(f"💾 Saved plans to {path}")
+        baseline = load_capture(args.baseline) if args.baseline else None
+    else:
+        baseline = load_capture(args.baseline)
+        current = load_capture(args.current)
+
+    regressions = find_regressions(baseline, current, cases_cfg)
+    print_report(current, regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# File: readiness.py - Liveness and readiness probes
+"""
+GET /livez answers from memory: the process is up and serving requests.
+
+GET /readyz reports the last result of a background probe that runs
+`SELECT 1` on the server's shared connector (pooled connection, existing
+SSH tunnel) every interval_seconds. Probe requests themselves do no I/O,
+so load balancers and the orchestrator can poll every second. The server
+is ready when the last probe succeeded and is at most stale_after_seconds
+old; a probe stuck behind a saturated pool therefore turns /readyz to 503
+as well. After shutdown starts, /readyz answers 503 so traffic drains.
+
+/health keeps its on-request database round trip for manual checks.
+
+Configured per connection in config/databases.yaml:
+
+    readiness:
+      interval_seconds: 5
+      stale_after_seconds: 15
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger("payu-fin-tools")
+
+
+class ReadinessState:
+    """Last probe result; written by the probe loop, read by /readyz"""
+
+    def __init__(self, stale_after_seconds: float = 15):
+        self.stale_after_seconds = stale_after_seconds
+        self.draining = False
+        self._lock = threading.Lock()
+        self._ok = False
+        self._error = "not probed yet"
+        self._checked_at = None
+        self._latency_ms = None
+
+    @classmethod
+    def from_config(cls, db_cfg) -> "ReadinessState":
+        cfg = db_cfg.get('readiness') or {}
+        return cls(stale_after_seconds=cfg.get('stale_after_seconds', 15))
+
+    def record(self, ok: bool, latency_ms: float, error: str = None):
+        with self._lock:
+            self._ok = ok
+            self._error = error
+            self._checked_at = time.time()
+            self._latency_ms = round(latency_ms, 3)
+
+    def status(self) -> Tuple[bool, Dict[str, Any]]:
+        """(ready, response body)"""
+        with self._lock:
+            ok, error, checked_at, latency_ms = self._ok, self._error, self._checked_at, self._latency_ms
+        age = round(time.time() - checked_at, 3) if checked_at else None
+        body = {"database": "connected" if ok else "disconnected", "checked_at": checked_at,
+                "age_seconds": age, "latency_ms": latency_ms}
+        if self.draining:
+            reason = "shutting down"
+        elif not ok:
+            reason = error
+        elif age > self.stale_after_seconds:
+            reason = f"last successful probe is {age:.0f} s old"
+        else:
+            return True, dict(body, status="ready")
+        return False, dict(body, status="not_ready", reason=reason)
+
+
+class ReadinessProbe:
+    """Daemon thread that runs check() on an interval and records the outcome"""
+
+    def __init__(self, state: ReadinessState, check, interval_seconds: float = 5):
+        self.state = state
+        self.check = check
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="readiness-probe", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            try:
+                self.check()
+                self.state.record(True, (time.perf_counter() - started) * 1000)
+            except Exception as e:
+                logger.warning(f"⚠️ Readiness probe failed: {e}")
+                self.state.record(False, (time.perf_counter() - started) * 1000, str(e))
+            self._stop.wait(self.interval_seconds)
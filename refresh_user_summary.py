@@ -0,0 +1,89 @@
+# File: refresh_user_summary.py - Incremental refresh job for the user_summary table
+"""
+Reprocesses only users whose source rows changed since the last run.
+
+    python refresh_user_summary.py            # one incremental pass
+    python refresh_user_summary.py --loop     # run every refresh_interval_seconds
+    python refresh_user_summary.py --full     # rebuild every user
+"""
+
+import argparse
+import logging
+import time
+
+from sqlalchemy import text
+
+from db.base_connector import load_db_config
+from db.postgres_connector import PostgresConnector
+from repository.user_summary_repository import refresh_user_summary
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("payu-fin-user-summary")
+
+
+def check_writable(connector: PostgresConnector, name: str):
+    """Fail before the first pass when `name` can't write user_summary (replica, read-only user)"""
+    with connector.get_conn() as conn:
+        row = conn.execute(text("""
+            SELECT pg_is_in_recovery() AS in_recovery,
+                   current_setting('transaction_read_only') = 'on' AS read_only,
+                   to_regclass('user_summary') IS NOT NULL AS has_table,
+                   to_regclass('user_summary') IS NOT NULL
+                       AND has_table_privilege('user_summary', 'INSERT, UPDATE') AS can_write
+        """)).one()
+    if row.in_recovery or row.read_only:
+        problem = "is a read-only replica" if row.in_recovery else "opens read-only transactions"
+    elif not row.has_table:
+        problem = "has no user_summary table (create it with db/sql/user_summary.sql)"
+    elif not row.can_write:
+        problem = "has no INSERT/UPDATE privilege on user_summary"
+    else:
+        return
+    raise SystemExit(f"❌ Connection '{name}' {problem}; point user_summary.refresh_connection "
+                     f"in config/databases.yaml at a primary connection that can write user_summary")
+
+
+def run_once(connector: PostgresConnector, summary_cfg: dict, full: bool = False) -> dict:
+    start = time.perf_counter()
+    with connector.get_conn() as conn:
+        result = refresh_user_summary(
+            conn,
+            timestamp_columns=summary_cfg.get('timestamp_columns'),
+            batch_size=summary_cfg.get('batch_size', 1000),
+            overlap_seconds=summary_cfg.get('overlap_seconds', 60),
+            full=full,
+        )
+    logger.info(
+        f"✅ user_summary refreshed: {result['users_refreshed']} users "
+        f"({'full' if result['full'] else 'since ' + str(result['since'])}) "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh the precomputed user_summary table")
+    parser.add_argument('--source', default='pscore_postgres', help="Connection holding the user_summary config")
+    parser.add_argument('--full', action='store_true', help="Recompute every user")
+    parser.add_argument('--loop', action='store_true', help="Keep refreshing on the configured interval")
+    args = parser.parse_args(argv)
+
+    env, db_conns = load_db_config()
+    summary_cfg = db_conns[args.source].get('user_summary', {})
+    target = summary_cfg.get('refresh_connection', args.source)
+    connector = PostgresConnector(db_conns[target], environment=env)
+    try:
+        check_writable(connector, target)
+        run_once(connector, summary_cfg, full=args.full)
+        while args.loop:
+            time.sleep(summary_cfg.get('refresh_interval_seconds', 300))
+            try:
+                run_once(connector, summary_cfg)
+            except Exception as e:
+                logger.error(f"❌ user_summary refresh failed: {e}")
+    finally:
+        connector.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+#repository/identifier_index.py
+"""
+In-process phone/email -> user_id index for get_users.
+
+Identifiers are normalised, hashed to 64 bits and stored in an
+open-addressing table backed by two array('q') columns (hash, user id),
+next to a Bloom filter that answers "no such user" without touching the
+table. Built from a bulk snapshot of users_masteruser and refreshed
+incrementally (new ids plus rows changed since the last refresh).
+
+Hits are verified against the fetched row by get_users, so stale entries
+only cost a fallback to the regular query. Negative answers are trusted
+only while the index is younger than `max_staleness_seconds`.
+"""
+
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from array import array
+from datetime import timedelta
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import text
+
+logger = logging.getLogger("payu-fin-identifier-index")
+
+EMPTY = 0
+AMBIGUOUS = -1   # identifier shared by several users: always use the database
+
+_DIGITS_RE = re.compile(r'\D')
+_EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
+_IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def normalize_identifier(value: Optional[str]) -> Optional[str]:
+    """Canonical form of a phone (p:+91XXXXXXXXXX) or email (e:lowercase) identifier"""
+    if not value:
+        return None
+    value = value.strip()
+    if _EMAIL_RE.fullmatch(value):
+        return f"e:{value.lower()}"
+    digits = _DIGITS_RE.sub('', value)
+    if len(digits) == 10:
+        return f"p:+91{digits}"
+    if len(digits) == 12 and digits.startswith('91'):
+        return f"p:+{digits}"
+    return None
+
+
+def _hash_pair(key: str) -> Tuple[int, int]:
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little', signed=True)
+    h2 = int.from_bytes(digest[8:], 'little', signed=False) | 1
+    return (h1 if h1 != EMPTY else 1), h2
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over precomputed 64-bit hash pairs"""
+
+    def __init__(self, expected_items: int, false_positive_rate: float = 0.01):
+        expected_items = max(expected_items, 1)
+        self.num_bits = max(64, int(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / expected_items * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, h1: int, h2: int):
+        h1 &= 0xFFFFFFFFFFFFFFFF
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, h1: int, h2: int):
+        for pos in self._positions(h1, h2):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def might_contain(self, h1: int, h2: int) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(h1, h2))
+
+
+class CompactHashIndex:
+    """Linear-probing hash table of 64-bit key hash -> user id in two flat arrays"""
+
+    MAX_LOAD = 0.7
+
+    def __init__(self, expected_items: int = 1024):
+        capacity = 1
+        while capacity * self.MAX_LOAD < max(expected_items, 16):
+            capacity <<= 1
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.keys = array('q', bytes(8 * capacity))
+        self.values = array('q', bytes(8 * capacity))
+        self.size = 0
+
+    def _slot(self, h1: int) -> int:
+        slot = h1 & self.mask
+        keys = self.keys
+        while keys[slot] != EMPTY and keys[slot] != h1:
+            slot = (slot + 1) & self.mask
+        return slot
+
+    def put(self, h1: int, user_id: int, replace: bool = False):
+        """Insert a mapping; a second user for the same key marks it ambiguous unless replacing"""
+        if (self.size + 1) > self.capacity * self.MAX_LOAD:
+            self._grow()
+        slot = self._slot(h1)
+        if self.keys[slot] == EMPTY:
+            self.keys[slot] = h1
+            self.values[slot] = user_id
+            self.size += 1
+        elif replace or self.values[slot] == user_id:
+            self.values[slot] = user_id
+        else:
+            self.values[slot] = AMBIGUOUS
+
+    def get(self, h1: int) -> int:
+        slot = self._slot(h1)
+        return self.values[slot] if self.keys[slot] == h1 else EMPTY
+
+    def _grow(self):
+        old_keys, old_values = self.keys, self.values
+        self._allocate(self.capacity * 2)
+        for key, value in zip(old_keys, old_values):
+            if key != EMPTY:
+                slot = self._slot(key)
+                self.keys[slot] = key
+                self.values[slot] = value
+                self.size += 1
+
+    def memory_bytes(self) -> int:
+        return self.keys.itemsize * len(self.keys) + self.values.itemsize * len(self.values)
+
+
+class IdentifierIndex:
+    """Phone/email -> user id resolution with Bloom-filter negative answers"""
+
+    SNAPSHOT_SQL = "SELECT id, phone_id, email_id FROM users_masteruser"
+
+    def __init__(self, updated_at_column: Optional[str] = 'updated_at',
+                 max_staleness_seconds: float = 120, false_positive_rate: float = 0.01,
+                 fetch_size: int = 50000):
+        if updated_at_column and not _IDENTIFIER_RE.match(updated_at_column):
+            raise ValueError(f"Invalid updated_at column: {updated_at_column!r}")
+        self.updated_at_column = updated_at_column
+        self.max_staleness_seconds = max_staleness_seconds
+        self.false_positive_rate = false_positive_rate
+        self.fetch_size = fetch_size
+        self._table: Optional[CompactHashIndex] = None
+        self._bloom: Optional[BloomFilter] = None
+        self._lock = threading.Lock()
+        self.max_user_id = 0
+        self.last_refreshed_db_time = None
+        self.last_refreshed_monotonic = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self._table is not None
+
+    @property
+    def fresh(self) -> bool:
+        return self.ready and (time.monotonic() - self.last_refreshed_monotonic) <= self.max_staleness_seconds
+
+    def _add_rows(self, table: CompactHashIndex, bloom: BloomFilter, rows: Iterable, replace: bool):
+        count = 0
+        for user_id, phone_id, email_id in rows:
+            for identifier in (phone_id, email_id):
+                key = normalize_identifier(identifier)
+                if key:
+                    h1, h2 = _hash_pair(key)
+                    table.put(h1, user_id, replace=replace)
+                    bloom.add(h1, h2)
+            self.max_user_id = max(self.max_user_id, user_id)
+            count += 1
+        return count
+
+    def build(self, conn: Connection) -> int:
+        """Load the full snapshot; the live index keeps serving until the swap"""
+        started = time.perf_counter()
+        db_time = conn.execute(text("SELECT now()")).scalar()
+        estimate = conn.execute(
+            text("SELECT GREATEST(reltuples::bigint, 0) FROM pg_class WHERE relname = 'users_masteruser'")
+        ).scalar() or 0
+        # Two identifiers per user, with headroom for growth between rebuilds
+        expected = int(estimate * 2 * 1.2) + 1024
+        table = CompactHashIndex(expected)
+        bloom = BloomFilter(expected, self.false_positive_rate)
+        result = conn.execution_options(stream_results=True, yield_per=self.fetch_size).execute(text(self.SNAPSHOT_SQL))
+        self.max_user_id = 0
+        count = self._add_rows(table, bloom, result, replace=False)
+        with self._lock:
+            self._table, self._bloom = table, bloom
+            self.last_refreshed_db_time = db_time
+            self.last_refreshed_monotonic = time.monotonic()
+        logger.info(f"✅ Identifier index built: {count} users, {table.size} identifiers, "
+                    f"{(table.memory_bytes() + len(bloom.bits)) / 1e6:.1f} MB in {time.perf_counter() - started:.1f}s")
+        return count
+
+    def refresh(self, conn: Connection, overlap_seconds: int = 60) -> int:
+        """Fold in users created since the last refresh and, if configured, rows updated since then"""
+        if not self.ready:
+            return self.build(conn)
+        db_time = conn.execute(text("SELECT now()")).scalar()
+        query = self.SNAPSHOT_SQL + " WHERE id > :max_id"
+        params = {"max_id": self.max_user_id}
+        if self.updated_at_column:
+            # A UNION of two index scans (primary key, db/sql/identifier_index_indexes.sql);
+            # an OR across the two columns plans as a scan of the whole table
+            query += f" UNION {self.SNAPSHOT_SQL} WHERE {self.updated_at_column} > :since"
+            params["since"] = self.last_refreshed_db_time - timedelta(seconds=overlap_seconds)
+        rows = conn.execute(text(query), params).fetchall()
+        with self._lock:
+            # A changed phone/email leaves the old key pointing at the user (get_users verifies
+            # hits); an identifier that moved to another user becomes ambiguous, i.e. DB only
+            count = self._add_rows(self._table, self._bloom, rows, replace=False)
+            self.last_refreshed_db_time = db_time
+            self.last_refreshed_monotonic = time.monotonic()
+        return count
+
+    def lookup(self, identifier: str):
+        """
+        Returns (known, user_id):
+          (True, id)      the identifier maps to one user (verify the row)
+          (True, None)    definitely no user with this identifier
+          (False, None)   unknown: use the database
+        """
+        key = normalize_identifier(identifier)
+        if key is None or not self.ready:
+            return False, None
+        h1, h2 = _hash_pair(key)
+        with self._lock:
+            # The Bloom filter rejects most unknown identifiers without probing the table
+            user_id = self._table.get(h1) if self._bloom.might_contain(h1, h2) else EMPTY
+        if user_id > 0:
+            return True, user_id
+        if user_id == EMPTY and self.fresh:
+            return True, None
+        return False, None
+
+    def stats(self) -> dict:
+        if not self.ready:
+            return {"ready": False}
+        return {
+            "ready": True,
+            "fresh": self.fresh,
+            "identifiers": self._table.size,
+            "max_user_id": self.max_user_id,
+            "memory_bytes": self._table.memory_bytes() + len(self._bloom.bits),
+            "age_seconds": round(time.monotonic() - self.last_refreshed_monotonic, 1),
+        }
+
+
+class IdentifierIndexRefresher:
+    """Daemon thread that builds the index once and then refreshes it on an interval"""
+
+    def __init__(self, index: IdentifierIndex, connector_factory, interval_seconds: float = 30,
+                 rebuild_interval_seconds: float = 6 * 3600):
+        self.index = index
+        self.connector_factory = connector_factory
+        self.interval_seconds = interval_seconds
+        # Periodic rebuilds drop stale keys and resize the Bloom filter for growth
+        self.rebuild_interval_seconds = rebuild_interval_seconds
+        self._last_build = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="identifier-index-refresh", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        connector = None
+        while not self._stop.is_set():
+            try:
+                if connector is None:
+                    connector = self.connector_factory()
+                with connector.get_conn() as conn:
+                    if time.monotonic() - self._last_build >= self.rebuild_interval_seconds:
+                        self.index.build(conn)
+                        self._last_build = time.monotonic()
+                    else:
+                        self.index.refresh(conn)
+            except Exception as e:
+                logger.error(f"❌ Identifier index refresh failed: {e}")
+                if connector:
+                    connector.close()
+                connector = None
+            self._stop.wait(self.interval_seconds)
+        if connector:
+            connector.close()
@@ -0,0 +1,191 @@
+#repository/result_limits.py
+"""
+Row and byte budgets for tool responses.
+
+Row budgets are enforced in SQL: the tool asks the repository for
+max_rows + 1 rows (users, PANs, AML alerts) and page_rows() trims the
+extra one, which only tells us that there is more. Byte budgets are
+enforced on the response body before it is serialised:
+
+  1. string values larger than max_field_bytes (Aadhaar photos, AML
+     ReportData) are dropped unless the caller asked for them by name,
+  2. if the body is still over max_bytes, trailing rows of list sections
+     are dropped (never the first one),
+  3. then the largest remaining strings, requested or not.
+
+Whatever was cut is described under `truncation`, with the parameters to
+send to get the rest, and `truncated` is set on every response.
+"""
+
+import copy
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class ToolBudget:
+    """Limits for one tool; None means unlimited"""
+
+    def __init__(self, max_rows: Optional[int] = None, max_bytes: Optional[int] = None,
+                 max_field_bytes: Optional[int] = None):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_field_bytes = max_field_bytes
+
+    @property
+    def fetch_rows(self) -> Optional[int]:
+        """Rows to ask the repository for, one extra to detect a further page"""
+        return self.max_rows + 1 if self.max_rows is not None else None
+
+    def with_max_rows(self, max_rows: Optional[int]) -> "ToolBudget":
+        """This budget with a row limit no looser than max_rows (e.g. the search guard's cap)"""
+        if max_rows is None or (self.max_rows is not None and self.max_rows <= max_rows):
+            return self
+        return ToolBudget(max_rows, self.max_bytes, self.max_field_bytes)
+
+
+UNLIMITED = ToolBudget()
+
+
+class ResultLimits:
+    """Per-tool budgets from the connection's `result_limits` section"""
+
+    def __init__(self, tools: Dict[str, ToolBudget], default: ToolBudget):
+        self.tools = tools
+        self.default = default
+
+    @classmethod
+    def from_config(cls, cfg: Optional[Dict[str, Any]]) -> Optional["ResultLimits"]:
+        cfg = cfg or {}
+        if not cfg.get('enable', False):
+            return None
+        max_field_bytes = cfg.get('max_field_bytes')
+        default = ToolBudget(max_bytes=cfg.get('max_bytes'), max_field_bytes=max_field_bytes)
+        tools = {
+            name: ToolBudget(
+                max_rows=tool_cfg.get('max_rows'),
+                max_bytes=tool_cfg.get('max_bytes', default.max_bytes),
+                max_field_bytes=tool_cfg.get('max_field_bytes', max_field_bytes),
+            )
+            for name, tool_cfg in (cfg.get('tools') or {}).items()
+        }
+        return cls(tools, default)
+
+    def for_tool(self, tool_name: str) -> ToolBudget:
+        return self.tools.get(tool_name, self.default)
+
+
+def page_rows(rows: List[Any], budget: ToolBudget, offset: int = 0) -> Tuple[List[Any], Optional[int]]:
+    """Trim a max_rows + 1 fetch to max_rows; returns (rows, next offset or None)"""
+    if budget.max_rows is None or len(rows) <= budget.max_rows:
+        return rows, None
+    return rows[:budget.max_rows], offset + budget.max_rows
+
+
+def value_bytes(value: Any) -> int:
+    """Size of a value once serialised as JSON"""
+    return len(json.dumps(value, default=str, ensure_ascii=False).encode('utf-8'))
+
+
+def _string_leaves(value: Any, path: Tuple):
+    """(container, key, path, size) for every string in nested dicts/lists"""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        return
+    for key, item in items:
+        if isinstance(item, str):
+            yield value, key, path + (key,), len(item.encode('utf-8'))
+        else:
+            yield from _string_leaves(item, path + (key,))
+
+
+def _path_name(path: Tuple) -> str:
+    return ".".join(str(part) for part in path)
+
+
+def _field_name(path: Tuple) -> str:
+    """The requestable field a leaf belongs to: users.3.document_image -> document_image, aml_details.alerts.0.x -> alerts"""
+    return next((str(part) for part in path[1:] if not isinstance(part, int) and not str(part).isdigit()), str(path[-1]))
+
+
+def _add_truncation(body: Dict[str, Any], kind: str, key: str, value: Any):
+    body.setdefault('truncation', {}).setdefault(kind, {})[key] = value
+
+
+def mark_more_rows(body: Dict[str, Any], section: str, parameter: str, next_offset: int):
+    """Record that `section` has more rows, fetched by sending `parameter`=next_offset"""
+    _add_truncation(body, 'more_rows', section, True)
+    _add_truncation(body, 'continuation', parameter, next_offset)
+
+
+def _resolve(body: Dict[str, Any], section: Tuple):
+    value = body
+    for key in section:
+        if not isinstance(value, dict) or value.get(key) is None:
+            return None
+        value = value[key]
+    return value
+
+
+def enforce_byte_budget(body: Dict[str, Any], sections: Iterable[str], budget: ToolBudget,
+                        requested_fields: Optional[Iterable[str]] = None,
+                        row_offsets: Optional[Dict[str, Tuple[str, int]]] = None) -> Dict[str, Any]:
+    """
+    Cut the data sections of a response body down to the tool's byte budget.
+    `sections` are top-level keys, or dotted paths for nested lists such as
+    "aml_details.alerts" (list in trimming order); row_offsets maps a list
+    section to (parameter, offset of its first row) for continuation hints.
+    """
+    requested = set(requested_fields or ())
+    row_offsets = row_offsets or {}
+    omitted_fields = []
+    paths = [tuple(section.split('.')) for section in sections]
+    # Sections may be shared with the result cache: work on copies (strings are not copied)
+    for top in dict.fromkeys(path[0] for path in paths):
+        if body.get(top) is not None:
+            body[top] = copy.deepcopy(body[top])
+    tops = [top for top in dict.fromkeys(path[0] for path in paths) if body.get(top) is not None]
+
+    if budget.max_field_bytes is not None:
+        for top in tops:
+            for container, key, path, size in list(_string_leaves(body[top], (top,))):
+                if size > budget.max_field_bytes and _field_name(path) not in requested:
+                    container[key] = None
+                    omitted_fields.append(_field_name(path))
+                    _add_truncation(body, 'omitted_fields', _path_name(path), size)
+
+    if budget.max_bytes is not None:
+        excess = value_bytes(body) - budget.max_bytes
+        # Trailing rows first: they are the oldest/least relevant and can be paged back in
+        for section, path in zip(sections, paths):
+            rows = _resolve(body, path)
+            if excess <= 0 or not isinstance(rows, list) or len(rows) < 2:
+                continue
+            dropped = 0
+            # The first row always stays, so a continuation offset always makes progress
+            while len(rows) > 1 and excess > 0:
+                excess -= value_bytes(rows.pop()) + 1
+                dropped += 1
+            _add_truncation(body, 'dropped_rows', section, dropped)
+            if section in row_offsets:
+                parameter, offset = row_offsets[section]
+                mark_more_rows(body, section, parameter, offset + len(rows))
+        if excess > 0:
+            leaves = sorted((leaf for top in tops for leaf in _string_leaves(body[top], (top,))),
+                            key=lambda leaf: leaf[3], reverse=True)
+            for container, key, path, size in leaves:
+                if excess <= 0:
+                    break
+                container[key] = None
+                excess -= size
+                omitted_fields.append(_field_name(path))
+                _add_truncation(body, 'omitted_fields', _path_name(path), size)
+
+    omitted_fields = sorted(set(omitted_fields))
+    if omitted_fields:
+        # Asking for a field by name lifts max_field_bytes for it (max_bytes still applies)
+        _add_truncation(body, 'continuation', 'fields', omitted_fields)
+    body['truncated'] = bool(body.get('truncation'))
+    return body
@@ -0,0 +1,128 @@
+#repository/search_guard.py
+"""
+Pre-execution selectivity check for free-text name searches in get_users.
+
+A short term turns into ILIKE '%a%' over five columns, i.e. a full scan of
+users_masteruser. The guard applies minimum-length rules, asks the planner
+for a row estimate (EXPLAIN, no execution) and then either runs the search,
+narrows it (prefix matching, tighter LIMIT) or rejects it with a message
+telling the caller how to search instead.
+
+Names are matched as lower(column) LIKE lower(pattern), the form the
+pg_trgm indexes in db/sql/name_search_indexes.sql serve for both the
+substring and the prefix pattern. The PAN name is matched in its own
+subquery: an OR across the LEFT JOIN would leave the planner no index to
+drive from. A user found by PAN name is returned with all their valid PANs.
+"""
+
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from sqlalchemy.sql import text
+
+logger = logging.getLogger("payu-fin-search-guard")
+
+NAME_COLUMNS = ("name", "first_name", "middle_name", "last_name")
+
+
+class SearchTooBroadError(ValueError):
+    """Raised when a name search would scan too much of the user table"""
+
+
+def escape_like(term: str) -> str:
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def name_where_clause() -> str:
+    conditions = " OR\n                ".join(f"lower({column}) LIKE :like_term" for column in NAME_COLUMNS)
+    return f"""
+        WHERE um.id IN (
+            SELECT id FROM users_masteruser
+            WHERE {conditions}
+            UNION
+            SELECT master_user_id FROM users_pan
+            WHERE is_valid = true AND lower(nsdl_name) LIKE :like_term
+        )
+        """
+
+
+class SearchGuard:
+    """Decides how (and whether) a name search runs"""
+
+    def __init__(self, min_term_length: int = 3, prefix_below_length: int = 5,
+                 max_estimated_rows: int = 5000, reject_estimated_rows: int = 100000,
+                 broad_search_limit: int = 25):
+        self.min_term_length = min_term_length
+        self.prefix_below_length = prefix_below_length
+        self.max_estimated_rows = max_estimated_rows
+        self.reject_estimated_rows = reject_estimated_rows
+        self.broad_search_limit = broad_search_limit
+
+    @classmethod
+    def from_config(cls, cfg: Optional[Dict[str, Any]]) -> Optional["SearchGuard"]:
+        """Build from the connection's `search_guard` section; None when disabled"""
+        cfg = cfg or {}
+        if not cfg.get('enable', False):
+            return None
+        return cls(
+            min_term_length=cfg.get('min_term_length', 3),
+            prefix_below_length=cfg.get('prefix_below_length', 5),
+            max_estimated_rows=cfg.get('max_estimated_rows', 5000),
+            reject_estimated_rows=cfg.get('reject_estimated_rows', 100000),
+            broad_search_limit=cfg.get('broad_search_limit', 25),
+        )
+
+    @staticmethod
+    def estimate_rows(conn, query: str, params: Dict[str, Any]) -> int:
+        """Planner row estimate for a statement, without running it"""
+        plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}"), params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def plan_name_search(self, conn, base_query: str, search_term: str) -> Dict[str, Any]:
+        """
+        Returns {"where_clause", "params", "limit", "strategy", "estimated_rows"}
+        or raises SearchTooBroadError.
+        """
+        term = search_term.strip()
+        if len(term) < self.min_term_length:
+            raise SearchTooBroadError(
+                f"Search term '{term}' is too short for a name search "
+                f"(minimum {self.min_term_length} characters). "
+                f"Search by phone number, email or user ID, or give more of the name."
+            )
+
+        strategy = 'prefix' if len(term) < self.prefix_below_length else 'contains'
+        where_clause = name_where_clause()
+
+        def params_for(kind):
+            escaped = escape_like(term.lower())
+            return {"like_term": f"{escaped}%" if kind == 'prefix' else f"%{escaped}%"}
+
+        params = params_for(strategy)
+        estimated = self.estimate_rows(conn, base_query + where_clause, params)
+        if estimated > self.max_estimated_rows and strategy == 'contains':
+            # Anchored patterns are far more selective (trigram indexes: db/sql/name_search_indexes.sql)
+            strategy = 'prefix'
+            params = params_for(strategy)
+            estimated = self.estimate_rows(conn, base_query + where_clause, params)
+
+        if estimated > self.reject_estimated_rows:
+            raise SearchTooBroadError(
+                f"Name search for '{term}' would match about {estimated} users. "
+                f"Narrow it down with a full name, or search by phone number, email or user ID."
+            )
+
+        limit = self.broad_search_limit if estimated > self.max_estimated_rows else None
+        if strategy != 'contains' or limit:
+            logger.info(f"Narrowed name search '{term}': strategy={strategy}, "
+                        f"estimated_rows={estimated}, limit={limit}")
+        return {
+            "where_clause": where_clause,
+            "params": params,
+            "limit": limit,
+            "strategy": strategy,
+            "estimated_rows": estimated,
+        }
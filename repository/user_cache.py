@@ -0,0 +1,191 @@
+#repository/user_cache.py
+"""
+Per-user, per-section result cache for repository lookups.
+
+Entries are keyed by (user_id, section) so a change notification for one
+table only drops the sections that read it (see TABLE_SECTIONS). TTLs are
+long while the change listener is connected and fall back to a short TTL
+whenever it is not.
+
+Notifications come from the primary but loads read the replica. An
+invalidation carries the primary's WAL position; until the replica has
+replayed past it (checked before the load) a reload is only kept until
+replica_lag_seconds after the invalidation, so a row read before the
+replica caught up is never cached for the long TTL.
+
+Sections can have their own TTL cap (section_ttl_seconds). Sections read
+from the user_summary table need one: nothing notifies when that table is
+refreshed, so a load right after an invalidation may see the previous
+summary row and must not outlive the next refresh.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Which cached sections each notifying table feeds
+# (tables not listed here drop every section of the user)
+TABLE_SECTIONS = {
+    "users_pan": ("header", "pans", "kyc_status"),
+    "users_aadhaar": ("header", "aadhaar_kyc", "kyc_status"),
+    "users_kycverification": ("aadhaar_kyc", "ckyc", "kyc_status"),
+    "users_ckyc": ("ckyc",),
+    "users_address": ("address",),
+    "users_amlresponsedata": ("header", "aml"),
+    "users_amlrequestresponselog": ("aml",),
+    "users_masteruserextra": ("additional_info",),
+    "users_masteruser": ("header", "additional_info"),
+    "users_phonenumber": ("header",),
+    "users_email": ("header",),
+}
+
+
+class UserResultCache:
+    """Thread-safe LRU of repository results with section-level invalidation"""
+
+    def __init__(self, ttl_seconds: float = 3600, fallback_ttl_seconds: float = 30, max_entries: int = 10000,
+                 replica_lag_seconds: float = 30, section_ttl_seconds: Optional[Dict[str, float]] = None):
+        self.ttl_seconds = ttl_seconds
+        self.fallback_ttl_seconds = fallback_ttl_seconds
+        self.max_entries = max_entries
+        self.replica_lag_seconds = replica_lag_seconds
+        self.section_ttl_seconds = dict(section_ttl_seconds or {})
+        self.listener_connected = False
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # Invalidation counters per user, so a load that raced with a NOTIFY is not cached
+        self._generations: Dict[int, int] = {}
+        self._epoch = 0
+        # user_id -> (WAL position of the latest invalidation, when the replica is assumed to have it),
+        # in deadline order
+        self._pending_lsn: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def current_ttl(self) -> float:
+        return self.ttl_seconds if self.listener_connected else self.fallback_ttl_seconds
+
+    def section_ttl(self, section: str) -> float:
+        ttl = self.current_ttl
+        cap = self.section_ttl_seconds.get(section)
+        return min(ttl, cap) if cap is not None else ttl
+
+    def get(self, user_id: int, section: str):
+        key = (int(user_id), section)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id: int, section: str, value: Any, generation: Optional[tuple] = None,
+            expires_at: Optional[float] = None):
+        """Store a value unless an invalidation for that user arrived since `generation` was read"""
+        key = (int(user_id), section)
+        with self._lock:
+            if generation is not None and generation != self._generation_locked(key[0]):
+                return
+            expiry = time.monotonic() + self.section_ttl(section)
+            self._entries[key] = (min(expiry, expires_at) if expires_at is not None else expiry, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, user_id: int, section: str, loader: Callable[[], Any],
+                    replay_lsn: Optional[Callable[[], Optional[int]]] = None):
+        """
+        replay_lsn() returns the WAL position the loader's server has replayed
+        (None on a primary); without it a load after a notification is kept
+        only until the replica lag bound.
+        """
+        cached = self.get(user_id, section)
+        if cached is not None:
+            return cached
+        generation = self.generation(user_id)
+        # Before the load: a statement started after the check sees everything replayed by then
+        expires_at = self._replica_deadline(int(user_id), replay_lsn)
+        value = loader()
+        self.set(user_id, section, value, generation, expires_at)
+        return value
+
+    def _replica_deadline(self, user_id: int, replay_lsn) -> Optional[float]:
+        """None when the replica has the user's latest change, else until when a load may be stale"""
+        with self._lock:
+            pending = self._pending_lsn.get(user_id)
+            if pending is not None and pending[1] <= time.monotonic():
+                del self._pending_lsn[user_id]
+                pending = None
+        if pending is None:
+            return None
+        if replay_lsn is not None:
+            replayed = replay_lsn()
+            if replayed is None or replayed >= pending[0]:
+                with self._lock:
+                    if self._pending_lsn.get(user_id) == pending:
+                        del self._pending_lsn[user_id]
+                return None
+        return pending[1]
+
+    def invalidate(self, user_id: int, sections: Optional[Iterable[str]] = None, lsn: Optional[int] = None):
+        """Drop the given sections (all sections when None) for one user; lsn = the change's WAL position"""
+        user_id = int(user_id)
+        with self._lock:
+            if lsn is not None:
+                now = time.monotonic()
+                previous = self._pending_lsn.pop(user_id, None)
+                self._pending_lsn[user_id] = (max(lsn, previous[0]) if previous else lsn,
+                                              now + self.replica_lag_seconds)
+                while self._pending_lsn and next(iter(self._pending_lsn.values()))[1] <= now:
+                    self._pending_lsn.popitem(last=False)
+            if len(self._generations) >= self.max_entries:
+                # Bumping the epoch invalidates every in-flight load, so the counters can be dropped
+                self._generations.clear()
+                self._epoch += 1
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            if sections is None:
+                keys = [key for key in self._entries if key[0] == user_id]
+            else:
+                keys = [(user_id, section) for section in sections]
+            for key in keys:
+                self._entries.pop(key, None)
+            self.invalidations += 1
+
+    def invalidate_table(self, table: str, user_id: int, lsn: Optional[int] = None):
+        self.invalidate(user_id, TABLE_SECTIONS.get(table), lsn)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._entries)
+            awaiting_replica = len(self._pending_lsn)
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "awaiting_replica": awaiting_replica,
+            "listener_connected": self.listener_connected,
+            "ttl_seconds": self.current_ttl,
+        }
+
+    def generation(self, user_id: int) -> tuple:
+        with self._lock:
+            return self._generation_locked(int(user_id))
+
+    def _generation_locked(self, user_id: int) -> tuple:
+        return self._epoch, self._generations.get(user_id, 0)
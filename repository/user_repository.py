@@ -1,19 +1,30 @@
 #repository/user_repository.py
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional
 from sqlalchemy.engine import Connection
 from sqlalchemy.sql import text
 import re
 import json
-import re
-from sqlalchemy.sql import text
-from typing import List, Dict, Any
 
-import re
-from sqlalchemy.sql import text
-from typing import List, Dict, Any
+from db.session_profiles import apply_session_profile, POINT_LOOKUP, BROAD_SCAN, JSON_EXTRACTION
+from repository.search_guard import escape_like
+
+# A total order over get_users rows (DISTINCT user x valid PAN x valid Aadhaar photo), so offsets
+# page through the same result; um.id alone ties between one user's PAN/Aadhaar combinations
+USER_ROWS_ORDER = "ORDER BY id, pan_number, nsdl_name, document_image"
 
-def get_users(conn, search_term: str) -> List[Dict[str, Any]]:
+def get_users(conn, search_term: str, identifier_index=None, search_guard=None,
+              limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+    return get_users_with_narrowing(conn, search_term, identifier_index, search_guard, limit, offset)[0]
+
+def get_users_with_narrowing(conn, search_term: str, identifier_index=None, search_guard=None,
+                             limit: Optional[int] = None, offset: int = 0):
+    """
+    get_users plus how the search guard narrowed a name search: (rows, None)
+    or (rows, {"strategy", "row_cap", "estimated_rows"}) when it switched to
+    prefix matching or capped the rows. A capped search returns up to
+    row_cap + 1 rows; page them with budget.with_max_rows(row_cap).
+    """
     #print(f"[DEBUG] [get_users] Called with search_term: {search_term}")
 
     base_query = """
@@ -36,10 +47,18 @@ def get_users(conn, search_term: str) -> List[Dict[str, Any]]:
     LEFT JOIN users_aadhaar ua ON ua.master_user_id = um.id AND ua.is_valid = true
     """
 
+    narrowing = None
     numeric = re.fullmatch(r'\d+', search_term)
     plus91 = re.fullmatch(r'\+91\d{10}', search_term)
     email_like = re.fullmatch(r"[^@]+@[^@]+\.[^@]+", search_term)
 
+    apply_session_profile(conn, POINT_LOOKUP if (numeric or plus91 or email_like) else BROAD_SCAN)
+
+    if identifier_index is not None and (numeric or plus91 or email_like):
+        rows = _get_users_via_index(conn, base_query, search_term, bool(email_like), identifier_index)
+        if rows is not None:
+            return (rows[offset:] if limit is None else rows[offset:offset + limit]), None
+
     if numeric:   # Indian 10-digit number
         phone_term = f"+91{search_term}"
         where_clause = """
@@ -62,6 +81,17 @@ def get_users(conn, search_term: str) -> List[Dict[str, Any]]:
     elif email_like:
         where_clause = "WHERE um.email_id = :term"
         params = {"term": search_term}
+    elif search_guard is not None:
+        # Free-text name search: let the guard reject, narrow or limit it before it runs
+        plan = search_guard.plan_name_search(conn, base_query, search_term)
+        where_clause, params = plan["where_clause"], plan["params"]
+        if plan["limit"]:
+            # One row past the cap, so the caller can tell the cap dropped rows (see result_limits.page_rows)
+            capped = plan["limit"] + 1
+            limit = min(limit, capped) if limit is not None else capped
+        if plan["strategy"] != 'contains' or plan["limit"]:
+            narrowing = {"strategy": plan["strategy"], "row_cap": plan["limit"],
+                         "estimated_rows": plan["estimated_rows"]}
     else:
         where_clause = """
         WHERE (
@@ -72,38 +102,129 @@ def get_users(conn, search_term: str) -> List[Dict[str, Any]]:
             up.nsdl_name ILIKE :like_term
         )
         """
-        params = {"like_term": f"%{search_term}%"}
+        params = {"like_term": f"%{escape_like(search_term)}%"}
+
+    if limit is not None or offset:
+        where_clause += f"""
+        {USER_ROWS_ORDER}
+        LIMIT :row_limit OFFSET :row_offset
+        """
+        params.update(row_limit=limit, row_offset=offset)
 
     full_query = base_query + where_clause
-    print(f" Querying users with params: {where_clause}")
 
     result = conn.execute(text(full_query), params)
     rows = [dict(row._mapping) for row in result]
     #print(f"[DEBUG] [get_users] Found {len(rows)} user(s)")
+    return rows, narrowing
+
+def _get_users_via_index(conn, base_query: str, search_term: str, is_email: bool, identifier_index):
+    """
+    Resolve a phone/email term through the in-process identifier index and
+    fetch by primary key. Returns None when the caller must run the regular query.
+    """
+    if is_email:
+        phone_term, id_term = None, None
+    elif search_term.startswith('+91'):
+        phone_term = search_term
+        id_term = int(search_term[3:]) if search_term[3:].isdigit() else None
+    else:
+        phone_term, id_term = f"+91{search_term}", int(search_term)
+
+    known, resolved_id = identifier_index.lookup(phone_term or search_term)
+    if not known:
+        return None
+
+    # Numeric terms also match users_masteruser.id, exactly as the regular query does
+    ids = [user_id for user_id in (resolved_id, id_term) if user_id is not None]
+    if not ids:
+        return []
+    # Same order as the regular query, since the caller slices these rows by offset
+    result = conn.execute(text(base_query + f"WHERE um.id = ANY(:ids) {USER_ROWS_ORDER}"), {"ids": ids})
+    rows = [dict(row._mapping) for row in result]
+
+    # Guard against stale index entries (identifier changed since the last refresh)
+    if resolved_id is not None:
+        matches = [row for row in rows if row['id'] == resolved_id]
+        column, expected = ('email_id', search_term) if is_email else ('phone_id', phone_term)
+        if not matches or any(row[column] != expected for row in matches):
+            return None
     return rows
 
-def get_additional_info(conn: Connection, user_id: int) -> dict:
-    query = """
-    SELECT DISTINCT 
-        user_master.id AS user_id, 
-        user_master.customer_id AS customer_id, 
-        user_master.gender AS gender, 
-        user_master.date_of_birth AS dob, 
-        user_master.um_uuid AS user_uuid,
-        user_extra.mother_name AS mother_name,
-        user_extra.alternate_phone AS alternate_contact_number, 
-        user_extra.community AS community_group, 
-        user_extra.marital_status AS marital_status,
-        user_extra.educational_qualification AS education_level,
-        user_extra.spouse_name AS spouse_name,
-        user_extra.category AS beneficiary_category,
-        user_extra.father_name AS father_name
-    FROM users_masteruser user_master
-    LEFT JOIN users_pan user_pan 
-        ON user_pan.master_user_id = user_master.id 
-        AND user_pan.is_valid = true
+ADDITIONAL_INFO_FIELDS = {
+    "user_id": ("user_master.id", None),
+    "customer_id": ("user_master.customer_id", None),
+    "gender": ("user_master.gender", None),
+    "dob": ("user_master.date_of_birth", None),
+    "user_uuid": ("user_master.um_uuid", None),
+    "mother_name": ("user_extra.mother_name", "extra"),
+    "alternate_contact_number": ("user_extra.alternate_phone", "extra"),
+    "community_group": ("user_extra.community", "extra"),
+    "marital_status": ("user_extra.marital_status", "extra"),
+    "education_level": ("user_extra.educational_qualification", "extra"),
+    "spouse_name": ("user_extra.spouse_name", "extra"),
+    "beneficiary_category": ("user_extra.category", "extra"),
+    "father_name": ("user_extra.father_name", "extra"),
+}
+
+ADDITIONAL_INFO_JOINS = {
+    "extra": """
     LEFT JOIN users_masteruserextra user_extra 
-        ON user_extra.master_user_id = user_master.id
+        ON user_extra.master_user_id = user_master.id""",
+}
+
+def select_fields(available: Dict[str, Any], fields: Optional[Iterable[str]] = None) -> List[str]:
+    """Validate a requested field list against a function's field map (None = all fields)."""
+    if fields is None:
+        return list(available)
+    fields = list(dict.fromkeys(fields))
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ValueError(f"Unknown field(s) {unknown}; available: {sorted(available)}")
+    return fields
+
+def build_projection(field_map: Dict[str, tuple], joins: Dict[str, str], fields: List[str]):
+    """SELECT list and the joins needed to produce the requested fields, in declaration order."""
+    columns = ",\n        ".join(f"{field_map[field][0]} AS {field}" for field in fields)
+    needed = {field_map[field][1] for field in fields}
+    join_sql = "".join(sql for key, sql in joins.items() if key in needed)
+    return columns, join_sql
+
+def project_fields(data, fields: Optional[Iterable[str]] = None):
+    """Keep only the requested keys of a result dict (or of each dict in a list)."""
+    if fields is None or not data:
+        return data
+    fields = list(fields)
+    if isinstance(data, list):
+        return [project_fields(item, fields) for item in data]
+    return {key: data[key] for key in fields if key in data}
+
+def split_fields(fields: Optional[Iterable[str]], sections: Dict[str, Iterable[str]]) -> Dict[str, Optional[List[str]]]:
+    """
+    Distribute one requested field list over several result sections.
+    Returns section -> fields (None = everything when no fields were requested).
+    """
+    if fields is None:
+        return {section: None for section in sections}
+    fields = list(dict.fromkeys(fields))
+    known = set()
+    for available in sections.values():
+        known.update(available)
+    unknown = [field for field in fields if field not in known]
+    if unknown:
+        raise ValueError(f"Unknown field(s) {unknown}; available: {sorted(known)}")
+    return {section: [field for field in fields if field in available] for section, available in sections.items()}
+
+def get_additional_info(conn: Connection, user_id: int, fields: Optional[Iterable[str]] = None) -> dict:
+    fields = select_fields(ADDITIONAL_INFO_FIELDS, fields)
+    if not fields:
+        return {}
+    apply_session_profile(conn, POINT_LOOKUP)
+    columns, joins = build_projection(ADDITIONAL_INFO_FIELDS, ADDITIONAL_INFO_JOINS, fields)
+    query = f"""
+    SELECT
+        {columns}
+    FROM users_masteruser user_master{joins}
     WHERE user_master.id = :user_id
     LIMIT 1
     """
@@ -111,22 +232,16 @@ def get_additional_info(conn: Connection, user_id: int) -> dict:
     row = result.fetchone()
     return dict(row._mapping) if row else {}
 
-def get_user_pans(conn: Connection, user_id: int):
-    """
-    Fetch all PAN records for a given user ID.
-    Returns a list of dicts (one per PAN).
-    """
-    query = """
-        SELECT 
-            id,
-            nsdl_valid, 
-            number, 
-            date_of_birth, 
-            is_valid, 
-            created_at, 
-            nsdl_name, 
-            status,
-            CASE 
+PAN_FIELDS = {
+    "id": ("id", None),
+    "nsdl_valid": ("nsdl_valid", None),
+    "number": ("number", None),
+    "date_of_birth": ("date_of_birth", None),
+    "is_valid": ("is_valid", None),
+    "created_at": ("created_at", None),
+    "nsdl_name": ("nsdl_name", None),
+    "status": ("status", None),
+    "status_text": ("""CASE 
                 WHEN status = 10 THEN 'Pending'
                 WHEN status = 20 THEN 'Completed'
                 WHEN status = 30 THEN 'PreApproved'
@@ -134,14 +249,31 @@ def get_user_pans(conn: Connection, user_id: int):
                 WHEN status = 50 THEN 'Rejected'
                 WHEN status = 100 THEN 'Expired'
                 ELSE 'Unknown Status'
-            END AS status_text, 
-            gender 
+            END""", None),
+    "gender": ("gender", None),
+}
+
+def get_user_pans(conn: Connection, user_id: int, fields: Optional[Iterable[str]] = None,
+                  limit: Optional[int] = None, offset: int = 0):
+    """
+    Fetch PAN records for a given user ID, newest first.
+    Returns a list of dicts (one per PAN), restricted to `fields` when given;
+    `limit`/`offset` page through users with a long PAN history.
+    """
+    fields = select_fields(PAN_FIELDS, fields)
+    if not fields:
+        return []
+    apply_session_profile(conn, POINT_LOOKUP)
+    columns, _ = build_projection(PAN_FIELDS, {}, fields)
+    query = f"""
+        SELECT 
+            {columns}
         FROM users_pan  
         WHERE master_user_id = :user_id
-        ORDER BY created_at DESC;
+        ORDER BY created_at DESC, id DESC
+        LIMIT :limit OFFSET :offset;
     """
-    result = conn.execute(text(query), {"user_id": user_id})
-    print(result)
+    result = conn.execute(text(query), {"user_id": user_id, "limit": limit, "offset": offset})
     return [dict(row._mapping) for row in result]
 
 def mask_aadhaar(aadhaar):
@@ -150,6 +282,26 @@ def mask_aadhaar(aadhaar):
         return f"xxxx-xxxx-{aadhaar}"
     return aadhaar
 
+AADHAAR_KYC_FIELDS = (
+    "aadhaar_photo_b64", "aadhaar_masked", "aadhaar_status", "aadhaar_name", "aadhaar_dob",
+    "aadhaar_gender", "aadhaar_date_verified", "aadhaar_careof", "aadhaar_address",
+)
+
+CKYC_FIELDS = (
+    "ckyc_number", "ckyc_masked_aadhaar", "ckyc_phone", "ckyc_date_extracted",
+    "ckyc_father_name", "ckyc_status", "ckyc_has_documents",
+)
+
+ADDRESS_FIELDS = (
+    "address_type", "line1", "line2", "city", "state", "status",
+    "postal_code_id", "landmark", "id", "linked_id", "is_valid",
+)
+
+USER_SEARCH_FIELDS = (
+    "id", "customer_id", "name", "first_name", "middle_name", "last_name", "gender",
+    "date_of_birth", "email_id", "phone_id", "pan_number", "nsdl_name", "document_image",
+)
+
 def get_user_aadhaar_kyc(conn, user_id):
     query = """
     SELECT
@@ -187,6 +339,7 @@ def get_user_aadhaar_kyc(conn, user_id):
         AND ukv.mode IN (1, 2, 4, 5)
         AND ua.is_valid = true
     """
+    apply_session_profile(conn, POINT_LOOKUP)
     row = conn.execute(text(query), {"user_id": user_id}).fetchone()
     if not row:
         return {}
@@ -264,6 +417,7 @@ def get_user_ckyc(conn, user_id):
             AND uc.is_valid = true
         """
 
+    apply_session_profile(conn, POINT_LOOKUP)
     row = conn.execute(text(query), {"user_id": user_id}).fetchone()
     if not row:
         return {}
@@ -294,64 +448,141 @@ def get_user_ckyc(conn, user_id):
         "ckyc_has_documents": has_documents,
     }
 
-def get_user_header_details(conn: Connection, user_id: int) -> dict:
-    query = """
-    SELECT DISTINCT 
-        user_master.id AS user_id, 
-        user_master.name AS full_name, 
-        user_master.first_name AS first_name, 
-        user_master.middle_name AS middle_name, 
-        user_master.last_name AS last_name, 
-        user_master.email_id AS email_address, 
-        user_master.phone_id AS phone_id, 
-        user_pan.number AS pan_number, 
-        user_aadhaar.digits AS aadhaar_digits, 
-        user_aadhaar.embedded_data->'photo'->>'document_image' AS document_image,
-        user_phone.phone AS phone_number, 
-        user_phone.otp_verified_at AS otp_verification_time,
-        user_email.verified_at AS email_verified_at, 
-        user_aadhaar.is_valid, 
-        user_pan.is_valid,
-        users_aml.decision As aml_isHit
-    FROM users_masteruser user_master
-    LEFT JOIN users_pan user_pan 
-        ON user_pan.master_user_id = user_master.id 
-        AND user_pan.is_valid = true
-    LEFT JOIN users_masteruserextra user_extra 
-        ON user_extra.master_user_id = user_master.id
-    LEFT JOIN users_aadhaar user_aadhaar 
-        ON user_aadhaar.master_user_id = user_master.id 
-        AND user_aadhaar.is_valid = true
-    LEFT JOIN users_phonenumber user_phone 
-        ON user_phone.phone = user_master.phone_id
-    LEFT JOIN users_email user_email
-        ON user_email.email = user_master.email_id
-    LEFT JOIN users_amlresponsedata users_aml 
-        ON users_aml.master_user_id = user_master.id     
-    WHERE user_master.id = :user_id 
-    LIMIT 1
+HEADER_FIELDS = {
+    "user_id": ("user_master.id", None),
+    "full_name": ("user_master.name", None),
+    "first_name": ("user_master.first_name", None),
+    "middle_name": ("user_master.middle_name", None),
+    "last_name": ("user_master.last_name", None),
+    "email_address": ("user_master.email_id", None),
+    "phone_id": ("user_master.phone_id", None),
+    "pan_number": ("user_pan.number", "pan"),
+    "aadhaar_digits": ("user_aadhaar.digits", "aadhaar"),
+    "document_image": ("user_aadhaar.document_image", "aadhaar"),
+    "phone_number": ("user_phone.phone", "phone"),
+    "otp_verification_time": ("user_phone.otp_verified_at", "phone"),
+    "email_verified_at": ("user_email.verified_at", "email"),
+    # valid PAN flag (the query historically also selected the Aadhaar flag under the same name)
+    "is_valid": ("user_pan.is_valid", "pan"),
+    "aml_ishit": ("users_aml.decision", "aml"),
+}
+
+# Each auxiliary table contributes at most one row (latest by id) through a
+# LATERAL ... LIMIT 1 lookup, so users with many PAN/Aadhaar/phone/AML rows
+# no longer multiply intermediate rows or force a DISTINCT sort over the photo.
+HEADER_JOINS = {
+    "pan": """
+    LEFT JOIN LATERAL (
+        SELECT number, is_valid
+        FROM users_pan
+        WHERE master_user_id = user_master.id AND is_valid = true
+        ORDER BY id DESC
+        LIMIT 1
+    ) user_pan ON true""",
+    "aadhaar": """
+    LEFT JOIN LATERAL (
+        SELECT digits, is_valid, embedded_data->'photo'->>'document_image' AS document_image
+        FROM users_aadhaar
+        WHERE master_user_id = user_master.id AND is_valid = true
+        ORDER BY id DESC
+        LIMIT 1
+    ) user_aadhaar ON true""",
+    "phone": """
+    LEFT JOIN LATERAL (
+        SELECT phone, otp_verified_at
+        FROM users_phonenumber
+        WHERE phone = user_master.phone_id
+        ORDER BY id DESC
+        LIMIT 1
+    ) user_phone ON true""",
+    "email": """
+    LEFT JOIN LATERAL (
+        SELECT verified_at
+        FROM users_email
+        WHERE email = user_master.email_id
+        ORDER BY id DESC
+        LIMIT 1
+    ) user_email ON true""",
+    "aml": """
+    LEFT JOIN LATERAL (
+        SELECT decision
+        FROM users_amlresponsedata
+        WHERE master_user_id = user_master.id
+        ORDER BY id DESC
+        LIMIT 1
+    ) users_aml ON true""",
+}
+
+def get_user_header_details(conn: Connection, user_id: int, fields: Optional[Iterable[str]] = None) -> dict:
+    fields = select_fields(HEADER_FIELDS, fields)
+    if not fields:
+        return {}
+    apply_session_profile(conn, POINT_LOOKUP)
+    columns, joins = build_projection(HEADER_FIELDS, HEADER_JOINS, fields)
+    query = f"""
+    SELECT
+        {columns}
+    FROM users_masteruser user_master{joins}
+    WHERE user_master.id = :user_id
     """
     result = conn.execute(text(query), {"user_id": user_id})
     row = result.fetchone()
     return dict(row._mapping) if row else {}
 
-def get_aml_details(conn: Connection, user_id: int) -> dict:
-    query = """
-        SELECT 
-            users_aml_log.response::json->'ScreeningRequestData'->'ScreeningResults'->>'Matched' AS matched_status,
-            users_aml_log.response::json->'ScreeningRequestData'->'ScreeningResults'->>'AlertCount' AS alert_count,
-            users_aml_log.response::json->'ScreeningRequestData'->'ScreeningResults'->'Alerts' AS alerts,
-            users_aml_log.response::json->'ScreeningRequestData'->'ScreeningResults'->>'ReportData' AS report_data,
-            users_aml.decision AS aml_isHit
-        FROM users_masteruser user_master
+AML_FIELDS = {
+    "matched_status": ("users_aml_log.response::json->'ScreeningRequestData'->'ScreeningResults'->>'Matched'", "log"),
+    "alert_count": ("users_aml_log.response::json->'ScreeningRequestData'->'ScreeningResults'->>'AlertCount'", "log"),
+    "alerts": ("users_aml_log.response::json->'ScreeningRequestData'->'ScreeningResults'->'Alerts'", "log"),
+    "report_data": ("users_aml_log.response::json->'ScreeningRequestData'->'ScreeningResults'->>'ReportData'", "log"),
+    "aml_ishit": ("users_aml.decision", "aml"),
+}
+
+AML_JOINS = {
+    "aml": """
         LEFT JOIN users_amlresponsedata users_aml 
-            ON users_aml.master_user_id = user_master.id     
+            ON users_aml.master_user_id = user_master.id""",
+    "log": """
         LEFT JOIN users_amlrequestresponselog users_aml_log
-            ON users_aml.application_id = users_aml_log.application_id     
+            ON users_aml.application_id = users_aml_log.application_id""",
+}
+
+# Pages through the Alerts array in SQL; anything that is not an array is returned as is
+ALERTS_PAGE_SQL = """CASE WHEN json_typeof({alerts}) = 'array' THEN (
+            SELECT json_agg(alert ORDER BY idx)
+            FROM json_array_elements({alerts}) WITH ORDINALITY AS page(alert, idx)
+            WHERE idx > CAST(:alerts_offset AS integer) AND idx <= CAST(:alerts_offset AS integer) + CAST(:max_alerts AS integer)
+        ) ELSE {alerts} END"""
+ALERTS_TOTAL_SQL = "CASE WHEN json_typeof({alerts}) = 'array' THEN json_array_length({alerts}) END"
+
+def get_aml_details(conn: Connection, user_id: int, fields: Optional[Iterable[str]] = None,
+                    max_alerts: Optional[int] = None, alerts_offset: int = 0) -> dict:
+    """
+    AML decision and screening response for a user. With `max_alerts` only
+    that many Alerts (from `alerts_offset`) are returned, plus `alerts_total`.
+    """
+    fields = select_fields(AML_FIELDS, fields)
+    if not fields:
+        return {}
+    apply_session_profile(conn, JSON_EXTRACTION)
+    field_map = AML_FIELDS
+    if max_alerts is not None and "alerts" in fields:
+        alerts = AML_FIELDS["alerts"][0]
+        field_map = dict(AML_FIELDS,
+                         alerts=(ALERTS_PAGE_SQL.format(alerts=alerts), "log"),
+                         alerts_total=(ALERTS_TOTAL_SQL.format(alerts=alerts), "log"))
+        fields = fields + ["alerts_total"]
+    columns, _ = build_projection(field_map, {}, fields)
+    needed = {field_map[field][1] for field in fields}
+    # The log is reached through the AML response row
+    joins = AML_JOINS["aml"] + (AML_JOINS["log"] if "log" in needed else "")
+    query = f"""
+        SELECT 
+            {columns}
+        FROM users_masteruser user_master{joins}
         WHERE user_master.id = :user_id 
         LIMIT 1
     """
-    result = conn.execute(text(query), {"user_id": user_id})
+    result = conn.execute(text(query), {"user_id": user_id, "max_alerts": max_alerts, "alerts_offset": alerts_offset})
     row = result.fetchone()
     return dict(row._mapping) if row else {}
 
@@ -372,6 +603,7 @@ def get_user_address(conn: Connection, user_id: int) -> dict:
         FROM users_address 
         WHERE master_user_id = :user_id AND is_valid = true
     """
+    apply_session_profile(conn, POINT_LOOKUP)
     result = conn.execute(text(query), {"user_id": user_id})
     addresses = [dict(row._mapping) for row in result]
     # Map address_type: 1 = current, 2 = communication
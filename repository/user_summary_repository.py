@@ -0,0 +1,396 @@
+#repository/user_summary_repository.py
+"""
+Reads and incremental refresh for the precomputed user_summary table
+(DDL in db/sql/user_summary.sql).
+
+With read_mode 'summary' the get_user_details header, the get_user_kyc_info
+KYC status and a get_user_aml_status request for the decision alone are
+primary key reads of the summary row; users not yet summarised fall back
+to the live queries.
+
+The refresh only reprocesses users whose source rows changed since the
+last run, based on per-table timestamp columns configured under the
+connection's `user_summary` section in config/databases.yaml.
+"""
+
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import text
+
+from db.session_profiles import apply_session_profile, POINT_LOOKUP
+from repository.user_repository import (
+    HEADER_FIELDS,
+    build_projection,
+    get_aml_details,
+    get_user_header_details,
+    project_fields,
+    select_fields,
+)
+
+# Result-cache sections (repository/user_cache.py) that read_mode 'summary' serves from user_summary
+SUMMARY_SECTIONS = ("header", "kyc_status", "aml")
+
+# Source tables and how a changed row maps back to users_masteruser.id.
+# `{ts}` is replaced with the configured timestamp column for that table.
+CHANGED_USERS_SQL = {
+    "users_masteruser": "SELECT id AS user_id FROM users_masteruser WHERE {ts} > :since",
+    "users_pan": "SELECT master_user_id AS user_id FROM users_pan WHERE {ts} > :since",
+    "users_aadhaar": "SELECT master_user_id AS user_id FROM users_aadhaar WHERE {ts} > :since",
+    "users_kycverification": "SELECT master_user_id AS user_id FROM users_kycverification WHERE {ts} > :since",
+    "users_amlresponsedata": "SELECT master_user_id AS user_id FROM users_amlresponsedata WHERE {ts} > :since",
+    "users_phonenumber": """
+        SELECT um.id AS user_id FROM users_phonenumber p
+        JOIN users_masteruser um ON um.phone_id = p.phone
+        WHERE p.{ts} > :since""",
+    "users_email": """
+        SELECT um.id AS user_id FROM users_email e
+        JOIN users_masteruser um ON um.email_id = e.email
+        WHERE e.{ts} > :since""",
+}
+
+DEFAULT_TIMESTAMP_COLUMNS = {
+    "users_masteruser": "updated_at",
+    "users_pan": "updated_at",
+    "users_aadhaar": "updated_at",
+    "users_kycverification": "updated_at",
+    "users_amlresponsedata": "updated_at",
+    "users_phonenumber": "updated_at",
+    "users_email": "updated_at",
+}
+
+_IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+PAN_STATUS_SQL = """CASE
+            WHEN user_pan.status = 10 THEN 'Pending'
+            WHEN user_pan.status = 20 THEN 'Completed'
+            WHEN user_pan.status = 30 THEN 'PreApproved'
+            WHEN user_pan.status = 40 THEN 'Approved'
+            WHEN user_pan.status = 50 THEN 'Rejected'
+            WHEN user_pan.status = 100 THEN 'Expired'
+            WHEN user_pan.status IS NULL THEN NULL
+            ELSE 'Unknown Status'
+        END"""
+
+AADHAAR_STATUS_SQL = """CASE
+            WHEN user_aadhaar.status = 10 THEN 'Pending'
+            WHEN user_aadhaar.status = 15 THEN 'Completed'
+            WHEN user_aadhaar.status = 20 THEN 'Submitted'
+            WHEN user_aadhaar.status = 30 THEN 'PreApproved'
+            WHEN user_aadhaar.status = 40 THEN 'Approved'
+            WHEN user_aadhaar.status = 50 THEN 'Rejected'
+            WHEN user_aadhaar.status = 100 THEN 'Expired'
+            WHEN user_aadhaar.status = 150 THEN 'Frozen'
+            WHEN user_aadhaar.status IS NULL THEN NULL
+            ELSE 'Unknown'
+        END"""
+
+# Latest KYC verification, valid first; shared by the summary refresh and the live KYC status
+KYC_VERIFICATION_JOIN = """
+    LEFT JOIN LATERAL (
+        SELECT mode, is_valid, expiry_date FROM users_kycverification
+        WHERE master_user_id = user_master.id
+        ORDER BY is_valid DESC, id DESC LIMIT 1
+    ) user_kyc ON true"""
+
+UPSERT_SUMMARY_SQL = """
+    INSERT INTO user_summary (
+        user_id, customer_id, full_name, first_name, middle_name, last_name,
+        gender, date_of_birth, email_address, phone_id,
+        pan_number, pan_is_valid, pan_status_text,
+        aadhaar_digits, aadhaar_is_valid, aadhaar_status, document_image,
+        kyc_mode, kyc_is_valid, kyc_expiry_date,
+        phone_number, otp_verification_time, email_verified_at,
+        aml_decision, refreshed_at
+    )
+    SELECT
+        user_master.id,
+        user_master.customer_id,
+        user_master.name,
+        user_master.first_name,
+        user_master.middle_name,
+        user_master.last_name,
+        user_master.gender,
+        user_master.date_of_birth,
+        user_master.email_id,
+        user_master.phone_id,
+        user_pan.number,
+        user_pan.is_valid,
+        {pan_status},
+        user_aadhaar.digits,
+        user_aadhaar.is_valid,
+        {aadhaar_status},
+        user_aadhaar.document_image,
+        user_kyc.mode,
+        user_kyc.is_valid,
+        user_kyc.expiry_date,
+        user_phone.phone,
+        user_phone.otp_verified_at,
+        user_email.verified_at,
+        users_aml.decision,
+        now()
+    FROM users_masteruser user_master
+    LEFT JOIN LATERAL (
+        SELECT number, is_valid, status FROM users_pan
+        WHERE master_user_id = user_master.id AND is_valid = true
+        ORDER BY id DESC LIMIT 1
+    ) user_pan ON true
+    LEFT JOIN LATERAL (
+        SELECT digits, is_valid, status, embedded_data->'photo'->>'document_image' AS document_image
+        FROM users_aadhaar
+        WHERE master_user_id = user_master.id AND is_valid = true
+        ORDER BY id DESC LIMIT 1
+    ) user_aadhaar ON true{kyc_join}
+    LEFT JOIN LATERAL (
+        SELECT phone, otp_verified_at FROM users_phonenumber
+        WHERE phone = user_master.phone_id
+        ORDER BY id DESC LIMIT 1
+    ) user_phone ON true
+    LEFT JOIN LATERAL (
+        SELECT verified_at FROM users_email
+        WHERE email = user_master.email_id
+        ORDER BY id DESC LIMIT 1
+    ) user_email ON true
+    LEFT JOIN LATERAL (
+        SELECT decision FROM users_amlresponsedata
+        WHERE master_user_id = user_master.id
+        ORDER BY id DESC LIMIT 1
+    ) users_aml ON true
+    WHERE user_master.id = ANY(:user_ids)
+    ON CONFLICT (user_id) DO UPDATE SET
+        customer_id = EXCLUDED.customer_id,
+        full_name = EXCLUDED.full_name,
+        first_name = EXCLUDED.first_name,
+        middle_name = EXCLUDED.middle_name,
+        last_name = EXCLUDED.last_name,
+        gender = EXCLUDED.gender,
+        date_of_birth = EXCLUDED.date_of_birth,
+        email_address = EXCLUDED.email_address,
+        phone_id = EXCLUDED.phone_id,
+        pan_number = EXCLUDED.pan_number,
+        pan_is_valid = EXCLUDED.pan_is_valid,
+        pan_status_text = EXCLUDED.pan_status_text,
+        aadhaar_digits = EXCLUDED.aadhaar_digits,
+        aadhaar_is_valid = EXCLUDED.aadhaar_is_valid,
+        aadhaar_status = EXCLUDED.aadhaar_status,
+        document_image = EXCLUDED.document_image,
+        kyc_mode = EXCLUDED.kyc_mode,
+        kyc_is_valid = EXCLUDED.kyc_is_valid,
+        kyc_expiry_date = EXCLUDED.kyc_expiry_date,
+        phone_number = EXCLUDED.phone_number,
+        otp_verification_time = EXCLUDED.otp_verification_time,
+        email_verified_at = EXCLUDED.email_verified_at,
+        aml_decision = EXCLUDED.aml_decision,
+        refreshed_at = EXCLUDED.refreshed_at
+""".format(pan_status=PAN_STATUS_SQL, aadhaar_status=AADHAAR_STATUS_SQL, kyc_join=KYC_VERIFICATION_JOIN)
+
+# KYC status of get_user_kyc_info: field -> (live expression, join), summary column
+KYC_STATUS_FIELDS = {
+    "kyc_mode": ("user_kyc.mode", "kyc"),
+    "kyc_is_valid": ("user_kyc.is_valid", "kyc"),
+    "kyc_expiry_date": ("user_kyc.expiry_date", "kyc"),
+    "pan_status": (PAN_STATUS_SQL, "pan"),
+    "aadhaar_status": (AADHAAR_STATUS_SQL, "aadhaar"),
+}
+KYC_STATUS_SUMMARY_COLUMNS = {
+    "kyc_mode": "kyc_mode",
+    "kyc_is_valid": "kyc_is_valid",
+    "kyc_expiry_date": "kyc_expiry_date",
+    "pan_status": "pan_status_text",
+    "aadhaar_status": "aadhaar_status",
+}
+KYC_STATUS_JOINS = {
+    "kyc": KYC_VERIFICATION_JOIN,
+    "pan": """
+    LEFT JOIN LATERAL (
+        SELECT status FROM users_pan
+        WHERE master_user_id = user_master.id AND is_valid = true
+        ORDER BY id DESC LIMIT 1
+    ) user_pan ON true""",
+    "aadhaar": """
+    LEFT JOIN LATERAL (
+        SELECT status FROM users_aadhaar
+        WHERE master_user_id = user_master.id AND is_valid = true
+        ORDER BY id DESC LIMIT 1
+    ) user_aadhaar ON true""",
+}
+
+
+def _changed_users_query(timestamp_columns: Dict[str, str]) -> str:
+    parts = []
+    for table, template in CHANGED_USERS_SQL.items():
+        column = timestamp_columns.get(table)
+        if not column:
+            continue
+        if not _IDENTIFIER_RE.match(column):
+            raise ValueError(f"Invalid timestamp column for {table}: {column!r}")
+        parts.append(template.format(ts=column))
+    if not parts:
+        raise ValueError("No timestamp columns configured for user_summary refresh")
+    return "SELECT DISTINCT user_id FROM (\n" + "\nUNION ALL\n".join(parts) + "\n) changed WHERE user_id IS NOT NULL"
+
+
+def get_last_refreshed_at(conn: Connection) -> Optional[datetime]:
+    row = conn.execute(text("SELECT last_refreshed_at FROM user_summary_refresh_state WHERE id = 1")).fetchone()
+    return row[0] if row else None
+
+
+def find_changed_user_ids(conn: Connection, since: datetime,
+                          timestamp_columns: Optional[Dict[str, str]] = None) -> List[int]:
+    """Users with any source row modified after `since`"""
+    query = _changed_users_query(timestamp_columns or DEFAULT_TIMESTAMP_COLUMNS)
+    return [row[0] for row in conn.execute(text(query), {"since": since})]
+
+
+def upsert_user_summaries(conn: Connection, user_ids: Iterable[int], batch_size: int = 1000) -> int:
+    """Recompute summary rows for the given users; returns the number of users processed"""
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), batch_size):
+        conn.execute(text(UPSERT_SUMMARY_SQL), {"user_ids": user_ids[start:start + batch_size]})
+    return len(user_ids)
+
+
+def refresh_user_summary(conn: Connection, timestamp_columns: Optional[Dict[str, str]] = None,
+                         batch_size: int = 1000, overlap_seconds: int = 60,
+                         full: bool = False) -> Dict[str, Any]:
+    """
+    Incrementally refresh user_summary and advance the watermark.
+    The watermark is the database time at the start of the run; the next run
+    re-reads `overlap_seconds` before it to cover transactions still in flight.
+    Must run on a writable connection; commits per batch.
+    """
+    run_started_at = conn.execute(text("SELECT now()")).scalar()
+    last = get_last_refreshed_at(conn)
+
+    if full or last is None:
+        user_ids = [row[0] for row in conn.execute(text("SELECT id FROM users_masteruser"))]
+        since = None
+    else:
+        since = last - timedelta(seconds=overlap_seconds)
+        user_ids = find_changed_user_ids(conn, since, timestamp_columns)
+    conn.commit()
+
+    processed = 0
+    for start in range(0, len(user_ids), batch_size):
+        processed += upsert_user_summaries(conn, user_ids[start:start + batch_size], batch_size)
+        conn.commit()
+
+    conn.execute(text("""
+        INSERT INTO user_summary_refresh_state (id, last_refreshed_at, users_refreshed)
+        VALUES (1, :ts, :n)
+        ON CONFLICT (id) DO UPDATE SET
+            last_refreshed_at = EXCLUDED.last_refreshed_at,
+            users_refreshed = user_summary_refresh_state.users_refreshed + EXCLUDED.users_refreshed
+    """), {"ts": run_started_at, "n": processed})
+    conn.commit()
+
+    return {
+        "since": since,
+        "watermark": run_started_at,
+        "users_refreshed": processed,
+        "full": since is None,
+    }
+
+
+def get_user_summary(conn: Connection, user_id: int) -> dict:
+    """Single-row primary key read of the precomputed summary"""
+    apply_session_profile(conn, POINT_LOOKUP)
+    row = conn.execute(text("SELECT * FROM user_summary WHERE user_id = :user_id"), {"user_id": user_id}).fetchone()
+    return dict(row._mapping) if row else {}
+
+
+def summary_to_header_details(summary: dict) -> dict:
+    """Shape a summary row like repository.user_repository.get_user_header_details"""
+    if not summary:
+        return {}
+    return {
+        "user_id": summary["user_id"],
+        "full_name": summary["full_name"],
+        "first_name": summary["first_name"],
+        "middle_name": summary["middle_name"],
+        "last_name": summary["last_name"],
+        "email_address": summary["email_address"],
+        "phone_id": summary["phone_id"],
+        "pan_number": summary["pan_number"],
+        "aadhaar_digits": summary["aadhaar_digits"],
+        "document_image": summary["document_image"],
+        "phone_number": summary["phone_number"],
+        "otp_verification_time": summary["otp_verification_time"],
+        "email_verified_at": summary["email_verified_at"],
+        "is_valid": summary["pan_is_valid"],
+        "aml_ishit": summary["aml_decision"],
+    }
+
+
+def get_user_header_details_from_summary(conn: Connection, user_id: int) -> dict:
+    return summary_to_header_details(get_user_summary(conn, user_id))
+
+
+def get_user_header_details_for_mode(conn: Connection, user_id: int, read_mode: str = 'live',
+                                     fields: Optional[Iterable[str]] = None) -> dict:
+    """
+    Header lookup honouring the configured read mode: 'summary' reads the
+    precomputed row and falls back to the live joins for users not yet summarised.
+    """
+    fields = select_fields(HEADER_FIELDS, fields)
+    if read_mode == 'summary':
+        header = get_user_header_details_from_summary(conn, user_id)
+        if header:
+            return project_fields(header, fields)
+    return get_user_header_details(conn, user_id, fields)
+
+
+def get_user_kyc_status(conn: Connection, user_id: int, fields: Optional[Iterable[str]] = None) -> dict:
+    """Latest KYC verification and PAN/Aadhaar status, from the live tables"""
+    fields = select_fields(KYC_STATUS_FIELDS, fields)
+    if not fields:
+        return {}
+    apply_session_profile(conn, POINT_LOOKUP)
+    columns, joins = build_projection(KYC_STATUS_FIELDS, KYC_STATUS_JOINS, fields)
+    query = f"""
+    SELECT
+        {columns}
+    FROM users_masteruser user_master{joins}
+    WHERE user_master.id = :user_id
+    """
+    row = conn.execute(text(query), {"user_id": user_id}).fetchone()
+    return dict(row._mapping) if row else {}
+
+
+def kyc_status_wanted(read_mode: str, fields: Optional[Iterable[str]]) -> bool:
+    """
+    Whether a KYC lookup should include the status section. It's free from
+    the summary row, but in live mode it's one more query per call, so then
+    only when a status field was asked for by name.
+    """
+    if read_mode == 'summary':
+        return fields != []
+    return bool(fields)
+
+
+def get_user_kyc_status_for_mode(conn: Connection, user_id: int, read_mode: str = 'live',
+                                 fields: Optional[Iterable[str]] = None) -> dict:
+    """KYC status honouring the read mode, like get_user_header_details_for_mode"""
+    fields = select_fields(KYC_STATUS_FIELDS, fields)
+    if read_mode == 'summary':
+        summary = get_user_summary(conn, user_id)
+        if summary:
+            return {field: summary[KYC_STATUS_SUMMARY_COLUMNS[field]] for field in fields}
+    return get_user_kyc_status(conn, user_id, fields)
+
+
+def get_aml_details_for_mode(conn: Connection, user_id: int, read_mode: str = 'live',
+                             fields: Optional[Iterable[str]] = None, max_alerts: Optional[int] = None,
+                             alerts_offset: int = 0) -> dict:
+    """
+    AML lookup honouring the read mode: a request for the decision alone
+    (fields=['aml_ishit']) is served from the summary row; the screening
+    response is only in the live tables.
+    """
+    if read_mode == 'summary' and fields and set(fields) == {'aml_ishit'}:
+        summary = get_user_summary(conn, user_id)
+        if summary:
+            return {"aml_ishit": summary["aml_decision"]}
+    return get_aml_details(conn, user_id, fields, max_alerts, alerts_offset)
@@ -0,0 +1,257 @@
+# File: seed_fixture.py - Create and fill the local fixture database with synthetic users
+"""
+Applies db/sql/fixture_schema.sql (plus the repository's index and
+user_summary files) to a fixture connection and fills it with synthetic
+users, so query_plan_check.py and the benchmarks run without production
+data:
+
+    python seed_fixture.py                          # fixture_postgres, 100000 users
+    python seed_fixture.py --users 500000 --photo-bytes 4096
+
+Every user gets a PAN, an Aadhaar with a photo, a KYC verification, two
+addresses, extra details, phone/email verification rows and an AML
+response with its screening log. Every HEAVY_EVERY-th user carries a long
+PAN / Aadhaar / AML history, the shape that multiplies rows in joins.
+Identifiers are generated from the user id (fixture_phone, fixture_email)
+in ranges no real customer has: 555 phone numbers, @fixture.test emails.
+
+Seeding empties the fixture tables first, so only connections named
+fixture_* are accepted.
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from sqlalchemy import text
+
+from db.base_connector import load_db_config
+from db.postgres_connector import PostgresConnector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("payu-fin-fixture")
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db', 'sql')
+# Applied in order; the index files use CREATE INDEX CONCURRENTLY, so everything runs in autocommit
+SCHEMA_FILES = (
+    'fixture_schema.sql',
+    'user_summary.sql',
+    'header_details_indexes.sql',
+    'identifier_index_indexes.sql',
+    'name_search_indexes.sql',
+)
+
+PHONE_BASE = 5550000000
+HEAVY_EVERY = 1000
+
+# Users the benchmarks and config/query_plans.yaml use by default
+FIXTURE_USER_ID = HEAVY_EVERY          # long PAN / Aadhaar / AML history, AML hit
+FIXTURE_CKYC_USER_ID = 1003            # KYC done through CKYC (mode 3)
+FIXTURE_NAME = "Sankar Rao"
+
+FIXTURE_TABLES = (
+    'users_masteruser', 'users_masteruserextra', 'users_pan', 'users_aadhaar', 'users_kycverification',
+    'users_ckyc', 'users_address', 'users_phonenumber', 'users_email', 'users_amlresponsedata',
+    'users_amlrequestresponselog',
+)
+
+FIRST_NAMES = "ARRAY['Sankar', 'Priya', 'Arjun', 'Lakshmi', 'Rahul', 'Anita', 'Vikram', 'Deepa', " \
+              "'Suresh', 'Kavya', 'Imran', 'Meera']"
+LAST_NAMES = "ARRAY['Rao', 'Sharma', 'Iyer', 'Patel', 'Reddy', 'Nair', 'Gupta', 'Das', 'Singh', 'Menon']"
+
+SEED_STATEMENTS = (
+    ("users_masteruser", f"""
+        INSERT INTO users_masteruser (id, customer_id, name, first_name, middle_name, last_name, gender,
+                                      date_of_birth, email_id, phone_id, um_uuid, created_at, updated_at)
+        SELECT g, 'FXC' || lpad(g::text, 9, '0'),
+               concat_ws(' ', n.first_name, n.middle_name, n.last_name), n.first_name, n.middle_name, n.last_name,
+               CASE WHEN g % 2 = 0 THEN 'F' ELSE 'M' END,
+               date '1960-01-01' + (g * 37 % 15000)::int,
+               'user' || g || '@fixture.test',
+               '+91' || (:phone_base + g),
+               md5('fixture-user-' || g)::uuid,
+               now() - (g % 1000) * interval '1 day',
+               now() - (g % 1000) * interval '1 hour'
+        FROM generate_series(1, :users) g
+        CROSS JOIN LATERAL (
+            SELECT ({FIRST_NAMES})[1 + (g % 12)::int] AS first_name,
+                   CASE WHEN g % 5 = 0 THEN 'Kumar' END AS middle_name,
+                   ({LAST_NAMES})[1 + (g / 12 % 10)::int] AS last_name
+        ) n
+    """),
+    ("users_masteruserextra", """
+        INSERT INTO users_masteruserextra (master_user_id, mother_name, father_name, spouse_name, alternate_phone,
+                                           community, marital_status, educational_qualification, category,
+                                           updated_at)
+        SELECT id, 'Fixture Mother ' || id, 'Fixture Father ' || id,
+               CASE WHEN id % 3 = 0 THEN 'Fixture Spouse ' || id END,
+               '+91' || (:phone_base + :users + id), 'General',
+               CASE WHEN id % 3 = 0 THEN 'Married' ELSE 'Single' END, 'Graduate', 'Individual', updated_at
+        FROM users_masteruser
+    """),
+    ("users_pan", """
+        INSERT INTO users_pan (master_user_id, number, nsdl_name, nsdl_valid, date_of_birth, gender, is_valid,
+                               status, created_at, updated_at)
+        SELECT um.id,
+               'FX' || chr(65 + (um.id % 26)::int) || chr(65 + (um.id / 26 % 26)::int) || 'P'
+                    || lpad((um.id % 10000)::text, 4, '0') || chr(65 + (h.n % 26)::int),
+               upper(um.name), true, um.date_of_birth, um.gender,
+               h.n = h.copies, CASE WHEN h.n = h.copies THEN 40 ELSE 100 END,
+               um.created_at + h.n * interval '1 day', um.updated_at
+        FROM users_masteruser um
+        CROSS JOIN LATERAL (
+            SELECT n, copies FROM (SELECT CASE WHEN um.id % :heavy_every = 0 THEN 20 ELSE 1 END AS copies) r,
+                                generate_series(1, r.copies) n
+        ) h
+    """),
+    ("users_aadhaar", """
+        INSERT INTO users_aadhaar (master_user_id, digits, name, gender, date_of_birth, phone_linked, is_valid,
+                                   status, embedded_data, updated_at)
+        SELECT um.id, lpad(((um.id * 7 + h.n) % 10000)::text, 4, '0'), um.name, um.gender, um.date_of_birth, true,
+               h.n = h.copies, CASE WHEN h.n = h.copies THEN 40 ELSE 100 END,
+               jsonb_build_object(
+                   'photo', jsonb_build_object('document_image', repeat('A', :photo_bytes)),
+                   'original_kyc_info', jsonb_build_object('careof', 'S/O Fixture Father ' || um.id,
+                                                           'address', um.id || ' Fixture Street'),
+                   'ts', to_char(um.created_at, 'YYYY-MM-DD"T"HH24:MI:SS')),
+               um.updated_at
+        FROM users_masteruser um
+        CROSS JOIN LATERAL (
+            SELECT n, copies FROM (SELECT CASE WHEN um.id % :heavy_every = 0 THEN 10 ELSE 1 END AS copies) r,
+                                generate_series(1, r.copies) n
+        ) h
+    """),
+    ("users_kycverification", """
+        INSERT INTO users_kycverification (master_user_id, mode, aadhaar_id, source_id, is_valid, expiry_date,
+                                           updated_at)
+        SELECT master_user_id,
+               CASE WHEN master_user_id % 10 = 3 THEN 3 ELSE (ARRAY[1, 2, 4, 5])[1 + (master_user_id % 4)::int] END,
+               id, id, true, current_date + (master_user_id % 700)::int, updated_at
+        FROM users_aadhaar
+        WHERE is_valid
+    """),
+    ("users_ckyc", """
+        INSERT INTO users_ckyc (master_user_id, number, aadhaar_digits, phone, ckyc_data_origin, ckyc_source,
+                                base_search_type, document_ids, validation_failures, details, is_confirmed,
+                                is_valid, status, updated_at)
+        SELECT id, 'FXCKYC' || lpad(id::text, 8, '0'), lpad((id % 10000)::text, 4, '0'), phone_id,
+               'search', 'fixture', 'PAN', '[1, 2]'::jsonb, '[]'::jsonb,
+               jsonb_build_object('search', jsonb_build_object(
+                   'NAME', upper(name), 'KYC_DATE', to_char(created_at, 'DD-MM-YYYY'),
+                   'FATHERS_NAME', 'FIXTURE FATHER ' || id)),
+               true, true, 40, updated_at
+        FROM users_masteruser
+        WHERE id % 10 = 3
+    """),
+    ("users_address", """
+        INSERT INTO users_address (master_user_id, address_type, line1, line2, city, state, postal_code_id,
+                                   status, is_valid, updated_at)
+        SELECT um.id, t, um.id || ' Fixture Street', 'Block ' || t,
+               (ARRAY['Bengaluru', 'Mumbai', 'Chennai', 'Hyderabad', 'Pune'])[1 + (um.id % 5)::int],
+               (ARRAY['Karnataka', 'Maharashtra', 'Tamil Nadu', 'Telangana', 'Maharashtra'])[1 + (um.id % 5)::int],
+               560000 + um.id % 100, 40, true, um.updated_at
+        FROM users_masteruser um
+        CROSS JOIN generate_series(1, 2) t
+    """),
+    ("users_phonenumber", """
+        INSERT INTO users_phonenumber (phone, otp_verified_at, updated_at)
+        SELECT phone_id, created_at, updated_at FROM users_masteruser
+    """),
+    ("users_email", """
+        INSERT INTO users_email (email, verified_at, updated_at)
+        SELECT email_id, CASE WHEN id % 4 <> 0 THEN created_at END, updated_at FROM users_masteruser
+    """),
+    ("users_amlresponsedata", """
+        INSERT INTO users_amlresponsedata (master_user_id, application_id, decision, updated_at)
+        SELECT um.id, 'FXAPP-' || um.id || '-' || n, CASE WHEN um.id % 20 = 0 THEN 'Hit' ELSE 'NoHit' END,
+               um.updated_at
+        FROM users_masteruser um
+        CROSS JOIN LATERAL generate_series(1, CASE WHEN um.id % :heavy_every = 0 THEN 50 ELSE 1 END) n
+    """),
+    ("users_amlrequestresponselog", """
+        INSERT INTO users_amlrequestresponselog (application_id, response, updated_at)
+        SELECT aml.application_id,
+               json_build_object('ScreeningRequestData', json_build_object('ScreeningResults', json_build_object(
+                   'Matched', CASE WHEN aml.decision = 'Hit' THEN 'Yes' ELSE 'No' END,
+                   'AlertCount', alerts.alert_count,
+                   'Alerts', COALESCE(alerts.items, '[]'::json),
+                   'ReportData', 'Fixture screening report ' || aml.application_id)))::text,
+               aml.updated_at
+        FROM users_amlresponsedata aml
+        CROSS JOIN LATERAL (
+            SELECT count(*) AS alert_count,
+                   json_agg(json_build_object('AlertId', aml.application_id || '-' || i,
+                                              'Score', i * 7 % 100, 'WatchList', 'FIXTURE')) AS items
+            FROM generate_series(1, CASE WHEN aml.decision = 'Hit' THEN :alerts_per_hit ELSE 0 END) i
+        ) alerts
+    """),
+)
+
+
+def fixture_phone(user_id: int) -> str:
+    """10-digit phone number of a seeded user (stored as +91<phone> in users_masteruser.phone_id)"""
+    return str(PHONE_BASE + user_id)
+
+
+def fixture_email(user_id: int) -> str:
+    return f"user{user_id}@fixture.test"
+
+
+def sql_statements(path: str):
+    """Statements of a plain SQL file (comment lines dropped, split on ';')"""
+    with open(path, 'r') as f:
+        body = "\n".join(line for line in f.read().splitlines() if not line.lstrip().startswith('--'))
+    return [statement.strip() for statement in body.split(';') if statement.strip()]
+
+
+def apply_schema(connector: PostgresConnector):
+    with connector.get_conn() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        for name in SCHEMA_FILES:
+            logger.info(f"📐 Applying db/sql/{name}")
+            for statement in sql_statements(os.path.join(SQL_DIR, name)):
+                conn.execute(text(statement))
+
+
+def seed(connector: PostgresConnector, users: int, photo_bytes: int, alerts_per_hit: int):
+    params = {"users": users, "phone_base": PHONE_BASE, "heavy_every": HEAVY_EVERY,
+              "photo_bytes": photo_bytes, "alerts_per_hit": alerts_per_hit}
+    with connector.get_conn() as conn:
+        with conn.begin():
+            conn.execute(text(f"TRUNCATE {', '.join(FIXTURE_TABLES)}, user_summary, user_summary_refresh_state "
+                              f"RESTART IDENTITY"))
+            for table, statement in SEED_STATEMENTS:
+                started = time.perf_counter()
+                count = conn.execute(text(statement), params).rowcount
+                logger.info(f"🌱 {table}: {count} rows in {time.perf_counter() - started:.1f}s")
+        # Plans only look like production's once the planner has statistics
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text(f"ANALYZE {', '.join(FIXTURE_TABLES)}"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create and seed the local fixture database")
+    parser.add_argument('--connection', default='fixture_postgres', help="A fixture_* connection; its tables are emptied")
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--photo-bytes', type=int, default=2048, help="Size of each Aadhaar photo placeholder")
+    parser.add_argument('--alerts-per-hit', type=int, default=25, help="Screening alerts per AML hit")
+    args = parser.parse_args(argv)
+
+    if not args.connection.startswith('fixture_'):
+        parser.error(f"Refusing to seed '{args.connection}': only fixture_* connections are emptied and seeded")
+    if args.users < FIXTURE_CKYC_USER_ID:
+        parser.error(f"--users must be at least {FIXTURE_CKYC_USER_ID} so the default fixture users exist")
+
+    env, db_conns = load_db_config()
+    connector = PostgresConnector(db_conns[args.connection], environment=env)
+    try:
+        apply_schema(connector)
+        seed(connector, args.users, args.photo_bytes, args.alerts_per_hit)
+    finally:
+        connector.close()
+    print(f"✅ Seeded {args.users} users into {args.connection}; e.g. user {FIXTURE_USER_ID}, "
+          f"phone {fixture_phone(FIXTURE_USER_ID)}, email {fixture_email(FIXTURE_USER_ID)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+# File: tool_batch.py - Several tool invocations in one request
+"""
+Body of POST /api/tools/batch:
+
+    {
+      "invocations": [
+        {"id": "user", "tool": "search_users", "parameters": {"search_term": "9845267602"}},
+        {"id": "kyc",  "tool": "get_user_kyc_info", "parameters": {"user_id": "{{user.users[0].id}}"}},
+        {"id": "aml",  "tool": "get_user_aml_status", "parameters": {"user_id": "{{user.users[0].id}}"}}
+      ]
+    }
+
+A parameter whose whole value is "{{<id>.<path>}}" is replaced by that
+value from an earlier invocation's result, and makes the invocation depend
+on it; "depends_on": [ids] adds ordering without a reference. Invocations
+run in waves: everything whose dependencies are done runs concurrently
+(each on its own pooled connection), so the example is two round trips to
+the database instead of three HTTP requests.
+
+Results come back in request order, one per invocation, with the status
+the single-tool route would have returned (424 when a dependency failed).
+The batch itself only fails (400) when it is malformed.
+"""
+
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from tool_service import TOOL_NAMES
+
+DEFAULT_MAX_INVOCATIONS = 20
+DEFAULT_MAX_CONCURRENCY = 4
+
+_REFERENCE_RE = re.compile(r'^\{\{\s*([^{}.\[\]\s]+)((?:\.[^.\[\]\s{}]+|\[\d+\])*)\s*\}\}$')
+_PATH_PART_RE = re.compile(r'\.([^.\[\]]+)|\[(\d+)\]')
+
+
+def batch_limits(db_cfg: Dict[str, Any]) -> Tuple[int, int]:
+    """(max invocations per batch, concurrent calls per batch) from the connection's `batch` section"""
+    batch_cfg = db_cfg.get('batch') or {}
+    return (batch_cfg.get('max_invocations', DEFAULT_MAX_INVOCATIONS),
+            batch_cfg.get('max_concurrency', DEFAULT_MAX_CONCURRENCY))
+
+
+class BatchInvocation:
+    """One entry of a batch; references are (parameter, invocation id, path parts)"""
+
+    def __init__(self, index: int, invocation_id: str, tool: str, parameters: Dict[str, Any],
+                 depends_on: List[str], references: List[Tuple[str, str, List[Any]]]):
+        self.index = index
+        self.id = invocation_id
+        self.tool = tool
+        self.parameters = parameters
+        self.depends_on = depends_on
+        self.references = references
+
+
+def _parse_reference(value: Any) -> Optional[Tuple[str, List[Any]]]:
+    if not isinstance(value, str):
+        return None
+    match = _REFERENCE_RE.match(value)
+    if not match:
+        return None
+    # users[0].id and users.0.id both index into the list
+    path = [int(index or name) if (index or name.isdigit()) else name
+            for name, index in _PATH_PART_RE.findall(match.group(2))]
+    return match.group(1), path
+
+
+def _resolve_path(value: Any, path: List[Any]) -> Any:
+    for part in path:
+        value = value[part]
+    return value
+
+
+class ToolBatch:
+    """A validated batch, its execution waves and the outcomes recorded so far"""
+
+    def __init__(self, invocations: List[BatchInvocation]):
+        self.invocations = invocations
+        self.waves = self._waves(invocations)
+        self.outcomes: Dict[str, Dict[str, Any]] = {}
+        self.started = time.perf_counter()
+
+    @classmethod
+    def from_request(cls, data: Any, max_invocations: int) -> "ToolBatch":
+        """Parse and validate a request body (a list, or {"invocations": [...]}); raises ValueError"""
+        entries = data.get('invocations') if isinstance(data, dict) else data
+        if not isinstance(entries, list) or not entries:
+            raise ValueError("Expected a non-empty 'invocations' list")
+        if len(entries) > max_invocations:
+            raise ValueError(f"Too many invocations in one batch: {len(entries)} (max {max_invocations})")
+
+        invocations = []
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                raise ValueError(f"Invocation {index} must be an object")
+            tool = entry.get('tool')
+            if tool not in TOOL_NAMES:
+                raise ValueError(f"Invocation {index}: unknown tool: {tool}")
+            parameters = entry.get('parameters') or {}
+            if not isinstance(parameters, dict):
+                raise ValueError(f"Invocation {index}: 'parameters' must be an object")
+            depends_on = entry.get('depends_on') or []
+            if not isinstance(depends_on, list):
+                raise ValueError(f"Invocation {index}: 'depends_on' must be a list of ids")
+            references = []
+            for name, value in parameters.items():
+                reference = _parse_reference(value)
+                if reference:
+                    references.append((name, reference[0], reference[1]))
+            depends_on = list(dict.fromkeys([str(dep) for dep in depends_on] + [ref[1] for ref in references]))
+            invocations.append(BatchInvocation(index, str(entry.get('id', index)), tool, parameters,
+                                               depends_on, references))
+
+        ids = [invocation.id for invocation in invocations]
+        duplicates = sorted({invocation_id for invocation_id in ids if ids.count(invocation_id) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate invocation ids: {', '.join(duplicates)}")
+        for invocation in invocations:
+            unknown = [dep for dep in invocation.depends_on if dep not in ids]
+            if unknown:
+                raise ValueError(f"Invocation {invocation.id} depends on unknown ids: {', '.join(unknown)}")
+        return cls(invocations)
+
+    @staticmethod
+    def _waves(invocations: List[BatchInvocation]) -> List[List[BatchInvocation]]:
+        """Group invocations so each wave only depends on earlier ones; raises ValueError on cycles"""
+        done = set()
+        pending = list(invocations)
+        waves = []
+        while pending:
+            wave = [invocation for invocation in pending if all(dep in done for dep in invocation.depends_on)]
+            if not wave:
+                raise ValueError(f"Dependency cycle between invocations: {', '.join(i.id for i in pending)}")
+            waves.append(wave)
+            done.update(invocation.id for invocation in wave)
+            pending = [invocation for invocation in pending if invocation.id not in done]
+        return waves
+
+    def prepare(self, wave: List[BatchInvocation]) -> List[Tuple[BatchInvocation, Dict[str, Any]]]:
+        """
+        (invocation, resolved parameters) for the calls of a wave that can run;
+        the rest (failed dependency, unresolvable reference) are recorded here.
+        """
+        calls = []
+        for invocation in wave:
+            failed = [dep for dep in invocation.depends_on if not self.outcomes[dep]['success']]
+            if failed:
+                self.record(invocation, 424, error=f"Dependency failed: {', '.join(failed)}")
+                continue
+            parameters = dict(invocation.parameters)
+            try:
+                for name, dep, path in invocation.references:
+                    parameters[name] = _resolve_path(self.outcomes[dep]['result'], path)
+            except (KeyError, IndexError, TypeError):
+                self.record(invocation, 400, error=f"Cannot resolve {invocation.parameters[name]} for '{name}'")
+                continue
+            calls.append((invocation, parameters))
+        return calls
+
+    def record(self, invocation: BatchInvocation, status: int, result: Any = None, error: Optional[str] = None):
+        outcome = {"id": invocation.id, "tool": invocation.tool, "status": status, "success": status == 200}
+        if status == 200:
+            outcome["result"] = result
+        else:
+            outcome["error"] = error
+        self.outcomes[invocation.id] = outcome
+
+    def response(self) -> Dict[str, Any]:
+        results = [self.outcomes[invocation.id] for invocation in self.invocations]
+        succeeded = sum(1 for outcome in results if outcome['success'])
+        return {
+            "success": succeeded == len(results),
+            "results": results,
+            "total": len(results),
+            "succeeded": succeeded,
+            "waves": len(self.waves),
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1),
+        }
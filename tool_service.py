@@ -0,0 +1,366 @@
+# File: tool_service.py - Tool handlers shared by the HTTP and MCP servers
+"""
+The five user tools (search_users, get_user_details, get_user_kyc_info,
+get_user_aml_status, get_user_address) independent of the web framework.
+
+run_tool(name, conn, data) takes an open SQLAlchemy connection and the
+request parameters and returns the response body, raising ValueError for
+bad input. The Flask server (http_server.py) and the asyncio server
+(async_http_server.py, via AsyncConnection.run_sync) both call it, as do
+the MCP server (integrated_mcp_server.py, which only formats the body as
+text) and the orchestrator's plan sessions. The service also owns the per-process
+helpers the tools use: result cache, identifier index, search guard and
+result limits.
+"""
+
+import logging
+
+from db.notify_listener import UserChangeListener, replay_lsn
+from db.postgres_connector import PostgresConnector
+from repository.user_repository import (
+    get_users_with_narrowing as repo_get_users_with_narrowing,
+    get_additional_info as repo_get_additional_info,
+    get_user_pans as repo_get_user_pans,
+    get_user_aadhaar_kyc as repo_get_user_aadhaar_kyc,
+    get_user_ckyc as repo_get_user_ckyc,
+    get_user_address as repo_get_user_address,
+    project_fields,
+    split_fields,
+    HEADER_FIELDS,
+    ADDITIONAL_INFO_FIELDS,
+    PAN_FIELDS,
+    AADHAAR_KYC_FIELDS,
+    CKYC_FIELDS,
+    AML_FIELDS,
+    ADDRESS_FIELDS,
+    USER_SEARCH_FIELDS
+)
+from repository.user_summary_repository import (
+    get_user_header_details_for_mode as repo_get_user_header_details_for_mode,
+    get_user_kyc_status_for_mode as repo_get_user_kyc_status_for_mode,
+    kyc_status_wanted,
+    get_aml_details_for_mode as repo_get_aml_details_for_mode,
+    KYC_STATUS_FIELDS,
+    SUMMARY_SECTIONS
+)
+from repository.user_cache import UserResultCache
+from repository.identifier_index import IdentifierIndex, IdentifierIndexRefresher
+from repository.search_guard import SearchGuard
+from repository.result_limits import ResultLimits, UNLIMITED, enforce_byte_budget, mark_more_rows, page_rows
+from tracing import tracer
+
+logger = logging.getLogger("payu-fin-tools")
+
+TOOL_NAMES = ('search_users', 'get_user_details', 'get_user_kyc_info', 'get_user_aml_status', 'get_user_address')
+
+TOOL_DESCRIPTIONS = {
+    'search_users': "Search for users by phone, email, name, or ID",
+    'get_user_details': "Get comprehensive user details",
+    'get_user_kyc_info': "Get user KYC information",
+    'get_user_aml_status': "Get user AML status",
+    'get_user_address': "Get user address information",
+}
+
+
+def tool_listing(orchestrator_enabled):
+    """Body of GET /api/tools"""
+    tools = [
+        {
+            "name": name,
+            "description": TOOL_DESCRIPTIONS[name],
+            "endpoint": f"/api/tools/{name}",
+            "method": "POST"
+        }
+        for name in TOOL_NAMES
+    ]
+    if orchestrator_enabled:
+        tools.append({
+            "name": "ai_orchestrator",
+            "description": "Process complex queries with multi-tool coordination",
+            "endpoint": "/api/orchestrator/complex",
+            "method": "POST"
+        })
+    return {
+        "tools": tools,
+        "total_tools": len(tools),
+        "ai_orchestrator_enabled": orchestrator_enabled
+    }
+
+
+class ToolService:
+    """Tool handlers plus the caches and guards configured for one connection"""
+    
+    def __init__(self, env, db_conns, connection_name='pscore_postgres'):
+        self.env = env
+        self.db_conns = db_conns
+        self.db_cfg = db_conns[connection_name]
+        self.summary_read_mode = self.db_cfg.get('user_summary', {}).get('read_mode', 'live')
+        self.search_guard = SearchGuard.from_config(self.db_cfg.get('search_guard'))
+        self.result_limits = ResultLimits.from_config(self.db_cfg.get('result_limits'))
+        self.user_cache = None
+        self.change_listener = None
+        self.identifier_index = None
+        self.identifier_index_refresher = None
+        self._initialize_cache()
+        self._initialize_identifier_index()
+    
+    def shutdown(self):
+        """Stop the background listener and index refresher"""
+        if self.change_listener:
+            self.change_listener.stop()
+        if self.identifier_index_refresher:
+            self.identifier_index_refresher.stop()
+    
+    def _initialize_cache(self):
+        """Set up the per-user result cache and its NOTIFY-driven invalidation"""
+        cache_cfg = self.db_cfg.get('result_cache', {})
+        if not cache_cfg.get('enable', False):
+            return
+        section_ttl_seconds = {}
+        if self.summary_read_mode == 'summary':
+            # No NOTIFY fires when user_summary is refreshed; keep its rows no longer than one refresh interval
+            refresh_interval = self.db_cfg.get('user_summary', {}).get('refresh_interval_seconds', 300)
+            section_ttl_seconds = {section: refresh_interval for section in SUMMARY_SECTIONS}
+        self.user_cache = UserResultCache(
+            ttl_seconds=cache_cfg.get('ttl_seconds', 3600),
+            fallback_ttl_seconds=cache_cfg.get('fallback_ttl_seconds', 30),
+            max_entries=cache_cfg.get('max_entries', 10000),
+            replica_lag_seconds=cache_cfg.get('replica_lag_seconds', 30),
+            section_ttl_seconds=section_ttl_seconds,
+        )
+        listen_cfg = self.db_conns[cache_cfg.get('listen_connection', 'pscore_postgres')]
+        self.change_listener = UserChangeListener(
+            lambda: PostgresConnector(listen_cfg, environment=self.env),
+            cache=self.user_cache,
+            channel=cache_cfg.get('channel', 'user_data_changed'),
+        )
+        self.change_listener.start()
+        logger.info("✅ Result cache enabled with change-notification invalidation")
+    
+    def _initialize_identifier_index(self):
+        """Build the phone/email -> user id index in the background when enabled"""
+        pg_cfg = self.db_cfg
+        index_cfg = pg_cfg.get('identifier_index', {})
+        if not index_cfg.get('enable', False):
+            return
+        self.identifier_index = IdentifierIndex(
+            updated_at_column=index_cfg.get('updated_at_column', 'updated_at'),
+            max_staleness_seconds=index_cfg.get('max_staleness_seconds', 120),
+            false_positive_rate=index_cfg.get('false_positive_rate', 0.01),
+        )
+        self.identifier_index_refresher = IdentifierIndexRefresher(
+            self.identifier_index,
+            lambda: PostgresConnector(pg_cfg, environment=self.env),
+            interval_seconds=index_cfg.get('refresh_interval_seconds', 30),
+            rebuild_interval_seconds=index_cfg.get('rebuild_interval_seconds', 21600),
+        )
+        self.identifier_index_refresher.start()
+        logger.info("✅ Identifier index enabled (building in background)")
+    
+    def _cached(self, conn, user_id, section, loader, fields=None):
+        """Serve a repository section from the result cache when it is enabled"""
+        if self.user_cache is None:
+            return loader()
+        if fields is None:
+            return self.user_cache.get_or_load(user_id, section, loader, lambda: replay_lsn(conn))
+        # Narrow requests reuse a cached full section but are not cached themselves
+        cached = self.user_cache.get(user_id, section)
+        if cached is not None:
+            return project_fields(cached, fields)
+        return loader()
+    
+    @staticmethod
+    def _requested_fields(data):
+        """Optional 'fields' parameter: a list or a comma-separated string of field names"""
+        fields = data.get('fields')
+        if fields is None:
+            return None
+        if isinstance(fields, str):
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+        if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+            raise ValueError("'fields' must be a list of field names")
+        return fields
+    
+    def run_tool(self, tool_name, conn, data, use_cache=True):
+        """
+        Run a tool on an open connection and return its response body.
+        Raises ValueError for bad input. use_cache=False reads everything
+        through `conn`, e.g. to stay inside a plan's snapshot transaction.
+        """
+        handlers = {
+            'search_users': self._search_users,
+            'get_user_details': self._get_user_details,
+            'get_user_kyc_info': self._get_user_kyc_info,
+            'get_user_aml_status': self._get_user_aml_status,
+            'get_user_address': self._get_user_address,
+        }
+        if tool_name not in handlers:
+            raise ValueError(f"Unknown tool: {tool_name}")
+        if use_cache:
+            cached = lambda user_id, section, loader, fields=None: self._cached(conn, user_id, section, loader, fields)
+        else:
+            cached = lambda user_id, section, loader, fields=None: loader()
+        budget = self.result_limits.for_tool(tool_name) if self.result_limits else UNLIMITED
+        with tracer.span(f"tool {tool_name}", cache=use_cache):
+            return handlers[tool_name](conn, data or {}, cached, budget)
+    
+    @staticmethod
+    def _required_user_id(data):
+        user_id = data.get('user_id')
+        if not user_id:
+            raise ValueError("Missing user_id parameter")
+        return user_id
+    
+    @staticmethod
+    def _offset_param(data, name):
+        """Continuation offset sent back from a truncated response"""
+        offset = data.get(name, 0)
+        if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+            raise ValueError(f"'{name}' must be a non-negative integer")
+        return offset
+    
+    def _search_users(self, conn, data, cached, budget):
+        search_term = data.get('search_term')
+        fields = split_fields(self._requested_fields(data), {"users": USER_SEARCH_FIELDS})["users"]
+        offset = self._offset_param(data, 'offset')
+        
+        if not search_term:
+            raise ValueError("Missing search_term parameter")
+        
+        logger.info(f"🔍 Searching users with term: {search_term}")
+        users, narrowing = repo_get_users_with_narrowing(conn, search_term, self.identifier_index, self.search_guard,
+                                                         limit=budget.fetch_rows, offset=offset)
+        # A guard-capped search is paged (and reported truncated) against the cap
+        row_budget = budget.with_max_rows(narrowing["row_cap"]) if narrowing else budget
+        users, next_offset = page_rows(users, row_budget, offset)
+        users = project_fields(users, fields)
+        logger.info(f"✅ Found {len(users)} users")
+        
+        body = {
+            "success": True,
+            "search_term": search_term,
+            "total_found": len(users),
+            "users": users
+        }
+        if narrowing is not None:
+            # Broad name search: tell the caller the match was narrowed rather than exhaustive
+            body["search_narrowed"] = narrowing
+        if next_offset is not None:
+            mark_more_rows(body, 'users', 'offset', next_offset)
+        return enforce_byte_budget(body, ['users'], budget, fields, {'users': ('offset', offset)})
+    
+    def _get_user_details(self, conn, data, cached, budget):
+        user_id = self._required_user_id(data)
+        fields = split_fields(self._requested_fields(data), {
+            "header": HEADER_FIELDS,
+            "additional_info": ADDITIONAL_INFO_FIELDS,
+        })
+        logger.info(f"👤 Getting user details for ID: {user_id}")
+        
+        header_details = cached(user_id, 'header', lambda: repo_get_user_header_details_for_mode(conn, user_id, self.summary_read_mode, fields['header']), fields['header'])
+        additional_info = cached(user_id, 'additional_info', lambda: repo_get_additional_info(conn, user_id, fields['additional_info']), fields['additional_info'])
+        
+        body = {
+            "success": True,
+            "user_id": user_id,
+            "header_details": header_details,
+            "additional_info": additional_info
+        }
+        return enforce_byte_budget(body, ['header_details', 'additional_info'], budget, self._requested_fields(data))
+    
+    def _get_user_kyc_info(self, conn, data, cached, budget):
+        user_id = self._required_user_id(data)
+        fields = split_fields(self._requested_fields(data), {
+            "pans": PAN_FIELDS,
+            "aadhaar_kyc": AADHAAR_KYC_FIELDS,
+            "ckyc": CKYC_FIELDS,
+            "kyc_status": KYC_STATUS_FIELDS,
+        })
+        pans_offset = self._offset_param(data, 'pans_offset')
+        logger.info(f"📋 Getting KYC info for user ID: {user_id}")
+        
+        load_pans = lambda: repo_get_user_pans(conn, user_id, fields['pans'], budget.fetch_rows, pans_offset)
+        # Only the first page is cached
+        pan_info = cached(user_id, 'pans', load_pans, fields['pans']) if pans_offset == 0 else load_pans()
+        pan_info, next_pans_offset = page_rows(pan_info, budget, pans_offset)
+        # Sections with no requested field are skipped entirely
+        aadhaar_kyc = {} if fields['aadhaar_kyc'] == [] else project_fields(
+            cached(user_id, 'aadhaar_kyc', lambda: repo_get_user_aadhaar_kyc(conn, user_id)), fields['aadhaar_kyc'])
+        ckyc_info = {} if fields['ckyc'] == [] else project_fields(
+            cached(user_id, 'ckyc', lambda: repo_get_user_ckyc(conn, user_id)), fields['ckyc'])
+        # Live mode only loads the status when a status field is named; unloaded, the key is left out
+        kyc_status = None if not kyc_status_wanted(self.summary_read_mode, fields['kyc_status']) else cached(
+            user_id, 'kyc_status',
+            lambda: repo_get_user_kyc_status_for_mode(conn, user_id, self.summary_read_mode, fields['kyc_status']),
+            fields['kyc_status'])
+        
+        # Only sections that were loaded: a skipped one says nothing about the data
+        summary = {}
+        if fields['pans'] != []:
+            summary["pan_records"] = len(pan_info)
+        if fields['aadhaar_kyc'] != []:
+            summary["has_aadhaar_kyc"] = bool(aadhaar_kyc)
+        if fields['ckyc'] != []:
+            summary["has_ckyc"] = bool(ckyc_info)
+        
+        body = {"success": True, "user_id": user_id}
+        if kyc_status is not None:
+            body["kyc_status"] = kyc_status
+        body.update({
+            "pan_info": pan_info,
+            "aadhaar_kyc": aadhaar_kyc,
+            "ckyc_info": ckyc_info,
+            "summary": summary
+        })
+        if next_pans_offset is not None:
+            mark_more_rows(body, 'pan_info', 'pans_offset', next_pans_offset)
+        return enforce_byte_budget(body, ['pan_info', 'aadhaar_kyc', 'ckyc_info'], budget, self._requested_fields(data),
+                                   {'pan_info': ('pans_offset', pans_offset)})
+    
+    def _get_user_aml_status(self, conn, data, cached, budget):
+        user_id = self._required_user_id(data)
+        fields = split_fields(self._requested_fields(data), {"aml": AML_FIELDS})["aml"]
+        alerts_offset = self._offset_param(data, 'alerts_offset')
+        logger.info(f"🚨 Getting AML status for user ID: {user_id}")
+        
+        load_aml = lambda: repo_get_aml_details_for_mode(conn, user_id, self.summary_read_mode, fields,
+                                                         budget.fetch_rows, alerts_offset)
+        if alerts_offset:
+            aml_details = load_aml()
+        else:
+            # alerts_total comes with a paged Alerts array; keep it when projecting a cached section
+            cache_fields = fields + ['alerts_total'] if fields and 'alerts' in fields else fields
+            aml_details = cached(user_id, 'aml', load_aml, cache_fields)
+        
+        next_alerts_offset = None
+        if isinstance(aml_details.get('alerts'), list):
+            alerts, next_alerts_offset = page_rows(aml_details['alerts'], budget, alerts_offset)
+            aml_details = dict(aml_details, alerts=alerts)
+        
+        body = {
+            "success": True,
+            "user_id": user_id,
+            "aml_details": aml_details,
+            "has_aml_data": bool(aml_details)
+        }
+        if next_alerts_offset is not None:
+            mark_more_rows(body, 'aml_details.alerts', 'alerts_offset', next_alerts_offset)
+        return enforce_byte_budget(body, ['aml_details.alerts', 'aml_details'], budget, fields,
+                                   {'aml_details.alerts': ('alerts_offset', alerts_offset)})
+    
+    def _get_user_address(self, conn, data, cached, budget):
+        user_id = self._required_user_id(data)
+        fields = split_fields(self._requested_fields(data), {"address": ADDRESS_FIELDS})["address"]
+        logger.info(f"🏠 Getting address for user ID: {user_id}")
+        
+        address_info = cached(user_id, 'address', lambda: repo_get_user_address(conn, user_id))
+        if fields is not None:
+            address_info = {kind: project_fields(addr, fields) for kind, addr in address_info.items()}
+        
+        body = {
+            "success": True,
+            "user_id": user_id,
+            "addresses": address_info,
+            "address_count": len([addr for addr in address_info.values() if addr])
+        }
+        return enforce_byte_budget(body, ['addresses'], budget, fields)
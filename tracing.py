@@ -0,0 +1,419 @@
+# File: tracing.py - In-process request tracing with W3C trace context
+"""
+Spans for an orchestrator query from the LLM wait, through each step's
+HTTP call, the tool route and the tool handler, down to every SQL
+statement, all under one trace id:
+
+    orchestrator.process_complex_query
+      orchestrator.llm
+      orchestrator.tools
+        orchestrator.step get_user_kyc_info
+          HTTP POST /api/tools/get_user_kyc_info      (client, traceparent header)
+            POST /api/tools/get_user_kyc_info         (server route)
+              tool get_user_kyc_info
+                db.query                              (one per statement)
+
+The trace id travels in the W3C `traceparent` header between processes
+and in a context variable within one (threads started with
+contextvars.copy_context(), asyncio tasks and SQLAlchemy's run_sync
+greenlets inherit it). Responses carry `traceparent` so callers can look
+a trace up.
+
+Finished spans are kept per trace in a bounded in-memory buffer and
+handed to a background exporter: JSON lines in a local file, or OTLP/HTTP
+JSON to a collector (Jaeger, Tempo, the OpenTelemetry Collector).
+Disabled by default; then span() is a no-op.
+
+The orchestrator's tool calls reach whichever worker process takes them,
+so one trace's spans end up in several processes. Every worker appends
+to the same JSON lines file, one write() per line on an O_APPEND
+descriptor so lines never interleave, and with the file exporter GET
+/api/traces/<trace_id> answers from that file (its last
+lookup_scan_bytes) plus this process's buffer: the whole trace, up to
+the last second of other workers' export batches. With the otlp or no
+exporter the lookup and GET /api/traces only see this process's spans
+(the response says "scope": "process"); look traces up in the collector.
+
+Configured per connection in config/databases.yaml:
+
+    tracing:
+      enable: true
+      sample_ratio: 1.0          # head sampling for new traces; an incoming traceparent's flag wins
+      exporter: file             # file | otlp | none
+      file: logs/traces.jsonl
+      otlp_endpoint: http://127.0.0.1:4318/v1/traces
+      buffer_traces: 200
+      lookup_scan_bytes: 33554432   # tail of the file exporter's file searched by trace lookups
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from db.engine_events import EngineListeners
+
+logger = logging.getLogger("payu-fin-tracing")
+
+SERVICE_NAME = 'payu-fin-tools'
+
+INTERNAL, SERVER, CLIENT = 'internal', 'server', 'client'
+_OTLP_KINDS = {INTERNAL: 1, SERVER: 2, CLIENT: 3}
+
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# Scrapes, probes and trace lookups would only push real traces out of the buffer
+UNTRACED_PATHS = ('/metrics', '/livez', '/readyz', '/api/traces')
+
+
+def traced_path(path: str) -> bool:
+    return not path.startswith(UNTRACED_PATHS)
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'sampled', 'start_ns', 'end_ns',
+                 'attributes', 'error')
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: str, sampled: bool,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.error = message
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _RemoteParent:
+    """Parent taken from an incoming traceparent header"""
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[_RemoteParent]:
+    match = _TRACEPARENT_RE.match((header or '').strip().lower())
+    if not match or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    return _RemoteParent(match.group(1), match.group(2), bool(int(match.group(3), 16) & 1))
+
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('payu_current_span', default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(spans: List[Span], service_name: str = SERVICE_NAME) -> Dict[str, Any]:
+    """OTLP/HTTP JSON body for a batch of spans"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{
+            "scope": {"name": "payu-fin"},
+            "spans": [{
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": _OTLP_KINDS[span.kind],
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            } for span in spans],
+        }],
+    }]}
+
+
+class SpanExporter:
+    """Background thread that writes finished spans in batches; drops spans when it falls behind"""
+
+    def __init__(self, kind: str, file_path: Optional[str] = None, otlp_endpoint: Optional[str] = None,
+                 max_queue: int = 10000, flush_seconds: float = 1.0, batch_size: int = 512):
+        self.kind = kind
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        if kind == 'file' and file_path:
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        self._thread.start()
+
+    def submit(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def _drain(self) -> List[Span]:
+        spans = []
+        try:
+            spans.append(self._queue.get(timeout=self.flush_seconds))
+            while len(spans) < self.batch_size:
+                spans.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return spans
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            spans = self._drain()
+            if not spans:
+                continue
+            try:
+                self._export(spans)
+            except Exception as e:
+                logger.warning(f"Span export failed ({len(spans)} spans dropped): {e}")
+
+    def _export(self, spans: List[Span]):
+        if self.kind == 'file':
+            fd = os.open(self.file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                for span in spans:
+                    # One write() per line on O_APPEND: the workers share this file
+                    os.write(fd, (json.dumps(span.to_dict(), default=str) + '\n').encode('utf-8'))
+            finally:
+                os.close(fd)
+        elif self.kind == 'otlp':
+            import requests
+            requests.post(self.otlp_endpoint, json=otlp_payload(spans), timeout=5).raise_for_status()
+
+
+class Tracer:
+    """Process-wide tracer; configure() from the connection's `tracing` section"""
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_ratio = 1.0
+        self.buffer_traces = 200
+        self.lookup_scan_bytes = 32 * 1024 * 1024
+        self.exporter: Optional[SpanExporter] = None
+        self._traces: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sql_listeners = EngineListeners()
+
+    def configure(self, cfg: Optional[Dict[str, Any]]):
+        cfg = cfg or {}
+        if self.exporter:
+            self.exporter.stop()
+            self.exporter = None
+        self.enabled = cfg.get('enable', False)
+        self.sample_ratio = float(cfg.get('sample_ratio', 1.0))
+        self.buffer_traces = int(cfg.get('buffer_traces', 200))
+        self.lookup_scan_bytes = int(cfg.get('lookup_scan_bytes', 32 * 1024 * 1024))
+        kind = cfg.get('exporter', 'none')
+        if self.enabled and kind in ('file', 'otlp'):
+            self.exporter = SpanExporter(kind, file_path=cfg.get('file', 'logs/traces.jsonl'),
+                                         otlp_endpoint=cfg.get('otlp_endpoint', 'http://127.0.0.1:4318/v1/traces'))
+
+    def start_span(self, name: str, kind: str = INTERNAL, attributes: Optional[Dict[str, Any]] = None,
+                   traceparent: Optional[str] = None) -> Optional[Span]:
+        """New span under the incoming traceparent, else the current span, else a new trace"""
+        if not self.enabled:
+            return None
+        parent = parse_traceparent(traceparent) if traceparent else None
+        parent = parent or current_span()
+        if parent is not None:
+            return Span(parent.trace_id, parent.span_id, name, kind, parent.sampled, attributes)
+        sampled = random.random() < self.sample_ratio
+        return Span('%032x' % random.getrandbits(128), None, name, kind, sampled, attributes)
+
+    def activate(self, span: Optional[Span]):
+        """Make span current; returns the token for finish()"""
+        return _current_span.set(span) if span is not None else None
+
+    def finish(self, span: Optional[Span], token=None):
+        if token is not None:
+            _current_span.reset(token)
+        if span is None:
+            return
+        span.end_ns = time.time_ns()
+        if not span.sampled:
+            return
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.buffer_traces:
+                    self._traces.popitem(last=False)
+            spans.append(span.to_dict())
+        if self.exporter:
+            self.exporter.submit(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str = INTERNAL, traceparent: Optional[str] = None, **attributes):
+        span = self.start_span(name, kind, attributes, traceparent)
+        token = self.activate(span)
+        try:
+            yield span
+        except Exception as e:
+            if span is not None:
+                span.set_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            self.finish(span, token)
+
+    def inject(self, headers: Dict[str, str]) -> Dict[str, str]:
+        """Add the current span's traceparent to outgoing request headers"""
+        span = current_span()
+        if span is not None:
+            headers['traceparent'] = span.traceparent
+        return headers
+
+    @property
+    def lookup_scope(self) -> str:
+        """'host' when trace lookups read the file every worker exports to, else 'process'"""
+        return 'host' if self.exporter and self.exporter.kind == 'file' else 'process'
+
+    def trace(self, trace_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Spans of a recent trace, in start order (see lookup_scope for whose spans)"""
+        with self._lock:
+            spans = {span['span_id']: span for span in self._traces.get(trace_id, ())}
+        if self.lookup_scope == 'host':
+            for span in self._exported_spans(trace_id):
+                spans.setdefault(span['span_id'], span)
+        return sorted(spans.values(), key=lambda span: span['start_ns']) if spans else None
+
+    def _exported_spans(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Spans of trace_id in the last lookup_scan_bytes of the exported file"""
+        if not re.fullmatch(r'[0-9a-f]{32}', trace_id):
+            return []
+        needle = trace_id.encode('ascii')
+        spans = []
+        try:
+            with open(self.exporter.file_path, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - self.lookup_scan_bytes))
+                if f.tell():
+                    f.readline()   # partial line
+                for line in f:
+                    if needle in line:
+                        try:
+                            span = json.loads(line)
+                        except ValueError:
+                            continue
+                        if span.get('trace_id') == trace_id:
+                            spans.append(span)
+        except FileNotFoundError:
+            pass
+        return spans
+
+    def recent(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            traces = list(self._traces.items())
+        summaries = []
+        for trace_id, spans in reversed(traces):
+            root = min(spans, key=lambda span: span['start_ns'])
+            summaries.append({"trace_id": trace_id, "root": root['name'], "spans": len(spans),
+                              "duration_ms": root['duration_ms']})
+        return summaries
+
+    def attach_sql_tracing(self, engine):
+        """A db.query span per statement run while a span is current (engine = the sync engine)"""
+        from db.query_stats import fingerprint_statement, normalize_statement
+
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            span = self.start_span('db.query', CLIENT) if current_span() is not None else None
+            if span is not None:
+                span.set_attribute('db.system', 'postgresql')
+                span.set_attribute('db.statement', normalize_statement(statement)[:1000])
+                span.set_attribute('db.fingerprint', fingerprint_statement(statement))
+            conn.info.setdefault('trace_spans', []).append(span)
+
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            span = conn.info['trace_spans'].pop()
+            if span is not None:
+                span.set_attribute('db.rows', getattr(cursor, 'rowcount', -1))
+                self.finish(span)
+
+        def _error(exception_context):
+            conn = exception_context.connection
+            if conn is not None and conn.info.get('trace_spans'):
+                span = conn.info['trace_spans'].pop()
+                if span is not None:
+                    span.set_error(str(exception_context.original_exception))
+                    self.finish(span)
+
+        self._sql_listeners.attach(engine, {
+            'before_cursor_execute': _before,
+            'after_cursor_execute': _after,
+            'handle_error': _error,
+        })
+
+    def shutdown(self):
+        if self.exporter:
+            self.exporter.stop()
+            self.exporter = None
+
+
+def traced(name: str, kind: str = INTERNAL):
+    """Decorator: run the function inside a span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Shared by the servers, the orchestrator and the connectors in this process
+tracer = Tracer()
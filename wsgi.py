@@ -0,0 +1,12 @@
+# File: wsgi.py - WSGI entry point for production serving
+"""
+    gunicorn -c config/gunicorn.conf.py wsgi:app
+
+Each gunicorn worker imports this module after the fork (preload_app is
+off), so every worker builds its own server object, connector pool, SSH
+tunnel and background threads.
+"""
+
+from http_server import create_app
+
+app = create_app()